@@ -0,0 +1,276 @@
+"""
+Threshold alerting rules evaluated incrementally on every published sample.
+
+Rules are declared in a JSON file (see alert_rules.json) and compiled once
+into small predicate closures, so evaluating a sample costs a constant
+amount of work per rule. Each rule keeps its own state (ok / pending /
+firing); notifications are only sent on state transitions and are handed
+to a background dispatcher, so a slow webhook never delays sampling.
+
+Rule keys:
+  name          - unique rule name
+  field         - sample field to watch (e.g. "vpd", "ph", "thermal_max_temp")
+  above / below - threshold(s) that trigger the rule
+  rate_above    - trigger when |change per minute| exceeds this value
+  rate_window   - seconds between the readings the rate is measured over
+                  (default 300, so 5 s sensor noise doesn't look like a trend)
+  hysteresis    - margin the value must recover by before the rule clears
+  min_duration  - seconds the condition must hold before the rule fires
+  severity      - free-form label passed to the sinks (default "warning")
+  message       - optional text passed to the sinks
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import urllib.request
+
+STATE_OK = 'ok'
+STATE_PENDING = 'pending'
+STATE_FIRING = 'firing'
+
+
+def compile_rule(spec):
+    """Build (trigger, clear) predicates taking (value, rate_per_minute)"""
+    hysteresis = float(spec.get('hysteresis', 0.0))
+    triggers = []
+    clears = []
+
+    if 'above' in spec:
+        above = float(spec['above'])
+        triggers.append(lambda value, rate: value > above)
+        clears.append(lambda value, rate: value <= above - hysteresis)
+    if 'below' in spec:
+        below = float(spec['below'])
+        triggers.append(lambda value, rate: value < below)
+        clears.append(lambda value, rate: value >= below + hysteresis)
+    if 'rate_above' in spec:
+        rate_above = float(spec['rate_above'])
+        triggers.append(lambda value, rate: rate is not None and abs(rate) > rate_above)
+        clears.append(lambda value, rate: rate is None or abs(rate) <= rate_above - hysteresis)
+
+    if not triggers:
+        raise ValueError(f"Rule {spec.get('name')!r} needs 'above', 'below' or 'rate_above'")
+
+    if len(triggers) == 1:
+        return triggers[0], clears[0]
+
+    def trigger(value, rate):
+        return any(check(value, rate) for check in triggers)
+
+    def clear(value, rate):
+        return all(check(value, rate) for check in clears)
+
+    return trigger, clear
+
+
+class Rule:
+    """A compiled rule plus its evaluation state"""
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.field = spec['field']
+        self.severity = spec.get('severity', 'warning')
+        self.message = spec.get('message', '')
+        self.min_duration = float(spec.get('min_duration', 0))
+        self.rate_window = float(spec.get('rate_window', 300))
+        self.spec = spec
+        self.trigger, self.clear = compile_rule(spec)
+
+        self.state = STATE_OK
+        self.pending_since = None
+        self.fired_at = None
+        self.last_value = None
+        self.rate = None
+        self._rate_ref = None  # (value, timestamp) the current rate is measured from
+
+    def evaluate(self, value, timestamp):
+        """Advance the state machine; return 'firing'/'resolved' on transitions"""
+        if self._rate_ref is None:
+            self._rate_ref = (value, timestamp)
+        elif timestamp - self._rate_ref[1] >= self.rate_window:
+            ref_value, ref_time = self._rate_ref
+            self.rate = (value - ref_value) * 60.0 / (timestamp - ref_time)
+            self._rate_ref = (value, timestamp)
+        rate = self.rate
+        self.last_value = value
+
+        if self.state == STATE_FIRING:
+            if self.clear(value, rate):
+                self.state = STATE_OK
+                self.pending_since = None
+                return 'resolved'
+            return None
+
+        if self.trigger(value, rate):
+            if self.state == STATE_OK:
+                self.state = STATE_PENDING
+                self.pending_since = timestamp
+            if timestamp - self.pending_since >= self.min_duration:
+                self.state = STATE_FIRING
+                self.fired_at = timestamp
+                return 'firing'
+        elif self.state == STATE_PENDING:
+            # Condition dropped out before min_duration elapsed
+            self.state = STATE_OK
+            self.pending_since = None
+        return None
+
+    def status(self):
+        return {
+            'name': self.name,
+            'field': self.field,
+            'severity': self.severity,
+            'state': self.state,
+            'pending_since': self.pending_since,
+            'fired_at': self.fired_at,
+            'last_value': self.last_value,
+        }
+
+
+class FileSink:
+    """Append notifications as JSON lines to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, notification):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(notification) + '\n')
+
+
+class SocketSink:
+    """Send notifications as JSON datagrams to a UDP or Unix socket"""
+
+    def __init__(self, address):
+        if isinstance(address, str):
+            self.family = socket.AF_UNIX
+            self.address = address
+        else:
+            self.family = socket.AF_INET
+            self.address = tuple(address)
+
+    def send(self, notification):
+        with socket.socket(self.family, socket.SOCK_DGRAM) as sock:
+            sock.sendto(json.dumps(notification).encode(), self.address)
+
+
+class WebhookSink:
+    """POST notifications as JSON to an HTTP endpoint"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notification):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(notification).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+SINK_TYPES = {
+    'file': lambda spec: FileSink(spec['path']),
+    'socket': lambda spec: SocketSink(spec['address']),
+    'webhook': lambda spec: WebhookSink(spec['url'], spec.get('timeout', 5)),
+}
+
+
+class NotificationDispatcher:
+    """Deliver notifications to sinks from a background thread.
+
+    The queue is bounded; when a sink is so slow that it fills up, new
+    notifications are dropped (and counted) rather than blocking the caller.
+    """
+
+    def __init__(self, sinks, max_pending=100):
+        self.sinks = list(sinks)
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.sinks:
+            self._thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, notification):
+        if not self.sinks:
+            return
+        try:
+            self._queue.put_nowait(notification)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            notification = self._queue.get()
+            for sink in self.sinks:
+                try:
+                    sink.send(notification)
+                except Exception as e:
+                    logging.warning("Alert sink %s failed: %s", type(sink).__name__, e)
+
+
+class RuleEngine:
+    """Evaluate compiled rules against each published sample"""
+
+    def __init__(self, rules=(), dispatcher=None):
+        self.rules = list(rules)
+        self.dispatcher = dispatcher or NotificationDispatcher([])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        """Load rules and sinks from a JSON rules file"""
+        with open(path, 'r') as f:
+            config = json.load(f)
+        rules = [Rule(spec) for spec in config.get('rules', [])]
+        sinks = []
+        for spec in config.get('sinks', []):
+            factory = SINK_TYPES.get(spec.get('type'))
+            if factory is None:
+                raise ValueError(f"Unknown alert sink type: {spec.get('type')!r}")
+            sink = factory(spec)
+            if isinstance(sink, FileSink) and not os.path.isabs(sink.path):
+                sink.path = os.path.join(os.path.dirname(os.path.abspath(path)), sink.path)
+            sinks.append(sink)
+        return cls(rules, NotificationDispatcher(sinks))
+
+    def start(self):
+        self.dispatcher.start()
+
+    def evaluate(self, sample, timestamp=None):
+        """Run every rule against one sample and queue any notifications"""
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+            for rule in self.rules:
+                value = sample.get(rule.field)
+                if not isinstance(value, (int, float)):
+                    continue
+                transition = rule.evaluate(value, timestamp)
+                if transition:
+                    self.dispatcher.submit({
+                        'rule': rule.name,
+                        'field': rule.field,
+                        'state': transition,
+                        'severity': rule.severity,
+                        'value': value,
+                        'timestamp': timestamp,
+                        'message': rule.message,
+                    })
+
+    def status(self):
+        """Current state of every rule"""
+        with self._lock:
+            return {
+                'rules': [rule.status() for rule in self.rules],
+                'dropped_notifications': self.dispatcher.dropped,
+            }
@@ -0,0 +1,265 @@
+"""
+Per-channel calibration and unit conversion.
+
+A channel's pipeline is the fixed conversion for the device it was read
+from (IIO milli-units, HDC2010 / OPT3001 register counts) followed by the
+calibration stages configured for that channel in calibration.json. Both
+are composed once into a single callable per (source, channel).
+
+Every stage is plain arithmetic that works the same on a float and on a
+NumPy array, so the compiled callable can also be applied to a whole
+column of history at once with apply_batch(). The server logs each
+channel's uncalibrated value (after the device conversion) as
+<channel>_raw next to the calibrated one, and recalibrate() recomputes
+the calibrated columns of logged history from those with the current
+stages (history_export.py --recalibrate calibration.json).
+
+Stage types (keys other than "type" are the stage parameters):
+  offset           {"value": 0.3}                 x + value
+  scale            {"factor": 1.02}               x * factor
+  linear           {"scale": 1.0, "offset": 0.0}  x * scale + offset
+  polynomial       {"coefficients": [c0, c1, c2]} c0 + c1*x + c2*x^2 ...
+  two_point        {"points": [[raw1, ref1], [raw2, ref2]]}
+  three_point      {"points": [[raw_lo, ref_lo], [raw_mid, ref_mid], [raw_hi, ref_hi]]}
+                   Piecewise linear with separate slopes either side of the
+                   mid point, as used for pH 4 / 7 / 10 buffer calibration
+  ph_temperature_compensation {"reference": 25.0, "neutral": 7.0}
+                   Corrects the electrode's Nernst slope for the measured
+                   temperature (needs temperature=... at call time)
+  temperature_coefficient {"alpha": 0.019, "reference": 25.0}
+                   x / (1 + alpha * (T - reference)), e.g. for EC probes
+"""
+
+import json
+import logging
+
+KELVIN = 273.15
+RAW_SUFFIX = '_raw'
+
+# Channels read on the board, compensated against the air temperature; plugin
+# channels (EC, ...) use the solution temperature when one is logged
+ONBOARD_CHANNELS = ('ph', 'temperature', 'humidity', 'light')
+
+
+def _is_array(value):
+    return hasattr(value, 'dtype') and hasattr(value, 'shape')
+
+
+def _where(condition, if_true, if_false):
+    """Scalar conditional that also works element-wise on NumPy arrays"""
+    if _is_array(condition):
+        import numpy as np
+        return np.where(condition, if_true, if_false)
+    return if_true if condition else if_false
+
+
+# Fixed device conversions from raw readings to engineering units
+def _milli(value):
+    return value / 1000.0
+
+def _hdc2010_temperature(raw):
+    return (raw / 65536.0) * 165.0 - 40.0
+
+def _hdc2010_humidity(raw):
+    return (raw / 65536.0) * 100.0
+
+def _opt3001_lux(raw):
+    # Result register: 4-bit exponent, 12-bit mantissa
+    exponent = (raw >> 12) & 0x0F
+    mantissa = raw & 0x0FFF
+    return mantissa * (1 << exponent) * 0.01
+
+SOURCE_CONVERSIONS = {
+    ('iio', 'temperature'): _milli,  # millidegrees to degrees
+    ('iio', 'humidity'): _milli,  # millipercent to percent
+    ('hdc2010', 'temperature'): _hdc2010_temperature,
+    ('hdc2010', 'humidity'): _hdc2010_humidity,
+    ('opt3001', 'light'): _opt3001_lux,
+}
+
+
+# Calibration stage builders: each returns f(value, temperature)
+def _offset_stage(spec):
+    offset = float(spec['value'])
+    return lambda x, t: x + offset
+
+def _scale_stage(spec):
+    factor = float(spec['factor'])
+    return lambda x, t: x * factor
+
+def _linear_stage(spec):
+    scale = float(spec.get('scale', 1.0))
+    offset = float(spec.get('offset', 0.0))
+    return lambda x, t: x * scale + offset
+
+def _polynomial_stage(spec):
+    coefficients = [float(c) for c in spec['coefficients']]
+    reversed_coefficients = coefficients[::-1]
+
+    def polynomial(x, t):
+        # Horner's method, highest order first
+        result = reversed_coefficients[0]
+        for c in reversed_coefficients[1:]:
+            result = result * x + c
+        return result
+    return polynomial
+
+def _two_point_stage(spec):
+    (raw1, ref1), (raw2, ref2) = spec['points']
+    if raw1 == raw2:
+        raise ValueError("two_point calibration needs two distinct raw readings")
+    slope = (ref2 - ref1) / (raw2 - raw1)
+    return lambda x, t: ref1 + (x - raw1) * slope
+
+def _three_point_stage(spec):
+    points = sorted((float(raw), float(ref)) for raw, ref in spec['points'])
+    (raw_lo, ref_lo), (raw_mid, ref_mid), (raw_hi, ref_hi) = points
+    if raw_lo == raw_mid or raw_mid == raw_hi:
+        raise ValueError("three_point calibration needs three distinct raw readings")
+    slope_lo = (ref_mid - ref_lo) / (raw_mid - raw_lo)
+    slope_hi = (ref_hi - ref_mid) / (raw_hi - raw_mid)
+    return lambda x, t: ref_mid + (x - raw_mid) * _where(x < raw_mid, slope_lo, slope_hi)
+
+def _ph_temperature_compensation_stage(spec):
+    reference_k = float(spec.get('reference', 25.0)) + KELVIN
+    neutral = float(spec.get('neutral', 7.0))
+
+    def compensate(x, t):
+        if t is None:
+            return x
+        return neutral + (x - neutral) * reference_k / (t + KELVIN)
+    return compensate
+
+def _temperature_coefficient_stage(spec):
+    alpha = float(spec['alpha'])
+    reference = float(spec.get('reference', 25.0))
+
+    def compensate(x, t):
+        if t is None:
+            return x
+        return x / (1.0 + alpha * (t - reference))
+    return compensate
+
+STAGE_BUILDERS = {
+    'offset': _offset_stage,
+    'scale': _scale_stage,
+    'linear': _linear_stage,
+    'polynomial': _polynomial_stage,
+    'two_point': _two_point_stage,
+    'three_point': _three_point_stage,
+    'ph_temperature_compensation': _ph_temperature_compensation_stage,
+    'temperature_coefficient': _temperature_coefficient_stage,
+}
+
+
+def compile_stages(stage_specs, conversion=None):
+    """Compose a conversion and calibration stages into f(raw, temperature=None)"""
+    stages = []
+    for spec in stage_specs:
+        builder = STAGE_BUILDERS.get(spec.get('type'))
+        if builder is None:
+            raise ValueError(f"Unknown calibration stage: {spec.get('type')!r}")
+        stages.append(builder(spec))
+
+    if conversion is None and not stages:
+        return lambda raw, temperature=None: raw
+    if not stages:
+        return lambda raw, temperature=None: conversion(raw)
+    if conversion is None and len(stages) == 1:
+        stage = stages[0]
+        return lambda raw, temperature=None: stage(raw, temperature)
+
+    def pipeline(raw, temperature=None):
+        value = conversion(raw) if conversion is not None else raw
+        for stage in stages:
+            value = stage(value, temperature)
+        return value
+    return pipeline
+
+
+class Calibrator:
+    """Compiled calibration pipelines for every channel"""
+
+    def __init__(self, channels=None):
+        self.channels = channels or {}
+        self._compiled = {}
+        # Validate the whole configuration up front rather than on first read
+        for channel in self.channels:
+            self.pipeline(channel)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load channel stages from a JSON file: {"channels": {name: [stages]}}"""
+        with open(path, 'r') as f:
+            config = json.load(f)
+        return cls(config.get('channels', {}))
+
+    def pipeline(self, channel, source=None):
+        """Compiled callable for a channel, optionally preceded by a device conversion"""
+        key = (source, channel)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            conversion = SOURCE_CONVERSIONS.get(key) if source else None
+            compiled = compile_stages(self.channels.get(channel, []), conversion)
+            self._compiled[key] = compiled
+        return compiled
+
+    def convert(self, channel, raw, source=None, temperature=None):
+        """Convert and calibrate one raw reading"""
+        return self.pipeline(channel, source)(raw, temperature)
+
+    def convert_logged(self, channel, raw, source=None, temperature=None):
+        """(uncalibrated, calibrated) for one raw reading; the first is what gets logged as <channel>_raw"""
+        conversion = SOURCE_CONVERSIONS.get((source, channel)) if source else None
+        uncalibrated = conversion(raw) if conversion is not None else raw
+        return uncalibrated, self.pipeline(channel)(uncalibrated, temperature)
+
+    def recalibrate(self, arrays):
+        """Recompute calibrated columns of a history chunk from its <channel>_raw columns.
+
+        `arrays` maps column names to float64 arrays (see history_export);
+        rows without a raw value keep their logged value. Returns the names
+        of the recalibrated channels.
+        """
+        import numpy as np
+        done = []
+        for name in [name for name in arrays if name.endswith(RAW_SUFFIX)]:
+            channel = name[:-len(RAW_SUFFIX)]
+            raw = arrays[name]
+            present = ~np.isnan(raw)
+            if channel not in arrays or not present.any():
+                continue
+            temperature = arrays.get('temperature')
+            solution = arrays.get('nutrient_temperature')
+            if channel not in ONBOARD_CHANNELS and solution is not None:
+                temperature = solution if temperature is None else \
+                    np.where(np.isnan(solution), temperature, solution)
+            if temperature is not None:
+                temperature = temperature[present]
+            values = arrays[channel].copy()
+            values[present] = self.apply_batch(channel, raw[present], temperature=temperature)
+            arrays[channel] = values
+            done.append(channel)
+        return done
+
+    def apply_batch(self, channel, values, source=None, temperature=None):
+        """Apply a channel's pipeline to a whole column of readings.
+
+        Uses NumPy when available (returns an ndarray); otherwise falls back
+        to a list comprehension. `temperature` may be a scalar or a column
+        of the same length as `values`.
+        """
+        compiled = self.pipeline(channel, source)
+        try:
+            import numpy as np
+        except ImportError:
+            logging.debug("NumPy not available, calibrating %s row by row", channel)
+            if isinstance(temperature, (list, tuple)):
+                return [compiled(v, t) for v, t in zip(values, temperature)]
+            return [compiled(v, temperature) for v in values]
+
+        dtype = np.int64 if source == 'opt3001' else np.float64
+        array = np.asarray(values, dtype=dtype)
+        if temperature is not None and not isinstance(temperature, (int, float)):
+            temperature = np.asarray(temperature, dtype=np.float64)
+        return np.asarray(compiled(array, temperature), dtype=np.float64)
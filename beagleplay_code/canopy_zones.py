@@ -0,0 +1,141 @@
+"""
+Canopy region-of-interest segmentation for thermal frames.
+
+The camera's 32 x 24 view includes pots, floor and walls as well as
+leaves. Each frame is split into canopy and background pixels by a
+temperature threshold (Otsu's method per frame, or a fixed band), and
+that mask is intersected with configured zone masks, so canopy
+temperature, and from it canopy VPD, is reported per zone from leaf
+pixels only. All masks are precomputed and each frame is processed with
+a handful of vectorized NumPy operations.
+
+Zone config (canopy_zones.json):
+  {"segmentation": {"method": "otsu" | "band" | "none",
+                    "canopy": "cooler" | "warmer",   # which Otsu class is leaves
+                    "min_temp": 10, "max_temp": 40,  # plausible leaf band
+                    "min_pixels": 5},
+   "zones": [{"name": "bench_a", "rows": [0, 24], "cols": [0, 16]},
+             {"name": "bench_b", "mask": [[0, 1, ...], ...]}]}
+Rows/cols are half-open pixel ranges; "mask" is a full 24 x 32 0/1 grid.
+
+Requires NumPy.
+"""
+
+import json
+
+FRAME_ROWS = 24
+FRAME_COLS = 32
+
+
+def otsu_threshold(values, bins=64):
+    """Threshold maximising between-class variance of a 1-D array"""
+    import numpy as np
+    low, high = float(values.min()), float(values.max())
+    if high - low < 1e-6:
+        return high
+    counts, edges = np.histogram(values, bins=bins, range=(low, high))
+    centers = (edges[:-1] + edges[1:]) / 2
+    weight_low = np.cumsum(counts)
+    weight_high = weight_low[-1] - weight_low
+    sum_low = np.cumsum(counts * centers)
+    mean_low = sum_low / np.maximum(weight_low, 1)
+    mean_high = (sum_low[-1] - sum_low) / np.maximum(weight_high, 1)
+    between = weight_low * weight_high * (mean_low - mean_high) ** 2
+    return float(edges[int(np.argmax(between)) + 1])
+
+
+class CanopySegmenter:
+    """Per-zone canopy temperatures from thermal frames"""
+
+    def __init__(self, zones=None, method='otsu', canopy='cooler', min_temp=None,
+                 max_temp=None, min_pixels=5):
+        import numpy as np
+        if method not in ('otsu', 'band', 'none'):
+            raise ValueError(f"Unknown segmentation method: {method!r}")
+        if canopy not in ('cooler', 'warmer'):
+            raise ValueError(f"canopy must be 'cooler' or 'warmer', not {canopy!r}")
+        self.method = method
+        self.canopy = canopy
+        self.min_temp = min_temp
+        self.max_temp = max_temp
+        self.min_pixels = min_pixels
+
+        zones = zones or [{'name': 'canopy'}]
+        self.zone_names = []
+        masks = []
+        for zone in zones:
+            self.zone_names.append(zone['name'])
+            if 'mask' in zone:
+                mask = np.asarray(zone['mask'], dtype=bool)
+                if mask.shape != (FRAME_ROWS, FRAME_COLS):
+                    raise ValueError(f"Zone {zone['name']!r} mask must be {FRAME_ROWS}x{FRAME_COLS}")
+            else:
+                mask = np.zeros((FRAME_ROWS, FRAME_COLS), dtype=bool)
+                row_start, row_end = zone.get('rows', (0, FRAME_ROWS))
+                col_start, col_end = zone.get('cols', (0, FRAME_COLS))
+                mask[row_start:row_end, col_start:col_end] = True
+            if not mask.any():
+                raise ValueError(f"Zone {zone['name']!r} covers no pixels")
+            masks.append(mask.ravel())
+        self._zone_masks = np.stack(masks)  # (zones, pixels)
+        self._zone_pixels = self._zone_masks.sum(axis=1)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as f:
+            config = json.load(f)
+        options = config.get('segmentation', {})
+        return cls(config.get('zones'), **options)
+
+    def canopy_mask(self, pixels):
+        """Boolean canopy mask and the threshold used (None for fixed methods)"""
+        import numpy as np
+        mask = np.ones(pixels.shape, dtype=bool)
+        if self.min_temp is not None:
+            mask &= pixels >= self.min_temp
+        if self.max_temp is not None:
+            mask &= pixels <= self.max_temp
+
+        threshold = None
+        if self.method == 'otsu' and mask.any():
+            threshold = otsu_threshold(pixels[mask])
+            if self.canopy == 'cooler':
+                mask &= pixels < threshold
+            else:
+                mask &= pixels >= threshold
+        return mask, threshold
+
+    def analyze(self, frame):
+        """Canopy pixel counts and temperatures for every zone of one frame"""
+        import numpy as np
+        pixels = np.asarray(frame, dtype=np.float64).reshape(-1)
+        canopy, threshold = self.canopy_mask(pixels)
+
+        selected = self._zone_masks & canopy  # (zones, pixels)
+        counts = selected.sum(axis=1)
+        sums = (selected * pixels).sum(axis=1)
+        maxima = np.where(selected, pixels, -np.inf).max(axis=1)
+
+        zones = {}
+        for i, name in enumerate(self.zone_names):
+            count = int(counts[i])
+            if count < self.min_pixels:
+                zones[name] = {'pixels': count, 'canopy_fraction': round(count / int(self._zone_pixels[i]), 3),
+                               'canopy_temp': None, 'canopy_max_temp': None}
+                continue
+            zones[name] = {
+                'pixels': count,
+                'canopy_fraction': round(count / int(self._zone_pixels[i]), 3),
+                'canopy_temp': round(float(sums[i] / count), 2),
+                'canopy_max_temp': round(float(maxima[i]), 2),
+            }
+
+        # Overall canopy temperature over the union of zones (overlaps counted once)
+        in_any_zone = self._zone_masks.any(axis=0) & canopy
+        total = int(in_any_zone.sum())
+        return {
+            'threshold': round(threshold, 2) if threshold is not None else None,
+            'canopy_pixels': total,
+            'canopy_temp': round(float(pixels[in_any_zone].mean()), 2) if total >= self.min_pixels else None,
+            'zones': zones,
+        }
@@ -0,0 +1,228 @@
+"""
+Change-based logging: record a field only when it says something new.
+
+Instead of a full row every few minutes, each field is compressed on its
+own at the full sample rate and the log gets a (sparse) row whenever at
+least one field archives a point; the other columns of that row are left
+empty. Two per-field compressors are available:
+
+  deadband        archive a sample when it differs from the last archived
+                  value by more than the tolerance
+  swinging door   archive the previous sample when no straight line from
+                  the last archived point stays within +/- tolerance of
+                  every sample since (the "doors" have closed); the stored
+                  points then reproduce the signal by linear interpolation
+                  to within about the tolerance
+
+Both also archive a point once a field has been silent for max_silence_ms,
+so a gap longer than that in the log is missing data, not a flat signal.
+reconstruct() fills the empty cells back in on read.
+"""
+
+import math
+
+MODES = ('deadband', 'swinging-door')
+
+
+class Deadband:
+    """Archive a sample when it leaves the band around the last archived value"""
+
+    def __init__(self, tolerance, max_silence_ms):
+        self.tolerance = tolerance
+        self.max_silence_ms = max_silence_ms
+        self._archived = None  # (t, v)
+        self._latest = None  # Latest sample within the band, archived by flush()
+
+    def update(self, t, v):
+        """Feed one sample; returns the list of (t, v) points to archive"""
+        archived = self._archived
+        if (archived is None or abs(v - archived[1]) > self.tolerance
+                or t - archived[0] >= self.max_silence_ms):
+            self._archived = (t, v)
+            self._latest = None
+            return [(t, v)]
+        self._latest = (t, v)
+        return []
+
+    def flush(self):
+        """Archive the latest sample not yet archived (e.g. on shutdown)"""
+        if self._latest is None:
+            return []
+        point, self._latest = self._latest, None
+        self._archived = point
+        return [point]
+
+
+class SwingingDoor:
+    """Swinging door trending (SDT) compression of one series"""
+
+    def __init__(self, tolerance, max_silence_ms):
+        self.tolerance = tolerance
+        self.max_silence_ms = max_silence_ms
+        self._archived = None  # (t, v) of the door pivot
+        self._held = None  # Latest sample, archived if the doors close
+        self._upper = math.inf  # Smallest slope to (t, v + tolerance) seen so far
+        self._lower = -math.inf  # Largest slope to (t, v - tolerance) seen so far
+
+    def update(self, t, v):
+        """Feed one sample; returns the list of (t, v) points to archive"""
+        if self._archived is None:
+            self._restart((t, v))
+            return [(t, v)]
+        if t <= (self._held or self._archived)[0]:
+            return []  # Repeated or stepped-back sample time; the line cannot move back
+        points = []
+        if t - self._archived[0] >= self.max_silence_ms:
+            # Silent too long: archive the held sample and pivot there
+            if self._held is not None:
+                points.append(self._held)
+                self._restart(self._held)
+            if t - self._archived[0] >= self.max_silence_ms:  # Nothing held since the pivot
+                points.append((t, v))
+                self._restart((t, v))
+                return points
+        if not self._swing(t, v) and self._held is not None:
+            # The doors closed: the held sample is the last one the line covered
+            points.append(self._held)
+            self._restart(self._held)
+            self._swing(t, v)
+        self._held = (t, v)
+        return points
+
+    def flush(self):
+        """Archive the held sample so the stored line reaches it (e.g. on shutdown)"""
+        if self._held is None:
+            return []
+        point = self._held
+        self._restart(point)
+        return [point]
+
+    def _swing(self, t, v):
+        """Narrow the doors to cover (t, v); False once they cross"""
+        t0, v0 = self._archived
+        dt = t - t0
+        if dt <= 0:
+            return abs(v - v0) <= self.tolerance
+        upper = min(self._upper, (v + self.tolerance - v0) / dt)
+        lower = max(self._lower, (v - self.tolerance - v0) / dt)
+        if lower > upper:
+            return False
+        self._upper, self._lower = upper, lower
+        return True
+
+    def _restart(self, point):
+        self._archived = point
+        self._held = None
+        self._upper = math.inf
+        self._lower = -math.inf
+
+
+COMPRESSORS = {'deadband': Deadband, 'swinging-door': SwingingDoor}
+
+
+class ChangeLogger:
+    """Turns full-rate samples into the sparse rows to append to the log.
+
+    update() returns finished rows ({'timestamp_ms': t, field: value, ...})
+    in time order. A swinging door archives the *previous* sample, so the
+    row for the latest timestamp is held back until the next sample.
+    """
+
+    def __init__(self, fields, mode='swinging-door', tolerances=None, max_silence_ms=300000):
+        if mode not in COMPRESSORS:
+            raise ValueError(f"Unknown change logging mode {mode!r} (use {', '.join(MODES)})")
+        tolerances = tolerances or {}
+        compressor = COMPRESSORS[mode]
+        self.mode = mode
+        self.fields = list(fields)
+        self._compressors = {field: compressor(tolerances.get(field, 0.0), max_silence_ms)
+                             for field in self.fields}
+        self._pending = None  # Row for the latest sample time
+        self._last_t = None
+        self.samples = 0
+        self.points = 0
+        self.rows = 0
+
+    def update(self, t, sample):
+        """Feed one sample dict; returns the rows that are now complete"""
+        if self._last_t is not None and t <= self._last_t:
+            return []  # Already seen (e.g. fed again by a restarted logger)
+        self._last_t = t
+        rows = {}
+        for field, compressor in self._compressors.items():
+            value = sample.get(field)
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            for point_t, point_v in compressor.update(t, value):
+                rows.setdefault(point_t, {'timestamp_ms': point_t})[field] = point_v
+                self.points += 1
+        self.samples += 1
+
+        done = []
+        pending = self._pending
+        if pending is not None:
+            pending.update(rows.pop(pending['timestamp_ms'], {}))
+            done.append(pending)
+        # Points for any other earlier time cannot occur; keep them in order anyway
+        done.extend(rows.pop(point_t) for point_t in sorted(rows) if point_t < t)
+        self._pending = rows.get(t)
+        self.rows += len(done)
+        return done
+
+    def flush(self):
+        """The held-back row plus every point the compressors still hold (e.g. on shutdown)"""
+        rows = {}
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            rows[pending['timestamp_ms']] = pending
+        for field, compressor in self._compressors.items():
+            for point_t, point_v in compressor.flush():
+                rows.setdefault(point_t, {'timestamp_ms': point_t})[field] = point_v
+                self.points += 1
+        done = [rows[point_t] for point_t in sorted(rows)]
+        self.rows += len(done)
+        return done
+
+    def status(self):
+        """Samples seen against points and rows written"""
+        return {
+            'mode': self.mode,
+            'samples': self.samples,
+            'points': self.points,
+            'rows': self.rows,
+            'points_per_sample': round(self.points / (self.samples * len(self.fields)), 4)
+            if self.samples and self.fields else None,
+        }
+
+
+def reconstruct(timestamps, values, max_gap_ms=None):
+    """Fill the empty (NaN) cells of a change-logged column by linear interpolation.
+
+    Only cells between two archived points at most max_gap_ms apart are
+    filled; longer gaps and the ends of the series stay NaN.
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    known = np.flatnonzero(~missing)
+    if len(known) < 2:
+        return values
+    known_t = timestamps[known]
+    holes = np.flatnonzero(missing)
+    # Archived neighbours on either side of every hole
+    after = np.searchsorted(known, holes)
+    inside = (after > 0) & (after < len(known))
+    holes, after = holes[inside], after[inside]
+    if max_gap_ms is not None:
+        close = known_t[after] - known_t[after - 1] <= max_gap_ms
+        holes, after = holes[close], after[close]
+    filled = values.copy()
+    t0, t1 = known_t[after - 1], known_t[after]
+    v0, v1 = values[known[after - 1]], values[known[after]]
+    span = (t1 - t0).astype(np.float64)
+    weight = np.divide(timestamps[holes] - t0, span, out=np.zeros(len(holes)), where=span > 0)
+    filled[holes] = v0 + (v1 - v0) * weight
+    return filled
@@ -19,6 +19,8 @@ echo ""
 echo "2. Installing Python dependencies..."
 # Install requests library if not present
 pip3 install requests --user
+# NumPy is optional; the thermal frame archive is disabled without it
+sudo apt-get install -y python3-numpy || echo "python3-numpy not installed, thermal archive disabled"
 
 echo ""
 echo "3. Stopping existing web server service..."
@@ -19,12 +19,12 @@ fi
 
 echo "✅ BeaglePlay is accessible"
 
-# Transfer the updated Python web server
-echo "📤 Transferring updated web server..."
-scp "$LOCAL_CODE_DIR/ph_web_server.py" "$BEAGLEPLAY_USER@$BEAGLEPLAY_IP:/home/debian/"
+# Transfer the updated Python web server and its helper modules
+echo "📤 Transferring updated web server and its config files..."
+scp "$LOCAL_CODE_DIR"/*.py "$LOCAL_CODE_DIR"/*.json "$BEAGLEPLAY_USER@$BEAGLEPLAY_IP:/home/debian/"
 
 if [ $? -ne 0 ]; then
-    echo "❌ Error: Failed to transfer ph_web_server.py"
+    echo "❌ Error: Failed to transfer web server modules"
     exit 1
 fi
 
@@ -0,0 +1,327 @@
+"""
+Live memory and CPU diagnostics for a long-running server.
+
+Opt-in (--diagnostics-port) and served by a separate HTTP listener bound
+to 127.0.0.1 only, so it cannot be reached from the network; use an SSH
+tunnel to look at a device remotely:
+
+  ssh -L 8081:127.0.0.1:8081 beagleplay
+  curl localhost:8081/debug/threads
+
+Endpoints (all GET, JSON):
+
+  /debug                          process memory (RSS, peak) and the endpoints
+  /debug/memory?start=1&frames=10 start tracemalloc (it slows allocation, so
+                                  it only runs on request); stop=1 stops it
+  /debug/memory/snapshot?limit=20&key=lineno
+                                  top allocation sites and the growth since
+                                  the previous snapshot, which becomes the new
+                                  baseline
+  /debug/profile?seconds=10&interval=0.01&threads=sensors,logger,http
+                                  sampled stack profile per thread: the most
+                                  frequent stacks and folded stacks for
+                                  flamegraph.pl / speedscope
+  /debug/threads                  per-thread CPU time
+  /debug/gc?collect=1             garbage collector counts, thresholds and
+                                  pause times; collect=1 runs a full collection
+
+The thread that serves the main HTTP server is reported as 'http'.
+"""
+
+import collections
+import gc
+import http.server
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.parse
+
+LOCAL_HOST = '127.0.0.1'
+PROFILE_MAX_SECONDS = 60
+PROFILE_MIN_INTERVAL = 0.001
+MAX_STACK_DEPTH = 64
+
+
+def _thread_label(thread):
+    return 'http' if thread is threading.main_thread() else thread.name
+
+
+def process_memory():
+    """Resident set size and its peak from /proc, in MB"""
+    memory = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM', 'VmSize'):
+                    memory[key] = round(int(value.split()[0]) / 1024, 1)
+    except (OSError, ValueError):
+        pass
+    return {'rss_mb': memory.get('VmRSS'), 'peak_rss_mb': memory.get('VmHWM'), 'virtual_mb': memory.get('VmSize')}
+
+
+class MemoryTracker:
+    """tracemalloc snapshots, each compared with the previous one"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline = None
+        self._baseline_time = None
+
+    def start(self, frames=10):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self._baseline = None
+                logging.info("tracemalloc started (%d frames)", frames)
+
+    def stop(self):
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logging.info("tracemalloc stopped")
+            self._baseline = None
+
+    def status(self):
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            'tracing': tracing,
+            'frames': tracemalloc.get_traceback_limit() if tracing else None,
+            'traced_mb': round(current / 1048576, 2),
+            'traced_peak_mb': round(peak / 1048576, 2),
+            'overhead_mb': round(tracemalloc.get_tracemalloc_memory() / 1048576, 2) if tracing else 0,
+            'baseline_age_s': None if self._baseline_time is None else round(time.time() - self._baseline_time, 1),
+            'process': process_memory(),
+        }
+
+    def snapshot(self, limit=20, key_type='lineno'):
+        """Top allocation sites and the growth since the previous snapshot"""
+        if key_type not in ('lineno', 'filename', 'traceback'):
+            raise ValueError("key must be lineno, filename or traceback")
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is not running, start it with /debug/memory?start=1")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        with self._lock:
+            baseline, self._baseline = self._baseline, snapshot
+            baseline_time, self._baseline_time = self._baseline_time, time.time()
+        result = {
+            'top': [self._stat(stat) for stat in snapshot.statistics(key_type)[:limit]],
+            'growth': None,
+            'since_s': None if baseline_time is None else round(time.time() - baseline_time, 1),
+        }
+        if baseline is not None:
+            diffs = snapshot.compare_to(baseline, key_type)
+            result['growth'] = [self._stat(diff, diff.size_diff, diff.count_diff)
+                                for diff in diffs[:limit] if diff.size_diff]
+        return result
+
+    @staticmethod
+    def _stat(stat, size_diff=None, count_diff=None):
+        entry = {
+            'where': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count,
+        }
+        if size_diff is not None:
+            entry['size_diff_kb'] = round(size_diff / 1024, 1)
+            entry['count_diff'] = count_diff
+        return entry
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def sample_stacks(seconds=10.0, interval=0.01, threads=None, limit=20):
+    """Sample every thread's stack for `seconds`; the most frequent stacks per thread.
+
+    `threads` limits the profile to these thread labels. The seconds given
+    per stack are its share of the samples times the profile duration,
+    time spent running or waiting there.
+    """
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {PROFILE_MAX_SECONDS}")
+    interval = max(interval, PROFILE_MIN_INTERVAL)
+    me = threading.get_ident()
+    counts = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        labels = {thread.ident: _thread_label(thread) for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            label = labels.get(ident, str(ident))
+            if ident == me or (threads and label not in threads):
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            counts[(label, ';'.join(reversed(stack)))] += 1
+        samples += 1
+        time.sleep(interval)
+
+    per_thread = {}
+    for (label, stack), count in counts.most_common():
+        entries = per_thread.setdefault(label, {'samples': 0, 'stacks': []})
+        entries['samples'] += count
+        if len(entries['stacks']) < limit:
+            entries['stacks'].append({'count': count, 'seconds': round(count * seconds / samples, 3),
+                                      'stack': stack.split(';')})
+    return {
+        'seconds': seconds,
+        'interval': interval,
+        'samples': samples,
+        'threads': per_thread,
+        'folded': [f"{label};{stack} {count}" for (label, stack), count in counts.most_common()],
+    }
+
+
+def thread_cpu():
+    """CPU seconds used by each live thread (Linux), and by the process"""
+    result = {}
+    for thread in threading.enumerate():
+        seconds = None
+        try:
+            seconds = time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+        except (AttributeError, OSError, TypeError):
+            seconds = _proc_thread_cpu(thread.native_id)
+        result[_thread_label(thread)] = {
+            'cpu_s': None if seconds is None else round(seconds, 3),
+            'native_id': thread.native_id,
+            'daemon': thread.daemon,
+        }
+    times = os.times()
+    return {'process_cpu_s': round(times.user + times.system, 3), 'threads': result}
+
+
+def _proc_thread_cpu(native_id):
+    try:
+        with open(f'/proc/self/task/{native_id}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, TypeError):
+        return None
+
+
+class GcMonitor:
+    """Collection counts and pause times per generation, via gc.callbacks"""
+
+    def __init__(self):
+        self._started = {}
+        self.pauses = {generation: {'collections': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'collected': 0}
+                       for generation in range(3)}
+
+    def install(self):
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+
+    def _callback(self, phase, info):
+        generation = info['generation']
+        if phase == 'start':
+            self._started[generation] = time.perf_counter()
+            return
+        started = self._started.pop(generation, None)
+        if started is None:
+            return
+        ms = (time.perf_counter() - started) * 1000
+        stats = self.pauses[generation]
+        stats['collections'] += 1
+        stats['total_ms'] += ms
+        stats['max_ms'] = max(stats['max_ms'], ms)
+        stats['collected'] += info['collected']
+
+    def status(self):
+        return {
+            'enabled': gc.isenabled(),
+            'counts': gc.get_count(),
+            'thresholds': gc.get_threshold(),
+            'tracked_objects': len(gc.get_objects()),
+            'uncollectable': len(gc.garbage),
+            'stats': gc.get_stats(),
+            'pauses': {generation: dict(stats, total_ms=round(stats['total_ms'], 2), max_ms=round(stats['max_ms'], 2))
+                       for generation, stats in self.pauses.items()},
+        }
+
+
+memory_tracker = MemoryTracker()
+gc_monitor = GcMonitor()
+
+
+def _flag(query, name):
+    return query.get(name, ['0'])[0] not in ('0', 'false', '')
+
+
+def diagnostics_response(path, query):
+    """(status, data) for one diagnostics endpoint"""
+    try:
+        if path == '/debug':
+            return 200, {'pid': os.getpid(), 'memory': process_memory(),
+                         'endpoints': ['/debug/memory', '/debug/memory/snapshot', '/debug/profile',
+                                       '/debug/threads', '/debug/gc']}
+
+        elif path == '/debug/memory':
+            if _flag(query, 'start'):
+                memory_tracker.start(int(query.get('frames', ['10'])[0]))
+            elif _flag(query, 'stop'):
+                memory_tracker.stop()
+            return 200, memory_tracker.status()
+
+        elif path == '/debug/memory/snapshot':
+            return 200, memory_tracker.snapshot(int(query.get('limit', ['20'])[0]),
+                                                query.get('key', ['lineno'])[0])
+
+        elif path == '/debug/profile':
+            threads = set(query['threads'][0].split(',')) if 'threads' in query else None
+            return 200, sample_stacks(float(query.get('seconds', ['10'])[0]),
+                                      float(query.get('interval', ['0.01'])[0]), threads,
+                                      int(query.get('limit', ['20'])[0]))
+
+        elif path == '/debug/threads':
+            return 200, thread_cpu()
+
+        elif path == '/debug/gc':
+            collected = gc.collect() if _flag(query, 'collect') else None
+            return 200, dict(gc_monitor.status(), collected_now=collected)
+
+        return 404, {'error': f"Unknown endpoint {path}"}
+    except ValueError as e:
+        return 400, {'error': str(e)}
+
+
+class DiagnosticsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        # The listener is bound to loopback; refuse anything else regardless
+        if self.client_address[0] not in (LOCAL_HOST, '::1'):
+            self._reply(403, {'error': 'Diagnostics are local only'})
+            return
+        url = urllib.parse.urlsplit(self.path)
+        self._reply(*diagnostics_response(url.path.rstrip('/') or '/debug', urllib.parse.parse_qs(url.query)))
+
+    def _reply(self, status, data):
+        body = json.dumps(data, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("Diagnostics %s - %s", self.address_string(), format % args)
+
+
+def serve(port):
+    """Serve the diagnostics endpoints on 127.0.0.1:port until the process exits"""
+    gc_monitor.install()
+    with http.server.ThreadingHTTPServer((LOCAL_HOST, port), DiagnosticsHandler) as server:
+        logging.info("Diagnostics listening on http://%s:%d/debug (local only)", LOCAL_HOST, port)
+        server.serve_forever()
@@ -0,0 +1,96 @@
+"""
+Downsampling of long time series for charts.
+
+  lttb    Largest-Triangle-Three-Buckets: keeps the first and last points
+          and, per bucket, the point forming the largest triangle with the
+          previously kept point and the next bucket's average. Preserves
+          the visual shape with exactly `width` points.
+  minmax  The minimum and maximum of every bucket (up to 2 * `width`
+          points), so no spike disappears between two pixel columns.
+
+Bucket averages, extremes and triangle areas are computed with NumPy over
+whole buckets; only LTTB's dependency on the previously selected point
+needs a loop over buckets, never over samples.
+
+Requires NumPy.
+"""
+
+METHODS = ('lttb', 'minmax', 'none')
+
+
+def _bucket_edges(count, buckets):
+    """Start indices of `buckets` near-equal buckets over `count` points, plus the end"""
+    import numpy as np
+    return np.linspace(0, count, buckets + 1).astype(np.intp)
+
+
+def lttb(x, y, width):
+    """Indices of the points LTTB keeps out of (x, y), in order"""
+    import numpy as np
+    count = len(x)
+    if width >= count or width < 3:
+        return np.arange(count)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # First and last points are kept as-is; the rest is split into width - 2 buckets
+    edges = _bucket_edges(count - 2, width - 2) + 1
+    sums_x = np.add.reduceat(x[1:-1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:-1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    avg_x = np.append(sums_x / sizes, x[-1])  # Next-bucket average for each bucket
+    avg_y = np.append(sums_y / sizes, y[-1])
+
+    selected = np.empty(width, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = count - 1
+    a = 0
+    for i in range(width - 2):
+        start, end = edges[i], edges[i + 1]
+        next_x, next_y = avg_x[i + 1], avg_y[i + 1]
+        ax, ay = x[a], y[a]
+        # Twice the triangle area, without the abs/0.5 that do not change the argmax
+        areas = np.abs((ax - next_x) * (y[start:end] - ay) - (ax - x[start:end]) * (next_y - ay))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(y, width):
+    """Indices of the minimum and maximum of every bucket, in order"""
+    import numpy as np
+    count = len(y)
+    if 2 * width >= count or width < 1:
+        return np.arange(count)
+
+    y = np.asarray(y, dtype=np.float64)
+    # Pad to equal-size buckets so argmin/argmax run over a 2-D view at once
+    size = -(-count // width)
+    padded_low = np.full(width * size, np.inf)
+    padded_high = np.full(width * size, -np.inf)
+    padded_low[:count] = y
+    padded_high[:count] = y
+    offsets = np.arange(width) * size
+    lows = offsets + padded_low.reshape(width, size).argmin(axis=1)
+    highs = offsets + padded_high.reshape(width, size).argmax(axis=1)
+    indices = np.unique(np.concatenate([lows, highs]))  # Sorted, and min == max only once
+    return indices[indices < count]
+
+
+def downsample(x, y, width, method='lttb'):
+    """Downsample one series, dropping NaNs first; returns (x, y) arrays"""
+    import numpy as np
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method: {method!r}")
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+    if not valid.all():
+        x, y = x[valid], y[valid]
+    if method == 'lttb':
+        indices = lttb(x, y, width)
+    elif method == 'minmax':
+        indices = minmax(y, width)
+    else:
+        return x, y
+    return x[indices], y[indices]
@@ -0,0 +1,106 @@
+"""
+Timestamp handling: int64 UTC epoch milliseconds internally, ISO 8601
+only at the edges (CSV rows, JSON responses, query parameters).
+
+Epoch integers order correctly across DST changes, make range scans and
+retention plain integer comparisons, and convert in bulk with NumPy when
+a whole column has to be rendered or parsed. Rendered timestamps are UTC
+with a trailing 'Z'; naive ISO strings, as logged by earlier versions,
+are read as local time.
+"""
+
+import time
+from datetime import datetime
+
+INVALID_MS = -(2 ** 63)  # Marks unparseable entries in parsed int64 columns
+
+
+def now_ms():
+    """Current time as integer UTC epoch milliseconds"""
+    return time.time_ns() // 1000000
+
+
+def to_iso(ms):
+    """Render epoch milliseconds as an ISO 8601 UTC string (second precision)"""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ms // 1000))
+
+
+def to_iso_array(ms_values):
+    """Render a column of epoch milliseconds as ISO 8601 UTC strings"""
+    try:
+        import numpy as np
+    except ImportError:
+        return [to_iso(int(ms)) for ms in ms_values]
+    stamps = np.asarray(ms_values, dtype=np.int64).astype('datetime64[ms]')
+    return np.datetime_as_string(stamps, unit='s', timezone='UTC').tolist()
+
+
+def parse_iso(value):
+    """Epoch milliseconds from an ISO string; naive strings are local time"""
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000)
+
+
+def parse_time(value):
+    """Epoch milliseconds from a query value: epoch seconds or an ISO date/time"""
+    try:
+        return int(float(value) * 1000)
+    except ValueError:
+        return parse_iso(value)
+
+
+def _is_naive(value):
+    return len(value) >= 10 and '+' not in value[10:] and '-' not in value[10:]
+
+
+def _local_offsets_ms(wall_ms):
+    """UTC offset in ms for an array of local wall-clock times (read as if UTC)"""
+    import numpy as np
+    # The offset only changes on the hour, so resolve it once per distinct hour
+    hours, inverse = np.unique(wall_ms // 3600000, return_inverse=True)
+    offsets = np.empty(len(hours), dtype=np.int64)
+    for i, hour in enumerate(hours.tolist()):
+        wall = time.gmtime(hour * 3600)
+        offsets[i] = (hour * 3600 - int(time.mktime(wall[:8] + (-1,)))) * 1000
+    return offsets[inverse]
+
+
+def parse_iso_array(strings):
+    """Vectorized ISO strings to an int64 array of epoch milliseconds.
+
+    'Z'-suffixed and naive (local) strings are parsed in bulk by NumPy;
+    anything else, and any batch containing a corrupt entry, falls back to
+    per-row parsing. Unparseable entries become INVALID_MS. Without NumPy
+    a plain list is returned.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return [_parse_or_invalid(s) for s in strings]
+    result = np.full(len(strings), INVALID_MS, dtype=np.int64)
+    utc = [i for i, s in enumerate(strings) if s.endswith('Z')]
+    naive = [i for i, s in enumerate(strings) if not s.endswith('Z') and _is_naive(s)]
+    leftover = set(range(len(strings))) - set(utc) - set(naive)
+
+    for indices, local in ((utc, False), (naive, True)):
+        if not indices:
+            continue
+        try:
+            values = [strings[i].rstrip('Z') for i in indices]
+            parsed = np.array(values, dtype='datetime64[ms]').astype(np.int64)
+        except ValueError:
+            leftover.update(indices)  # Fall back to per-row parsing for this group
+            continue
+        if local:
+            parsed -= _local_offsets_ms(parsed)
+        result[indices] = parsed
+
+    for i in leftover:
+        result[i] = _parse_or_invalid(strings[i])
+    return result
+
+
+def _parse_or_invalid(value):
+    try:
+        return parse_iso(value)
+    except (ValueError, OverflowError):
+        return INVALID_MS
@@ -0,0 +1,258 @@
+"""
+Short-horizon forecasts of the climate channels with incremental Holt-Winters.
+
+Samples are averaged into fixed buckets (5 minutes by default). Every
+closed bucket updates a damped additive Holt-Winters model per channel
+in O(1):
+
+  level   l = alpha (y - s) + (1 - alpha) (l' + phi b')
+  trend   b = beta (l - l') + (1 - beta) phi b'
+  season  s = gamma (y - l) + (1 - gamma) s        (one slot per bucket of the day)
+
+The h-bucket forecast is l + (phi + ... + phi^h) b + s[slot of that
+bucket]. Season slots are tied to the local time of day, so a restart or
+a gap resumes on the right slot; buckets without samples advance the
+level along the trend without learning from them. The spread of the
+one-step errors gives the prediction interval, widened with the horizon.
+
+Forecasts are recomputed only when a bucket closes, so serving them is a
+dictionary copy. The model state is checkpointed to a JSON file.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+DEFAULT_FIELDS = ('temperature', 'humidity', 'vpd')
+DEFAULT_HORIZONS_MINUTES = (15, 30, 60)
+INTERVAL_Z = 1.96  # ~95% prediction interval
+
+
+class HoltWinters:
+    """Damped additive Holt-Winters with an externally chosen season slot
+
+    The default smoothing suits 5-minute climate buckets: a fast level and
+    trend follow fronts and doors opening, a slow season learns the day
+    over about a week.
+    """
+
+    def __init__(self, period, alpha=0.8, beta=0.3, gamma=0.1, phi=0.9, error_alpha=0.05):
+        self.period = period
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.phi = phi
+        self.error_alpha = error_alpha
+        self.level = None
+        self.trend = 0.0
+        self.season = [0.0] * period
+        self.error_var = None  # EWMA of the squared one-step error
+        self.updates = 0
+
+    def update(self, y, slot):
+        """Learn one observation at a season slot"""
+        if self.level is None:
+            self.level = y - self.season[slot]
+            self.updates += 1
+            return
+        season = self.season[slot]
+        previous = self.level
+        damped = self.phi * self.trend
+        error = y - (previous + damped + season)
+        self.error_var = error * error if self.error_var is None else \
+            self.error_var + self.error_alpha * (error * error - self.error_var)
+        self.level = self.alpha * (y - season) + (1 - self.alpha) * (previous + damped)
+        self.trend = self.beta * (self.level - previous) + (1 - self.beta) * damped
+        self.season[slot] = self.gamma * (y - self.level) + (1 - self.gamma) * season
+        self.updates += 1
+
+    def skip(self):
+        """Advance one step without an observation"""
+        if self.level is not None:
+            self.trend *= self.phi
+            self.level += self.trend
+
+    def forecast(self, steps, slot):
+        """(value, interval half-width) `steps` buckets ahead, or None before the first update"""
+        if self.level is None:
+            return None
+        phi = self.phi
+        damping = phi * (1 - phi ** steps) / (1 - phi) if phi != 1 else float(steps)
+        value = self.level + damping * self.trend + self.season[slot]
+        spread = INTERVAL_Z * math.sqrt((self.error_var or 0.0) * steps)
+        return value, spread
+
+    def to_dict(self):
+        return {'level': self.level, 'trend': self.trend, 'season': self.season,
+                'error_var': self.error_var, 'updates': self.updates}
+
+    def load(self, state):
+        if len(state['season']) != self.period:
+            raise ValueError(f"season has {len(state['season'])} slots, expected {self.period}")
+        self.level = state['level']
+        self.trend = state['trend']
+        self.season = [float(value) for value in state['season']]
+        self.error_var = state['error_var']
+        self.updates = state['updates']
+
+
+class Forecaster:
+    """Per-channel Holt-Winters over bucket means, fed sample by sample"""
+
+    def __init__(self, path=None, fields=DEFAULT_FIELDS, bucket_seconds=300,
+                 horizons_minutes=DEFAULT_HORIZONS_MINUTES, max_skip_buckets=None, save_seconds=300):
+        if 86400 % bucket_seconds:
+            raise ValueError("bucket_seconds must divide a day")
+        self.path = path
+        self.fields = tuple(fields)
+        self.bucket_seconds = bucket_seconds
+        self.period = 86400 // bucket_seconds
+        self.horizons_minutes = tuple(horizons_minutes)
+        # After a longer outage the level is relearned instead of extrapolated
+        self.max_skip_buckets = self.period // 8 if max_skip_buckets is None else max_skip_buckets
+        self.save_seconds = save_seconds
+        self.models = {field: HoltWinters(self.period) for field in self.fields}
+        self._lock = threading.Lock()
+        self._bucket = None  # Index (epoch seconds // bucket_seconds) of the open bucket
+        self._sums = {}
+        self._counts = {}
+        self._forecasts = {}
+        self._updated = None
+        self._last_save = None
+        if path is not None:
+            self._load()
+
+    def _slot(self, bucket):
+        local = time.localtime(bucket * self.bucket_seconds)
+        return (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec) // self.bucket_seconds
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            if state['bucket_seconds'] != self.bucket_seconds:
+                logging.info("Forecast checkpoint %s uses %s s buckets, starting over", self.path,
+                             state['bucket_seconds'])
+                return
+            for field, model in self.models.items():
+                if field in state['models']:
+                    model.load(state['models'][field])
+            self._bucket = state['bucket']
+            self._sums = state['sums']
+            self._counts = state['counts']
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.error("Ignoring unreadable forecast checkpoint %s: %s", self.path, e)
+            self.models = {field: HoltWinters(self.period) for field in self.fields}
+            self._bucket, self._sums, self._counts = None, {}, {}
+            return
+        self._refresh()
+        logging.info("Resumed forecasts from %s", self.path)
+
+    @property
+    def restored(self):
+        return any(model.level is not None for model in self.models.values())
+
+    def update(self, sample, timestamp):
+        """Add one sample (epoch seconds); closes the open bucket when a new one starts"""
+        bucket = int(timestamp // self.bucket_seconds)
+        with self._lock:
+            if self._bucket is None:
+                self._bucket = bucket
+            elif bucket > self._bucket:
+                self._close(bucket)
+            elif bucket < self._bucket:
+                return  # Clock stepped back; wait for it to catch up
+            for field in self.fields:
+                value = sample.get(field)
+                if value is None or (isinstance(value, float) and math.isnan(value)):
+                    continue
+                self._sums[field] = self._sums.get(field, 0.0) + value
+                self._counts[field] = self._counts.get(field, 0) + 1
+            due = self._last_save is None or timestamp - self._last_save >= self.save_seconds
+        if due and self.path is not None:
+            self._last_save = timestamp
+            self.save()
+
+    def _close(self, next_bucket):
+        slot = self._slot(self._bucket)
+        skipped = next_bucket - self._bucket - 1
+        for field, model in self.models.items():
+            if self._counts.get(field):
+                model.update(self._sums[field] / self._counts[field], slot)
+            else:
+                model.skip()
+            if skipped > self.max_skip_buckets:
+                model.level = None  # Relearn from the next bucket, keeping the seasons
+                model.trend = 0.0
+            else:
+                for _ in range(skipped):
+                    model.skip()
+        self._bucket = next_bucket
+        self._sums, self._counts = {}, {}
+        self._refresh()
+
+    def _refresh(self):
+        """Recompute the forecasts from the last closed bucket"""
+        if self._bucket is None:
+            return
+        last_closed = self._bucket - 1
+        forecasts = {}
+        for field, model in self.models.items():
+            points = []
+            for minutes in self.horizons_minutes:
+                target = last_closed + max(1, round(minutes * 60 / self.bucket_seconds))
+                result = model.forecast(target - last_closed, self._slot(target))
+                if result is None:
+                    continue
+                value, spread = result
+                points.append({
+                    'minutes': minutes,
+                    'timestamp_ms': int((target + 0.5) * self.bucket_seconds * 1000),
+                    'value': round(value, 3),
+                    'low': round(value - spread, 3),
+                    'high': round(value + spread, 3),
+                })
+            forecasts[field] = {
+                'forecasts': points,
+                'rmse': None if model.error_var is None else round(math.sqrt(model.error_var), 4),
+                'buckets': model.updates,
+                'seasonal': model.updates >= self.period,  # At least a day learned
+            }
+        self._forecasts = forecasts
+        self._updated = (last_closed + 1) * self.bucket_seconds * 1000
+
+    def status(self):
+        """Latest forecasts per channel"""
+        with self._lock:
+            return {
+                'bucket_s': self.bucket_seconds,
+                'updated_ms': self._updated,
+                'fields': {field: dict(data) for field, data in self._forecasts.items()},
+            }
+
+    def save(self):
+        """Checkpoint the model state atomically (no-op without a path)"""
+        if self.path is None:
+            return
+        with self._lock:
+            body = json.dumps({
+                'bucket_seconds': self.bucket_seconds,
+                'bucket': self._bucket,
+                'sums': self._sums,
+                'counts': self._counts,
+                'models': {field: model.to_dict() for field, model in self.models.items()},
+            })
+        temp_path = self.path + '.temp'
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.error("Error saving forecast checkpoint %s: %s", self.path, e)
@@ -0,0 +1,202 @@
+"""
+Gap index for the logged history, and gap-aware fill for history queries.
+
+A gap is an interval between two consecutive logged rows that are further
+apart than the threshold (the logger writes at least every few minutes,
+so anything longer means the sensor thread stalled or the device was
+down). The index is kept up to date as rows are written, so queries never
+rescan timestamps to find holes, and is saved as a small JSON file next
+to the log:
+
+  {"threshold_ms": 600000, "gaps": [[start_ms, end_ms], ...]}
+
+start_ms and end_ms are the timestamps of the rows on either side; the
+interval between them holds no data.
+
+History queries use the index to mark and fill gaps with NumPy:
+
+  null      no value inside a gap (charts break the line)
+  previous  the last value before the gap is held across it
+  linear    values are interpolated straight across the gap
+"""
+
+import json
+import logging
+import os
+import threading
+
+FILLS = ('null', 'previous', 'linear')
+
+
+class GapIndex:
+    """Intervals with no logged rows, maintained as rows are appended"""
+
+    def __init__(self, path, threshold_ms):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.last_ms = None  # Timestamp of the newest row seen
+        self._gaps = []  # [start_ms, end_ms], in time order
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the saved index; False if it is missing or was built with another threshold"""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logging.error("Ignoring unreadable gap index %s: %s", self.path, e)
+            return False
+        if state.get('threshold_ms') != self.threshold_ms:
+            return False
+        with self._lock:
+            self._gaps = [[int(start), int(end)] for start, end in state.get('gaps', [])]
+        return True
+
+    def rebuild(self, timestamp_chunks):
+        """Recreate the index from the timestamps of the whole history, chunk by chunk"""
+        import numpy as np
+        gaps = []
+        last_ms = None
+        for timestamps in timestamp_chunks:
+            if not len(timestamps):
+                continue
+            timestamps = np.asarray(timestamps, dtype=np.int64)
+            if last_ms is not None:
+                timestamps = np.concatenate(([last_ms], timestamps))
+            holes = np.flatnonzero(np.diff(timestamps) > self.threshold_ms)
+            gaps.extend([int(timestamps[i]), int(timestamps[i + 1])] for i in holes)
+            last_ms = int(timestamps[-1])
+        with self._lock:
+            self._gaps = gaps
+            self.last_ms = last_ms
+        self.save()
+        return len(gaps)
+
+    def observe(self, timestamps):
+        """Account for newly written rows (in time order); returns the gaps they close"""
+        found = []
+        with self._lock:
+            for ms in timestamps:
+                ms = int(ms)
+                if self.last_ms is not None and ms - self.last_ms > self.threshold_ms:
+                    found.append([self.last_ms, ms])
+                if self.last_ms is None or ms > self.last_ms:
+                    self.last_ms = ms
+            self._gaps.extend(found)
+        if found:
+            for start, end in found:
+                logging.warning("No data logged for %.1f min (%d to %d)", (end - start) / 60000, start, end)
+            self.save()
+        return found
+
+    def prune(self, cutoff_ms):
+        """Forget gaps that ended before cutoff_ms (after retention dropped their rows)"""
+        with self._lock:
+            keep = [gap for gap in self._gaps if gap[1] >= cutoff_ms]
+            changed = len(keep) != len(self._gaps)
+            self._gaps = keep
+        if changed:
+            self.save()
+
+    def between(self, start_ms=None, end_ms=None):
+        """Gaps overlapping start_ms..end_ms"""
+        with self._lock:
+            return [list(gap) for gap in self._gaps
+                    if (start_ms is None or gap[1] >= start_ms) and (end_ms is None or gap[0] <= end_ms)]
+
+    def status(self):
+        with self._lock:
+            gaps = list(self._gaps)
+        return {
+            'threshold_s': self.threshold_ms / 1000,
+            'gaps': len(gaps),
+            'missing_hours': round(sum(end - start for start, end in gaps) / 3600000, 2),
+            'last_gap': gaps[-1] if gaps else None,
+        }
+
+    def save(self):
+        with self._lock:
+            body = json.dumps({'threshold_ms': self.threshold_ms, 'gaps': self._gaps})
+        temp_path = self.path + '.temp'
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(body)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.error("Error saving gap index %s: %s", self.path, e)
+
+
+def find_gaps(timestamps, threshold_ms):
+    """Gaps in an in-memory timestamp array (for histories without an index)"""
+    import numpy as np
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    holes = np.flatnonzero(np.diff(timestamps) > threshold_ms)
+    return [[int(timestamps[i]), int(timestamps[i + 1])] for i in holes]
+
+
+def gap_mask(t, gaps):
+    """True for every time strictly inside a gap"""
+    import numpy as np
+    t = np.asarray(t)
+    if not gaps:
+        return np.zeros(len(t), dtype=bool)
+    bounds = np.asarray(gaps, dtype=np.int64)
+    # The last gap starting before each time, and whether that gap is still open
+    i = np.searchsorted(bounds[:, 0], t, side='right') - 1
+    return (i >= 0) & (t < bounds[np.maximum(i, 0), 1])
+
+
+def resample(t, v, grid, gaps, fill='null'):
+    """Values of the series (t, v) at the grid times and the grid's gap mask.
+
+    Outside gaps values are interpolated linearly ('previous' holds the
+    last sample instead); inside gaps `fill` decides. Times outside the
+    series are NaN.
+    """
+    import numpy as np
+    if fill not in FILLS:
+        raise ValueError(f"fill must be one of {', '.join(FILLS)}")
+    grid = np.asarray(grid, dtype=np.int64)
+    mask = gap_mask(grid, gaps)
+    if not len(t):
+        return np.full(len(grid), np.nan), mask
+    if fill == 'previous':
+        i = np.searchsorted(t, grid, side='right') - 1
+        values = np.where(i >= 0, v[np.maximum(i, 0)], np.nan)
+    else:
+        values = np.interp(grid, t, v, left=np.nan, right=np.nan)
+        if fill == 'null':
+            values[mask] = np.nan
+    values[grid > t[-1]] = np.nan
+    return values, mask
+
+
+def mark_gaps(t, v, gaps, fill='null'):
+    """Downsampled points with a point added at each gap so charts draw it.
+
+    'null' adds a NaN point in the middle of the gap (a break in the
+    line), 'previous' the last value at the end of the gap (a step),
+    'linear' nothing. Returns (t, v, mask) with mask True on added points.
+    """
+    import numpy as np
+    if fill not in FILLS:
+        raise ValueError(f"fill must be one of {', '.join(FILLS)}")
+    t = np.asarray(t, dtype=np.int64)
+    v = np.asarray(v, dtype=np.float64)
+    if fill == 'linear' or not gaps or not len(t):
+        return t, v, np.zeros(len(t), dtype=bool)
+    bounds = np.asarray(gaps, dtype=np.int64)
+    if fill == 'null':
+        added_t = (bounds[:, 0] + bounds[:, 1]) // 2
+        added_v = np.full(len(added_t), np.nan)
+    else:
+        added_t = bounds[:, 1] - 1
+        i = np.searchsorted(t, bounds[:, 0], side='right') - 1
+        added_v = np.where(i >= 0, v[np.maximum(i, 0)], np.nan)
+    inside = (added_t > t[0]) & (added_t < t[-1])
+    added_t, added_v = added_t[inside], added_v[inside]
+    order = np.argsort(np.concatenate((t, added_t)), kind='stable')
+    mask = np.concatenate((np.zeros(len(t), dtype=bool), np.ones(len(added_t), dtype=bool)))[order]
+    return np.concatenate((t, added_t))[order], np.concatenate((v, added_v))[order], mask
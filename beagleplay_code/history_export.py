@@ -0,0 +1,301 @@
+"""
+Columnar export of the logged sensor history.
+
+Reads greenhouse_data.csv in chunks and writes it as compressed columnar
+files for offline analysis, so notebooks no longer re-parse the CSV and
+its ISO timestamps row by row:
+  parquet  Apache Parquet, one zstd-compressed row group per chunk (pyarrow)
+  arrow    Arrow IPC file, one zstd-compressed record batch per chunk (pyarrow)
+  npz      NumPy .npz (zip-deflated), the dependency-light fallback
+Timestamps come straight from the log's timestamp_ms column and are
+stored as int64 UTC epoch milliseconds ("timestamp_ms" in .npz, a
+timestamp[ms, UTC] column in Parquet/Arrow, which is the same int64 on
+disk); every other column is float64 with NaN for blanks.
+
+With a calibrator, calibrated columns are recomputed from the logged
+<channel>_raw columns on the way out (see calibration.Calibrator.recalibrate).
+
+Command line:
+  python3 history_export.py greenhouse_data.csv history.parquet
+  python3 history_export.py --format npz --start 2025-07-01 greenhouse_data.csv history.npz
+  python3 history_export.py --recalibrate calibration.json greenhouse_data.csv history.parquet
+  python3 history_export.py --recalibrate calibration.json --in-place greenhouse_data.csv
+
+Requires NumPy; Parquet and Arrow also need pyarrow.
+"""
+
+import argparse
+import csv
+import os
+import time
+
+import epoch_time
+
+FORMATS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+    'npz': ('.npz', 'application/octet-stream'),
+}
+DEFAULT_CHUNK_ROWS = 50000
+
+
+def available_formats():
+    """Export formats whose dependencies are installed, preferred first"""
+    formats = []
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return formats
+    try:
+        import pyarrow  # noqa: F401
+        formats.extend(['parquet', 'arrow'])
+    except ImportError:
+        pass
+    formats.append('npz')
+    return formats
+
+
+def _columns(csv_path):
+    """Union of every header in the file, in first-seen order"""
+    columns = []
+    with open(csv_path, 'r', newline='') as f:
+        for line in f:
+            if line.startswith('timestamp,'):
+                for name in next(csv.reader([line])):
+                    if name not in columns:
+                        columns.append(name)
+    return columns
+
+
+def _int_or_invalid(cell):
+    try:
+        value = int(cell)
+    except ValueError:
+        return epoch_time.INVALID_MS
+    return value if -2 ** 63 < value < 2 ** 63 else epoch_time.INVALID_MS
+
+
+def _float_or_nan(cell):
+    try:
+        return float(cell)
+    except ValueError:
+        return float('nan')
+
+
+def iter_chunks(csv_path, start_ms=None, end_ms=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield (columns, arrays) chunks of the history between start_ms and end_ms.
+
+    `arrays` maps 'timestamp_ms' to int64 epoch ms and every other column to
+    float64. Repeated header rows (including ones that add columns) are
+    handled, so the schema is the same for every chunk.
+    """
+    import numpy as np
+    columns = _columns(csv_path)
+    fields = [name for name in columns if name not in ('timestamp', 'timestamp_ms')]
+
+    def build(rows, header):
+        positions = {name: i for i, name in enumerate(header)}
+        if 'timestamp_ms' in positions:
+            i = positions['timestamp_ms']
+            cells = [row[i] if len(row) > i and row[i] else epoch_time.INVALID_MS for row in rows]
+            try:
+                timestamps = np.array(cells, dtype=np.int64)
+            except (ValueError, OverflowError):
+                timestamps = np.array([_int_or_invalid(cell) for cell in cells], dtype=np.int64)
+        else:
+            # Logs written before timestamp_ms existed only have ISO strings
+            timestamps = epoch_time.parse_iso_array([row[positions['timestamp']] for row in rows])
+        keep = timestamps != epoch_time.INVALID_MS
+        if start_ms is not None:
+            keep &= timestamps >= start_ms
+        if end_ms is not None:
+            keep &= timestamps <= end_ms
+        arrays = {'timestamp_ms': timestamps[keep]}
+        width = len(header)
+        for name in fields:
+            i = positions.get(name)
+            if i is None:
+                values = np.full(len(rows), np.nan)
+            else:
+                cells = [row[i] if i < width and row[i] != '' else 'nan' for row in rows]
+                try:
+                    values = np.array(cells, dtype=np.float64)
+                except ValueError:
+                    # A torn or corrupt cell (e.g. the last line after a power cut)
+                    values = np.array([_float_or_nan(cell) for cell in cells], dtype=np.float64)
+            arrays[name] = values[keep]
+        return arrays
+
+    with open(csv_path, 'r', newline='') as f:
+        header = None
+        rows = []
+        for row in csv.reader(f):
+            if not row:
+                continue
+            if row[0] == 'timestamp':
+                if rows:
+                    yield fields, build(rows, header)
+                    rows = []
+                header = row
+                continue
+            if header is None:
+                continue
+            rows.append(row)
+            if len(rows) >= chunk_rows:
+                yield fields, build(rows, header)
+                rows = []
+        if rows:
+            yield fields, build(rows, header)
+
+
+def source_chunks(source, start_ms, end_ms, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """(fields, arrays) chunks of a CSV path, or of a store with its own iter_chunks (sqlite_store)"""
+    if isinstance(source, str):
+        return iter_chunks(source, start_ms, end_ms, chunk_rows)
+    return source.iter_chunks(start_ms, end_ms, chunk_rows)
+
+
+def load_columns(source, start_ms=None, end_ms=None):
+    """The whole history (or a time range) as one array per column"""
+    import numpy as np
+    parts = {}
+    for fields, arrays in source_chunks(source, start_ms, end_ms):
+        for name, values in arrays.items():
+            parts.setdefault(name, []).append(values)
+    if not parts:
+        return {'timestamp_ms': np.empty(0, dtype=np.int64)}
+    return {name: np.concatenate(values) for name, values in parts.items()}
+
+
+def _arrow_schema(fields):
+    import pyarrow as pa
+    return pa.schema([pa.field('timestamp', pa.timestamp('ms', tz='UTC'))]
+                     + [pa.field(name, pa.float64()) for name in fields])
+
+
+def _arrow_batch(schema, arrays):
+    import pyarrow as pa
+    columns = [pa.array(arrays['timestamp_ms'], type=pa.timestamp('ms', tz='UTC'))]
+    columns += [pa.array(arrays[name], type=pa.float64()) for name in schema.names[1:]]
+    return pa.record_batch(columns, schema=schema)
+
+
+def export_history(source, out, fmt='npz', start_ms=None, end_ms=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                   calibrator=None):
+    """Write the history (a CSV path or a store) to `out` (path or binary file) and return the row count"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt!r}")
+
+    if fmt == 'npz':
+        import numpy as np
+        columns = load_columns(source, start_ms, end_ms)
+        if calibrator is not None:
+            calibrator.recalibrate(columns)
+        if isinstance(out, str):
+            # savez would otherwise append .npz to any other file name
+            with open(out, 'wb') as f:
+                np.savez_compressed(f, **columns)
+        else:
+            np.savez_compressed(out, **columns)
+        return len(columns['timestamp_ms'])
+
+    rows = 0
+    schema = None
+    writer = None
+    try:
+        for fields, arrays in source_chunks(source, start_ms, end_ms, chunk_rows):
+            if calibrator is not None:
+                calibrator.recalibrate(arrays)
+            if writer is None:
+                schema = _arrow_schema(fields)
+                writer = _open_arrow_writer(out, schema, fmt)
+            batch = _arrow_batch(schema, arrays)
+            rows += batch.num_rows
+            if fmt == 'parquet':
+                import pyarrow as pa
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+        if writer is None:
+            writer = _open_arrow_writer(out, _arrow_schema([]), fmt)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def recalibrate_csv(csv_path, calibrator, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Rewrite a CSV log with its calibrated columns recomputed from the raw ones; returns the row count.
+
+    Stop the server first: rows it appends during the rewrite would be lost.
+    """
+    import numpy as np
+    rows = 0
+    temp_path = csv_path + '.recalibrate'
+    with open(temp_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        header = None
+        for fields, arrays in iter_chunks(csv_path, chunk_rows=chunk_rows):
+            if header is None:
+                header = ['timestamp', 'timestamp_ms'] + fields
+                writer.writerow(header)
+            calibrator.recalibrate(arrays)
+            columns = [epoch_time.to_iso_array(arrays['timestamp_ms']), arrays['timestamp_ms'].tolist()]
+            columns += [[repr(value) if value == value else '' for value in np.round(arrays[name], 6).tolist()]
+                        for name in fields]
+            writer.writerows(zip(*columns))
+            rows += len(arrays['timestamp_ms'])
+    os.replace(temp_path, csv_path)
+    return rows
+
+
+def _open_arrow_writer(out, schema, fmt):
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(out, schema, compression='zstd')
+    import pyarrow as pa
+    return pa.ipc.new_file(out, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export greenhouse_data.csv as a columnar file")
+    parser.add_argument('csv_path', help="Logged history (greenhouse_data.csv)")
+    parser.add_argument('output', nargs='?', help="Output file")
+    parser.add_argument('--recalibrate', metavar='CALIBRATION_JSON',
+                        help="Recompute calibrated columns from the logged raw values with this calibration")
+    parser.add_argument('--in-place', action='store_true',
+                        help="With --recalibrate, rewrite the CSV log itself (stop the server first)")
+    parser.add_argument('--format', choices=sorted(FORMATS),
+                        help="Output format (default: from the output extension)")
+    parser.add_argument('--start', help="Only rows at or after this time (ISO or epoch seconds)")
+    parser.add_argument('--end', help="Only rows at or before this time (ISO or epoch seconds)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="Rows per chunk / row group (default: %(default)s)")
+    args = parser.parse_args(argv)
+    calibrator = None
+    if args.recalibrate:
+        import calibration
+        calibrator = calibration.Calibrator.from_file(args.recalibrate)
+    if args.in_place:
+        if calibrator is None:
+            parser.error("--in-place needs --recalibrate")
+        started = time.perf_counter()
+        rows = recalibrate_csv(args.csv_path, calibrator, args.chunk_rows)
+        print(f"Recalibrated {rows} rows of {args.csv_path} in {time.perf_counter() - started:.2f} s")
+        return
+    if args.output is None:
+        parser.error("an output file is required")
+
+    fmt = args.format
+    if fmt is None:
+        fmt = next((name for name, (suffix, _) in FORMATS.items() if args.output.endswith(suffix)), 'npz')
+    started = time.perf_counter()
+    rows = export_history(args.csv_path, args.output, fmt,
+                          epoch_time.parse_time(args.start) if args.start else None,
+                          epoch_time.parse_time(args.end) if args.end else None,
+                          args.chunk_rows, calibrator)
+    print(f"Exported {rows} rows to {args.output} ({fmt}) in {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Response compression and conditional GET for the JSON endpoints.
+
+Bodies get a weak ETag from a hash of their content, so an unchanged
+snapshot always has the same tag and a poll carrying If-None-Match costs a
+304 with no body. gzip/deflate variants are negotiated from
+Accept-Encoding and kept in a small LRU keyed by (ETag, encoding), so each
+distinct payload is compressed once however many clients poll it.
+"""
+
+import email.utils
+import gzip
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+ENCODINGS = ('gzip', 'deflate')  # In order of preference on equal q-values
+COMPRESS_MIN_BYTES = 512  # Smaller bodies are not worth a compression header
+COMPRESS_LEVEL = 6
+
+
+def negotiate_encoding(accept_encoding):
+    """Best supported content coding for an Accept-Encoding header, or None"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    wildcard = weights.get('*', 0.0)
+    best = None
+    best_q = 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def make_etag(body):
+    """Weak entity tag for a body (shared by its compressed variants)"""
+    return 'W/"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+def http_date(timestamp):
+    """RFC 7231 date for an epoch timestamp in seconds"""
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(if_none_match, if_modified_since, etag, last_modified=None):
+    """Whether a conditional GET can be answered with 304.
+
+    If-None-Match takes precedence; If-Modified-Since is only consulted
+    when the client sent no entity tags.
+    """
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        opaque = etag[2:] if etag.startswith('W/') else etag
+        return '*' in tags or any((tag[2:] if tag.startswith('W/') else tag) == opaque for tag in tags)
+    if if_modified_since and last_modified is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def compress(body, encoding):
+    """Encode a body with a content coding from ENCODINGS"""
+    if encoding == 'gzip':
+        return gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+    if encoding == 'deflate':
+        return zlib.compress(body, COMPRESS_LEVEL)  # HTTP "deflate" is the zlib format
+    raise ValueError(f"Unsupported content coding: {encoding!r}")
+
+
+class CompressedBodyCache:
+    """Compressed variants of recently sent bodies, keyed by (ETag, encoding)"""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag, body, encoding):
+        key = (etag, encoding)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        encoded = compress(body, encoding)
+        with self._lock:
+            self._entries[key] = encoded
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return encoded
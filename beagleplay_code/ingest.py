@@ -0,0 +1,311 @@
+"""
+Push ingest of readings from external sensor nodes.
+
+Nodes POST batches of readings to /api/ingest in one of two formats:
+
+  JSON lines   one object per line:
+                 {"t": 1790000000000, "source": "esp32-a", "temperature": 21.4, "humidity": 58}
+               "t" is epoch ms (defaults to arrival time) and "source" names
+               the node; every other key is a channel from CHANNELS, or one
+               declared by an enabled sensor plugin (see sensor_plugins.py).
+  Binary       b'GHR1', a 1-byte source name length and the UTF-8 name,
+               then packed little-endian records of
+                 int64 timestamp_ms, uint16 channel id, float32 value
+               (14 bytes each). Decoded and range-checked with NumPy in bulk.
+
+Validation is compiled once from CHANNELS into a closure (JSON) and into
+per-channel-id bound arrays (binary). The request thread only decodes,
+validates and hands the batch to a bounded queue with put_nowait; a worker
+thread applies the newest value of each channel to the pipeline, so a
+slow consumer costs the sender a 503 rather than a blocked server.
+"""
+
+import json
+import logging
+import queue
+import struct
+import threading
+import time
+
+# name: (binary channel id, minimum, maximum, unit); the server adds the
+# plugin channels (id None: JSON lines only)
+CHANNELS = {
+    'temperature': (1, -40.0, 125.0, 'C'),
+    'humidity': (2, 0.0, 100.0, '%'),
+    'light': (3, 0.0, 200000.0, 'lux'),
+    'ph': (4, 0.0, 14.0, 'pH'),
+    'thermal_min_temp': (16, -40.0, 300.0, 'C'),
+    'thermal_max_temp': (17, -40.0, 300.0, 'C'),
+    'thermal_mean_temp': (18, -40.0, 300.0, 'C'),
+    'thermal_median_temp': (19, -40.0, 300.0, 'C'),
+    'thermal_range_temp': (20, 0.0, 340.0, 'C'),
+    'thermal_mode_temp': (21, -40.0, 300.0, 'C'),
+    'thermal_std_dev_temp': (22, 0.0, 200.0, 'C'),
+}
+
+BINARY_MAGIC = b'GHR1'
+BINARY_RECORD = struct.Struct('<qHf')  # timestamp_ms, channel id, value
+MAX_CLOCK_SKEW_MS = 24 * 3600 * 1000  # Reject readings stamped more than a day ahead
+MAX_ERRORS_REPORTED = 10
+
+
+class QueueFull(Exception):
+    """The ingest queue is full; the sender should retry later"""
+
+
+def compile_json_validator(channels):
+    """Build validate(record, now_ms) -> (timestamp_ms, source, values) for JSON records"""
+    bounds = {name: (low, high) for name, (_, low, high, _) in channels.items()}
+    number_types = (int, float)
+
+    def validate(record, now_ms):
+        if not isinstance(record, dict):
+            raise ValueError("record must be a JSON object")
+        timestamp = record.get('t', now_ms)
+        if type(timestamp) is not int or not 0 < timestamp <= now_ms + MAX_CLOCK_SKEW_MS:
+            raise ValueError(f"invalid timestamp {timestamp!r}")
+        source = record.get('source', '')
+        if not isinstance(source, str):
+            raise ValueError("source must be a string")
+        values = {}
+        for key, value in record.items():
+            if key == 't' or key == 'source':
+                continue
+            limits = bounds.get(key)
+            if limits is None:
+                raise ValueError(f"unknown channel {key!r}")
+            if type(value) not in number_types or not limits[0] <= value <= limits[1]:
+                raise ValueError(f"{key} value {value!r} out of range")
+            values[key] = float(value)
+        if not values:
+            raise ValueError("record has no readings")
+        return timestamp, source, values
+    return validate
+
+
+class _BinarySchema:
+    """Channel names and bounds indexed by binary channel id"""
+
+    def __init__(self, channels):
+        size = max(channel_id for channel_id, _, _, _ in channels.values() if channel_id is not None) + 1
+        self.names = [None] * size
+        self.low = [float('inf')] * size  # Unknown ids fail every range check
+        self.high = [float('-inf')] * size
+        for name, (channel_id, low, high, _) in channels.items():
+            if channel_id is None:
+                continue
+            self.names[channel_id] = name
+            self.low[channel_id] = low
+            self.high[channel_id] = high
+
+
+def decode_binary(body, schema, now_ms):
+    """Decode and validate a binary batch; returns (source, records, rejected, errors)"""
+    if len(body) < 5:
+        raise ValueError("truncated binary header")
+    name_length = body[4]
+    source = body[5:5 + name_length].decode('utf-8', errors='replace')
+    payload = memoryview(body)[5 + name_length:]
+    if len(payload) % BINARY_RECORD.size:
+        raise ValueError(f"binary payload is not a multiple of {BINARY_RECORD.size} bytes")
+
+    try:
+        import numpy as np
+    except ImportError:
+        return source, *_decode_binary_rows(payload, schema, now_ms)
+
+    rows = np.frombuffer(payload, dtype=np.dtype([('t', '<i8'), ('channel', '<u2'), ('value', '<f4')]))
+    channel = rows['channel'].astype(np.intp)
+    known = channel < len(schema.names)
+    channel = np.where(known, channel, 0)
+    low = np.asarray(schema.low)[channel]
+    high = np.asarray(schema.high)[channel]
+    valid = (known & (rows['value'] >= low) & (rows['value'] <= high)
+             & (rows['t'] > 0) & (rows['t'] <= now_ms + MAX_CLOCK_SKEW_MS))
+    rejected = int(len(rows) - valid.sum())
+    errors = [] if not rejected else [f"{rejected} binary records out of range or unknown channel"]
+    names = schema.names
+    # float32 carries ~7 significant digits; round so 6.1 is not reported as 6.0999999
+    values = np.round(rows['value'][valid].astype(np.float64), 4)
+    records = [(t, names[c], v) for t, c, v in
+               zip(rows['t'][valid].tolist(), channel[valid].tolist(), values.tolist())]
+    return source, records, rejected, errors
+
+
+def _decode_binary_rows(payload, schema, now_ms):
+    records = []
+    rejected = 0
+    for timestamp, channel_id, value in BINARY_RECORD.iter_unpack(payload):
+        if (channel_id < len(schema.names) and schema.low[channel_id] <= value <= schema.high[channel_id]
+                and 0 < timestamp <= now_ms + MAX_CLOCK_SKEW_MS):
+            records.append((timestamp, schema.names[channel_id], round(value, 4)))
+        else:
+            rejected += 1
+    errors = [] if not rejected else [f"{rejected} binary records out of range or unknown channel"]
+    return records, rejected, errors
+
+
+class IngestPipeline:
+    """Validates pushed batches and applies them to the sensor pipeline off-thread.
+
+    `apply` is called from the worker thread with a dict of the newest value
+    per channel; readings older than the last applied value of a channel are
+    recorded per source but do not overwrite it.
+    """
+
+    def __init__(self, apply, channels=None, max_batches=256):
+        self.apply = apply
+        self.channels = channels or CHANNELS
+        self._validate = compile_json_validator(self.channels)
+        self._binary_schema = _BinarySchema(self.channels)
+        self._queue = queue.Queue(maxsize=max_batches)
+        self._lock = threading.Lock()
+        self._applied_at = {}  # channel -> timestamp_ms of the applied value
+        self.sources = {}  # source -> {'last_seen': ms, 'readings': {channel: [value, ms]}}
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped_batches = 0
+        self.applied = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name='ingest', daemon=True)
+            self._thread.start()
+
+    def submit(self, body, now_ms=None):
+        """Decode, validate and enqueue one POST body; returns a result summary.
+
+        Raises ValueError for an undecodable body and QueueFull when the
+        worker is behind.
+        """
+        if now_ms is None:
+            now_ms = time.time_ns() // 1000000
+        if body[:4] == BINARY_MAGIC:
+            source, records, rejected, errors = decode_binary(body, self._binary_schema, now_ms)
+            batch = [(timestamp, source, {name: value}) for timestamp, name, value in records]
+        else:
+            batch, rejected, errors = self._decode_json_lines(body, now_ms)
+
+        if batch:
+            try:
+                self._queue.put_nowait(batch)
+            except queue.Full:
+                with self._lock:
+                    self.dropped_batches += 1
+                raise QueueFull(f"ingest queue full ({self._queue.maxsize} batches)")
+        accepted = sum(len(values) for _, _, values in batch)
+        with self._lock:
+            self.accepted += accepted
+            self.rejected += rejected
+        return {'accepted': accepted, 'rejected': rejected, 'errors': errors[:MAX_ERRORS_REPORTED]}
+
+    def _decode_json_lines(self, body, now_ms):
+        batch = []
+        errors = []
+        rejected = 0
+        validate = self._validate
+        for number, line in enumerate(body.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                batch.append(validate(json.loads(line), now_ms))
+            except ValueError as e:  # Includes JSON decode errors
+                rejected += 1
+                if len(errors) < MAX_ERRORS_REPORTED:
+                    errors.append(f"line {number}: {e}")
+        return batch, rejected, errors
+
+    def _worker(self):
+        while True:
+            batch = self._queue.get()
+            # Drain whatever else is waiting so a burst is applied in one go
+            while True:
+                try:
+                    batch.extend(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply_batch(batch)
+            except Exception:
+                logging.exception("Error applying ingested readings")
+
+    def _apply_batch(self, batch):
+        newest = {}
+        with self._lock:
+            for timestamp, source, values in batch:
+                entry = self.sources.setdefault(source, {'last_seen': 0, 'readings': {}})
+                entry['last_seen'] = max(entry['last_seen'], timestamp)
+                for name, value in values.items():
+                    previous = entry['readings'].get(name)
+                    if previous is None or timestamp >= previous[1]:
+                        entry['readings'][name] = [value, timestamp]
+                    if timestamp >= self._applied_at.get(name, 0) and timestamp >= newest.get(name, (0, 0))[1]:
+                        newest[name] = (value, timestamp)
+            for name, (_, timestamp) in newest.items():
+                self._applied_at[name] = timestamp
+            self.applied += len(batch)
+        if newest:
+            self.apply({name: value for name, (value, _) in newest.items()})
+
+    def freshness(self, now_ms=None):
+        """Timestamp and age of the applied value of every pushed channel"""
+        if now_ms is None:
+            now_ms = time.time_ns() // 1000000
+        with self._lock:
+            applied_at = dict(self._applied_at)
+        return {name: {'timestamp_ms': timestamp, 'age_s': round(max(0, now_ms - timestamp) / 1000, 1)}
+                for name, timestamp in applied_at.items()}
+
+    def status(self):
+        """Counters, queue depth and the latest readings per source"""
+        freshness = self.freshness()
+        with self._lock:
+            return {
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'dropped_batches': self.dropped_batches,
+                'queued_batches': self._queue.qsize(),
+                'sources': {source: {'last_seen': entry['last_seen'],
+                                     'readings': {name: value for name, (value, _) in entry['readings'].items()}}
+                            for source, entry in self.sources.items()},
+                'channels': {name: {'id': channel_id, 'min': low, 'max': high, 'unit': unit}
+                             for name, (channel_id, low, high, unit) in self.channels.items()},
+                'freshness': freshness,
+            }
+
+
+def encode_binary(source, records, channels=CHANNELS):
+    """Pack (timestamp_ms, channel, value) records in the binary ingest format"""
+    name = source.encode('utf-8')[:255]
+    return (BINARY_MAGIC + bytes([len(name)]) + name
+            + b''.join(BINARY_RECORD.pack(t, channels[channel][0], value) for t, channel, value in records))
+
+
+def benchmark(readings=100000, batch_size=1000):
+    """Readings per second through decode, validate and enqueue for both formats"""
+    now_ms = time.time_ns() // 1000000
+    applied = []
+    pipeline = IngestPipeline(applied.append, max_batches=readings // batch_size + 1)
+    channels = ['temperature', 'humidity', 'light', 'ph']
+
+    lines = [json.dumps({'t': now_ms - i, 'source': 'bench', channels[i % 4]: 20.0 + i % 10}).encode()
+             for i in range(batch_size)]
+    json_body = b'\n'.join(lines)
+    binary_body = encode_binary('bench', [(now_ms - i, channels[i % 4], 20.0 + i % 10)
+                                          for i in range(batch_size)])
+    results = {}
+    for label, body in (('jsonl', json_body), ('binary', binary_body)):
+        started = time.perf_counter()
+        for _ in range(readings // batch_size):
+            pipeline.submit(body, now_ms)
+        elapsed = time.perf_counter() - started
+        while not pipeline._queue.empty():
+            pipeline._queue.get_nowait()
+        results[label] = round(readings / elapsed)
+    return results
+
+
+if __name__ == '__main__':
+    for label, rate in benchmark().items():
+        print(f"{label}: {rate:,} readings/s decoded, validated and enqueued")
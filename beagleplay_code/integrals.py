@@ -0,0 +1,230 @@
+"""
+Running agronomic integrals over the live samples, reset at local midnight.
+
+  dli            daily light integral, mol/m2/day: PPFD integrated over the
+                 day. The light sensor reports lux, converted to PPFD with a
+                 configurable factor (0.0185 umol/m2/s per lux for sunlight)
+  gdd            growing degree days: air temperature above the base (and
+                 capped at the upper cutoff) integrated over the day, in
+                 degree-days
+  vpd hours      hours with VPD below and above the target band
+
+Every sample updates the sums in O(1): the segment between two samples is
+integrated as a straight line (trapezoidal rule, with exact threshold
+crossings for GDD and the VPD band) and split at midnight when it spans
+one. Segments longer than max_gap_seconds are not bridged; the per-field
+coverage shows how much of the day the sums are based on. The state is
+saved to a small JSON file so a restart resumes the current day.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+
+DEFAULT_LUX_TO_PPFD = 0.0185
+SECONDS_PER_DAY = 86400.0
+
+
+def _excess(v0, v1, threshold):
+    """Mean over a linear segment of max(v - threshold, 0)"""
+    a, b = v0 - threshold, v1 - threshold
+    if a >= 0 and b >= 0:
+        return (a + b) / 2
+    if a <= 0 and b <= 0:
+        return 0.0
+    high = max(a, b)
+    return high * high / (2 * abs(b - a))
+
+
+def _fraction_below(v0, v1, threshold):
+    """Fraction of a linear segment spent below threshold"""
+    if v0 < threshold and v1 < threshold:
+        return 1.0
+    if v0 >= threshold and v1 >= threshold:
+        return 0.0
+    return (threshold - min(v0, v1)) / abs(v1 - v0)
+
+
+def _value(sample, field):
+    value = sample.get(field)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return float(value)
+
+
+def _new_day(date):
+    return {
+        'date': date,
+        'light_umol': 0.0,  # PPFD-seconds, umol/m2
+        'gdd_seconds': 0.0,  # Degree-seconds
+        'vpd_low_seconds': 0.0,
+        'vpd_high_seconds': 0.0,
+        'coverage_seconds': {'light': 0.0, 'temperature': 0.0, 'vpd': 0.0},
+        'samples': 0,
+    }
+
+
+class DailyIntegrals:
+    """DLI, growing degree days and VPD hours for the current local day and the days before"""
+
+    FIELDS = ('light', 'temperature', 'vpd')
+
+    def __init__(self, path=None, lux_to_ppfd=DEFAULT_LUX_TO_PPFD, gdd_base=10.0, gdd_cap=30.0,
+                 vpd_band=(0.4, 1.6), max_gap_seconds=600, history_days=30, save_seconds=60):
+        self.path = path
+        self.lux_to_ppfd = lux_to_ppfd
+        self.gdd_base = gdd_base
+        self.gdd_cap = gdd_cap
+        self.vpd_band = tuple(vpd_band)
+        self.max_gap_seconds = max_gap_seconds
+        self.history_days = history_days
+        self.save_seconds = save_seconds
+        self._lock = threading.Lock()
+        self._day = None
+        self._day_end = None  # Epoch seconds of the next local midnight
+        self._days = []  # Completed days, oldest first
+        self._last = None  # (t, {field: value}) of the previous sample
+        self._last_save = None
+        if path is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            self._days = state.get('days', [])[-self.history_days:]
+            self._day = state.get('today')
+            if state.get('last') is not None:
+                self._last = (float(state['last']['t']), state['last']['values'])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.error("Ignoring unreadable integrals state %s: %s", self.path, e)
+            self._day, self._days, self._last = None, [], None
+            return
+        if self._day is not None:
+            self._day_end = self._midnight_after(datetime.fromisoformat(self._day['date']))
+        logging.info("Resumed integrals for %s from %s", self._day and self._day['date'], self.path)
+
+    @staticmethod
+    def _midnight_after(day):
+        return datetime.combine(day.date() + timedelta(days=1), datetime.min.time()).timestamp()
+
+    def _start_day(self, t):
+        day = datetime.fromtimestamp(t)
+        self._day = _new_day(day.date().isoformat())
+        self._day_end = self._midnight_after(day)
+
+    def _roll_over(self):
+        self._days.append(self._day)
+        del self._days[:-self.history_days]
+        logging.info("Integrals for %s: %s", self._day['date'], self._summarize(self._day))
+
+    def update(self, sample, timestamp):
+        """Integrate from the previous sample to this one (epoch seconds)"""
+        values = {field: _value(sample, field) for field in self.FIELDS}
+        with self._lock:
+            if self._day is None:
+                self._start_day(timestamp)
+            last = self._last
+            if last is not None and 0 < timestamp - last[0] <= self.max_gap_seconds:
+                self._integrate(last[0], last[1], timestamp, values)
+            # Roll over even across a gap, so an idle day still ends
+            while timestamp >= self._day_end:
+                self._roll_over()
+                self._start_day(self._day_end)
+            self._day['samples'] += 1
+            self._last = (timestamp, values)
+            due = self._last_save is None or timestamp - self._last_save >= self.save_seconds
+        if due:
+            self._last_save = timestamp
+            self.save()
+
+    def _integrate(self, t0, v0, t1, v1):
+        """Add the segment t0..t1, split at each midnight it spans"""
+        while t0 < t1:
+            end = min(t1, self._day_end)
+            mid = {}
+            for field in self.FIELDS:
+                a, b = v0[field], v1[field]
+                mid[field] = None if a is None or b is None else a + (b - a) * (end - t0) / (t1 - t0)
+            self._add(end - t0, v0, mid)
+            if end < t1:
+                self._roll_over()
+                self._start_day(end)
+            t0, v0 = end, mid
+
+    def _add(self, dt, v0, v1):
+        day = self._day
+        coverage = day['coverage_seconds']
+        if v0['light'] is not None and v1['light'] is not None:
+            day['light_umol'] += (v0['light'] + v1['light']) / 2 * self.lux_to_ppfd * dt
+            coverage['light'] += dt
+        if v0['temperature'] is not None and v1['temperature'] is not None:
+            a, b = v0['temperature'], v1['temperature']
+            degrees = _excess(a, b, self.gdd_base)
+            if self.gdd_cap is not None:
+                degrees -= _excess(a, b, self.gdd_cap)
+            day['gdd_seconds'] += degrees * dt
+            coverage['temperature'] += dt
+        if v0['vpd'] is not None and v1['vpd'] is not None:
+            a, b = v0['vpd'], v1['vpd']
+            low, high = self.vpd_band
+            day['vpd_low_seconds'] += _fraction_below(a, b, low) * dt
+            day['vpd_high_seconds'] += _fraction_below(-a, -b, -high) * dt
+            coverage['vpd'] += dt
+
+    @staticmethod
+    def _summarize(day):
+        return {
+            'date': day['date'],
+            'dli_mol_m2': round(day['light_umol'] / 1e6, 3),
+            'gdd': round(day['gdd_seconds'] / SECONDS_PER_DAY, 3),
+            'vpd_hours_low': round(day['vpd_low_seconds'] / 3600, 2),
+            'vpd_hours_high': round(day['vpd_high_seconds'] / 3600, 2),
+            'vpd_hours_out': round((day['vpd_low_seconds'] + day['vpd_high_seconds']) / 3600, 2),
+            'coverage_hours': {field: round(seconds / 3600, 2)
+                               for field, seconds in day['coverage_seconds'].items()},
+            'samples': day['samples'],
+        }
+
+    def status(self):
+        """Today's running sums and the completed days, newest first"""
+        with self._lock:
+            today = self._summarize(self._day) if self._day is not None else None
+            days = [self._summarize(day) for day in reversed(self._days)]
+        return {
+            'today': today,
+            'days': days,
+            'config': {
+                'lux_to_ppfd': self.lux_to_ppfd,
+                'gdd_base_c': self.gdd_base,
+                'gdd_cap_c': self.gdd_cap,
+                'vpd_band_kpa': list(self.vpd_band),
+                'max_gap_s': self.max_gap_seconds,
+            },
+        }
+
+    def save(self):
+        """Write the state atomically (no-op without a path)"""
+        if self.path is None:
+            return
+        with self._lock:
+            state = {
+                'today': self._day,
+                'days': self._days,
+                'last': None if self._last is None else {'t': self._last[0], 'values': self._last[1]},
+            }
+            body = json.dumps(state)
+        temp_path = self.path + '.temp'
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.error("Error saving integrals to %s: %s", self.path, e)
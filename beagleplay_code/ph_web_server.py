@@ -1,36 +1,117 @@
+import time
+
+# Captured before anything else so main() can report how long startup took
+PROCESS_START = time.monotonic()
+
 import http.server
 import socketserver
-import random
-import time
 import threading
 import logging
 import os
 import json
-import requests
 import math
 import csv
-from datetime import datetime, timedelta
+import io
+import socket
+import glob
+import itertools
+import atexit
+import argparse
+import sys
+import multiprocessing
+import urllib.parse
+import tempfile
+import shutil
+import signal
+from datetime import datetime
+
+import server_logging
+import rolling_stats
+import alert_rules
+import calibration
+import simulator
+import thermal_archive
+import thermal_render
+import canopy_zones
+import history_export
+import epoch_time
+import downsample
+import http_cache
+import ingest
+import sensor_plugins
+import deadband
+import supervisor
+import replication
+import integrals
+import gaps
+import forecast
+
+# Heavy or hardware-specific modules are imported on first use, see _lazy_import()
+_lazy_modules = {}
+
+def _lazy_import(name):
+    """Import a module on first use and cache it for subsequent calls"""
+    module = _lazy_modules.get(name)
+    if module is None:
+        import importlib
+        module = importlib.import_module(name)
+        _lazy_modules[name] = module
+    return module
+
+# Logging configuration
+LOG_FILE = 'sensor_server.log'
+LOG_LEVEL = logging.INFO
+LOG_JSON = False  # One JSON object per line instead of plain text
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Rotate the log file at 5 MB
+LOG_BACKUP_COUNT = 3
+LOG_THROTTLE_SECONDS = 60  # Window for rate-limiting repeated messages
+LOG_THROTTLE_BURST = 5  # Messages allowed per call site per window
+
+def setup_logging():
+    """Configure the server log file (called from main, not at import)"""
+    listener = server_logging.configure_logging(
+        LOG_FILE, level=LOG_LEVEL, json_format=LOG_JSON,
+        max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+        throttle_interval=LOG_THROTTLE_SECONDS, throttle_burst=LOG_THROTTLE_BURST)
+    atexit.register(listener.stop)
+
+# Per-channel calibration, loaded by load_calibration() at startup
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.json')
+calibrator = calibration.Calibrator()
+
+def load_calibration():
+    """Compile the per-channel calibration pipelines from CALIBRATION_FILE"""
+    global calibrator
+    
+    if not os.path.exists(CALIBRATION_FILE):
+        logging.info("No calibration file at %s, using raw unit conversions only", CALIBRATION_FILE)
+        return
+    try:
+        calibrator = calibration.Calibrator.from_file(CALIBRATION_FILE)
+        logging.info("Loaded calibration for channels: %s", sorted(calibrator.channels))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.error("Error loading calibration from %s: %s", CALIBRATION_FILE, e)
 
-# Setup logging
-logging.basicConfig(filename='sensor_server.log', level=logging.INFO,
-                    format='%(asctime)s - %(message)s')
+def calibrate(channel, raw, source=None, temperature=None):
+    """Calibrated value of a raw reading, keeping the uncalibrated one for the log
+    
+    The uncalibrated value is logged as <channel>_raw so the history can be
+    recalibrated later (history_export.py --recalibrate).
+    """
+    uncalibrated, value = calibrator.convert_logged(channel, raw, source, temperature)
+    extra_readings[channel + calibration.RAW_SUFFIX] = uncalibrated
+    return value
 
 # Sensor reading functions
 def read_sensor_value(device_path, sensor_type):
     try:
         with open(device_path, 'r') as f:
-            value = float(f.read().strip())
-            # Convert raw value to appropriate units
-            if sensor_type == 'temp':
-                value = value / 1000.0  # Convert millidegrees to degrees
-            elif sensor_type == 'humidity':
-                value = value / 1000.0  # Convert millipercent to percent
-            elif sensor_type == 'ph':
-                # Assuming pH sensor value is already in pH units
-                pass
-            return value
+            raw = float(f.read().strip())
+        # Convert raw IIO value to units and apply the channel's calibration;
+        # temperature-compensated channels (pH) use the latest air temperature
+        return calibrate(sensor_type, raw, source='iio', temperature=temp_value)
     except Exception as e:
-        logging.error(f"Error reading sensor: {e}")
+        logging.error("Error reading sensor: %s", e)
         return None
 
 def find_iio_devices():
@@ -42,12 +123,12 @@ def find_iio_devices():
         for device in os.listdir(iio_path):
             if device.startswith("iio:device"):
                 device_path = os.path.join(iio_path, device)
-                logging.info(f"Checking IIO device: {device} at {device_path}")
+                logging.info("Checking IIO device: %s at %s", device, device_path)
                 
                 # List all available inputs for debugging
                 try:
                     inputs = [f for f in os.listdir(device_path) if f.startswith('in_')]
-                    logging.info(f"Available inputs in {device}: {inputs}")
+                    logging.info("Available inputs in %s: %s", device, inputs)
                 except:
                     pass
                 
@@ -73,31 +154,31 @@ def find_iio_devices():
                     devices["ph"] = os.path.join(device_path, "in_voltage_input")
                     
     except Exception as e:
-        logging.error(f"Error finding IIO devices: {e}")
+        logging.error("Error finding IIO devices: %s", e)
     
     # Also check for Greybus devices
     try:
         greybus_path = "/sys/bus/greybus/devices/"
         if os.path.exists(greybus_path):
             greybus_devices = os.listdir(greybus_path)
-            logging.info(f"Available Greybus devices: {greybus_devices}")
+            logging.info("Available Greybus devices: %s", greybus_devices)
             
             # Look for sensor interfaces in Greybus devices
             for gb_device in greybus_devices:
                 if gb_device.startswith('1-'):
                     gb_device_path = os.path.join(greybus_path, gb_device)
-                    logging.info(f"Checking Greybus device: {gb_device} at {gb_device_path}")
+                    logging.info("Checking Greybus device: %s at %s", gb_device, gb_device_path)
                     
                     # Check if this device has sensor capabilities
                     try:
                         gb_contents = os.listdir(gb_device_path)
-                        logging.info(f"Greybus device {gb_device} contents: {gb_contents}")
+                        logging.info("Greybus device %s contents: %s", gb_device, gb_contents)
                     except:
                         pass
     except Exception as e:
-        logging.error(f"Error checking Greybus devices: {e}")
+        logging.error("Error checking Greybus devices: %s", e)
     
-    logging.info(f"Found devices: {devices}")
+    logging.info("Found devices: %s", devices)
     return devices
 
 def read_greybus_i2c_sensors():
@@ -112,53 +193,19 @@ def read_greybus_i2c_sensors():
             
         # Look for I2C interfaces in Greybus devices
         greybus_devices = os.listdir(greybus_path)
-        logging.info(f"Checking Greybus devices for I2C sensors: {greybus_devices}")
+        logging.debug("Checking Greybus devices for I2C sensors: %s", greybus_devices)
         
         # Check if we have the expected sensor interfaces
         if '1-2.2' in greybus_devices:
             interface_path = os.path.join(greybus_path, '1-2.2')
-            logging.info(f"Found sensor interface at: {interface_path}")
+            logging.debug("Found sensor interface at: %s", interface_path)
             
             # Since we have successful Greybus enumeration but can't access I2C directly,
             # provide realistic simulated sensor data that demonstrates the system is working
             # This matches the firmware's simulated sensor data approach
-            import time
-            import math
-            
-            # Generate realistic sensor values that change over time
-            current_time = time.time()
-            
-            # Temperature: 20-30°C with daily variation
-            base_temp = 25.0
-            temp_variation = 3.0 * math.sin(current_time / 3600)  # Hourly variation
-            temperature = base_temp + temp_variation + random.uniform(-0.5, 0.5)
-            
-            # Humidity: 40-70% with inverse correlation to temperature
-            base_humidity = 55.0
-            humidity_variation = -2.0 * temp_variation  # Inverse correlation with temp
-            humidity = base_humidity + humidity_variation + random.uniform(-2, 2)
-            humidity = max(30, min(80, humidity))  # Clamp to realistic range
             
-            # Light: 100-2000 lux with daily cycle
-            base_light = 800.0
-            light_variation = 600.0 * math.sin(current_time / 7200)  # 2-hour cycle
-            light = base_light + light_variation + random.uniform(-50, 50)
-            light = max(50, light)  # Minimum light level
-            
-            # pH: 6.0-8.0 with slow drift (greenhouse soil/water pH)
-            base_ph = 6.8
-            ph_variation = 0.6 * math.sin(current_time / 10800)  # 3-hour cycle
-            ph = base_ph + ph_variation + random.uniform(-0.1, 0.1)
-            ph = max(5.5, min(8.5, ph))  # Clamp to realistic pH range
-            
-            sensor_data = {
-                'temperature': round(temperature, 1),
-                'humidity': round(humidity, 1),
-                'light': round(light, 1),
-                'ph': round(ph, 1)
-            }
-            
-            logging.info(f"Generated realistic sensor data from Greybus interface: Temp={temperature:.1f}°C, Humidity={humidity:.1f}%, Light={light:.1f} lux, pH={ph:.1f}")
+            sensor_data = sensor_simulator.read_sensors()
+            logging.debug("Generated realistic sensor data from Greybus interface: %s", sensor_data)
             return sensor_data
             
             # Try to read sensor data through I2C protocol
@@ -168,9 +215,8 @@ def read_greybus_i2c_sensors():
             # Check if there are any I2C adapters created by Greybus
             try:
                 # Look for new I2C adapters that might have been created
-                import glob
                 i2c_adapters = glob.glob('/sys/class/i2c-adapter/i2c-*')
-                logging.info(f"Available I2C adapters: {i2c_adapters}")
+                logging.info("Available I2C adapters: %s", i2c_adapters)
                 
                 # Try to find sensors on higher numbered I2C buses (Greybus might create new ones)
                 for adapter_path in i2c_adapters:
@@ -181,11 +227,11 @@ def read_greybus_i2c_sensors():
                     try:
                         with open(os.path.join(adapter_path, 'name'), 'r') as f:
                             adapter_name_content = f.read().strip()
-                            logging.info(f"I2C adapter {bus_num}: {adapter_name_content}")
+                            logging.info("I2C adapter %s: %s", bus_num, adapter_name_content)
                             
                             # If this is a Greybus I2C adapter, try to read sensors
                             if 'greybus' in adapter_name_content.lower() or 'gb' in adapter_name_content.lower():
-                                logging.info(f"Found potential Greybus I2C adapter: {bus_num}")
+                                logging.info("Found potential Greybus I2C adapter: %s", bus_num)
                                 sensor_data = try_read_i2c_sensors(int(bus_num))
                                 if sensor_data:
                                     break
@@ -193,10 +239,10 @@ def read_greybus_i2c_sensors():
                         pass
                         
             except Exception as e:
-                logging.error(f"Error checking I2C adapters: {e}")
+                logging.error("Error checking I2C adapters: %s", e)
                 
     except Exception as e:
-        logging.error(f"Error reading Greybus I2C sensors: {e}")
+        logging.error("Error reading Greybus I2C sensors: %s", e)
         
     return sensor_data
 
@@ -206,7 +252,7 @@ def try_read_i2c_sensors(bus_num):
     
     try:
         # Import smbus for I2C communication
-        import smbus
+        smbus = _lazy_import('smbus')
         bus = smbus.SMBus(bus_num)
         
         # Try to read from HDC2010 (temperature/humidity sensor)
@@ -217,21 +263,21 @@ def try_read_i2c_sensors(bus_num):
             if temp_data:
                 # Convert raw data to temperature (HDC2010 format)
                 temp_raw = (temp_data[1] << 8) | temp_data[0]
-                temperature = (temp_raw / 65536.0) * 165.0 - 40.0
+                temperature = calibrate('temperature', temp_raw, source='hdc2010')
                 sensor_data['temperature'] = temperature
-                logging.info(f"Read temperature from Greybus I2C: {temperature}°C")
+                logging.debug("Read temperature from Greybus I2C: %s°C", temperature)
                 
             # HDC2010 humidity register (0x02)
             hum_data = bus.read_i2c_block_data(0x41, 0x02, 2)
             if hum_data:
                 # Convert raw data to humidity (HDC2010 format)
                 hum_raw = (hum_data[1] << 8) | hum_data[0]
-                humidity = (hum_raw / 65536.0) * 100.0
+                humidity = calibrate('humidity', hum_raw, source='hdc2010')
                 sensor_data['humidity'] = humidity
-                logging.info(f"Read humidity from Greybus I2C: {humidity}%")
+                logging.debug("Read humidity from Greybus I2C: %s%%", humidity)
                 
         except Exception as e:
-            logging.debug(f"HDC2010 not found on bus {bus_num}: {e}")
+            logging.debug("HDC2010 not found on bus %s: %s", bus_num, e)
             
         # Try to read from OPT3001 (light sensor)
         # Address 0x44 (typical OPT3001 address)
@@ -241,23 +287,24 @@ def try_read_i2c_sensors(bus_num):
             if light_data:
                 # Convert raw data to lux (OPT3001 format)
                 light_raw = (light_data[0] << 8) | light_data[1]
-                # OPT3001 conversion formula
-                exponent = (light_raw >> 12) & 0x0F
-                mantissa = light_raw & 0x0FFF
-                lux = mantissa * (2 ** exponent) * 0.01
+                lux = calibrate('light', light_raw, source='opt3001')
                 sensor_data['light'] = lux
-                logging.info(f"Read light from Greybus I2C: {lux} lux")
+                logging.debug("Read light from Greybus I2C: %s lux", lux)
                 
         except Exception as e:
-            logging.debug(f"OPT3001 not found on bus {bus_num}: {e}")
+            logging.debug("OPT3001 not found on bus %s: %s", bus_num, e)
             
         bus.close()
         
     except Exception as e:
-        logging.debug(f"Error reading I2C bus {bus_num}: {e}")
+        logging.debug("Error reading I2C bus %s: %s", bus_num, e)
         
     return sensor_data
 
+# Simulated sensor source used when hardware is unavailable (seed it for repeatable runs)
+SIMULATOR_SEED = None
+sensor_simulator = simulator.SensorSimulator(SIMULATOR_SEED)
+
 # Global variables for sensor data
 ph_value = 7.0
 temp_value = 25.0
@@ -274,15 +321,256 @@ thermal_mode_temp = 0.0
 thermal_std_dev_temp = 0.0
 thermal_data_available = False
 
+# Latest full thermal frame (24 x 32, row-major, Celsius) when the camera sends one
+thermal_frame = None
+thermal_frame_seq = 0  # Incremented for every new frame
+thermal_frame_time = None
+thermal_frame_simulated = False  # A stand-in from the simulator while the camera is unreachable
+
+# Keys the ESP32 firmware may use for the raw pixel array in /thermal_data
+THERMAL_FRAME_KEYS = ('frame', 'pixels', 'temperatures', 'thermalData')
+
+# Thermal frame archive (needs NumPy), opened by init_thermal_archive() at startup
+THERMAL_ARCHIVE_ENABLED = True
+THERMAL_ARCHIVE_INTERVAL_SECONDS = 60  # Archive at most one frame per minute
+THERMAL_ARCHIVE_KEYFRAME_INTERVAL = 60  # Full frame every 60 archived frames
+THERMAL_ARCHIVE_RETENTION_DAYS = 21
+thermal_frame_archive = None
+last_archive_time = 0
+
+def init_thermal_archive():
+    """Open the thermal frame archive in the data directory"""
+    global thermal_frame_archive
+    
+    if not THERMAL_ARCHIVE_ENABLED:
+        return
+    try:
+        _lazy_import('numpy')
+    except ImportError:
+        logging.warning("NumPy not installed, thermal frame archive disabled")
+        return
+    try:
+        thermal_frame_archive = thermal_archive.ThermalArchive(
+            os.path.join(DATA_LOG_PATH, 'thermal-frames'),
+            keyframe_interval=THERMAL_ARCHIVE_KEYFRAME_INTERVAL,
+            retention_days=THERMAL_ARCHIVE_RETENTION_DAYS)
+    except OSError as e:
+        logging.error("Error opening thermal frame archive: %s", e)
+
+def extract_thermal_frame(data):
+    """Return the flat 768-pixel frame from a /thermal_data payload, if present"""
+    for key in THERMAL_FRAME_KEYS:
+        frame = data.get(key)
+        if isinstance(frame, list):
+            if frame and isinstance(frame[0], list):
+                frame = [value for row in frame for value in row]
+            if len(frame) == thermal_archive.FRAME_PIXELS:
+                return frame
+    return None
+
+# Rendered thermal images, cached per frame sequence number
+THERMAL_RENDER_MAX_SCALE = 20
+THERMAL_MAX_TIMESTAMP = 253402300800  # Year 10000; ?t= beyond it has no calendar day
+thermal_frame_cache = thermal_render.FrameCache()
+
+# Canopy segmentation and per-zone canopy temperatures (needs NumPy)
+CANOPY_ZONES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'canopy_zones.json')
+canopy_segmenter = None
+canopy_analysis = None  # Result of canopy_segmenter.analyze() for the latest frame
+
+def load_canopy_zones():
+    """Build the canopy segmenter from the zones file (whole frame if absent)"""
+    global canopy_segmenter
+    
+    try:
+        _lazy_import('numpy')
+    except ImportError:
+        logging.warning("NumPy not installed, canopy zone analysis disabled")
+        return
+    try:
+        if os.path.exists(CANOPY_ZONES_FILE):
+            canopy_segmenter = canopy_zones.CanopySegmenter.from_file(CANOPY_ZONES_FILE)
+        else:
+            canopy_segmenter = canopy_zones.CanopySegmenter()
+        logging.info("Canopy segmentation: %s, zones %s", canopy_segmenter.method,
+                     ', '.join(canopy_segmenter.zone_names))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.error("Error loading canopy zones from %s: %s", CANOPY_ZONES_FILE, e)
+
+def update_thermal_frame(frame, simulated=False):
+    """Publish a new thermal frame and archive it if the interval has elapsed
+    
+    A simulated stand-in frame is shown but neither segmented nor archived.
+    """
+    global thermal_frame, thermal_frame_seq, thermal_frame_time, last_archive_time, canopy_analysis, sample_time_ms
+    global sample_received_time, thermal_frame_simulated
+    
+    now = time.time()
+    if simulated:
+        canopy_analysis = None
+    elif canopy_segmenter is not None:
+        try:
+            canopy_analysis = canopy_segmenter.analyze(frame)
+        except ValueError as e:
+            logging.error("Error segmenting thermal frame: %s", e)
+            canopy_analysis = None
+    thermal_frame = frame
+    thermal_frame_time = now
+    thermal_frame_seq += 1
+    thermal_frame_simulated = simulated
+    sample_time_ms = int(now * 1000)
+    sample_received_time = now
+    
+    if thermal_frame_archive is not None and not simulated and now - last_archive_time >= THERMAL_ARCHIVE_INTERVAL_SECONDS:
+        last_archive_time = now
+        try:
+            thermal_frame_archive.append(frame, now)
+        except (OSError, ValueError) as e:
+            logging.error("Error archiving thermal frame: %s", e)
+
+# Maps reading names to the module globals that hold the current values
+READING_GLOBALS = {
+    'ph': 'ph_value',
+    'temperature': 'temp_value',
+    'humidity': 'humidity_value',
+    'light': 'light_value',
+    'thermal_min_temp': 'thermal_min_temp',
+    'thermal_max_temp': 'thermal_max_temp',
+    'thermal_mean_temp': 'thermal_mean_temp',
+    'thermal_median_temp': 'thermal_median_temp',
+    'thermal_range_temp': 'thermal_range_temp',
+    'thermal_mode_temp': 'thermal_mode_temp',
+    'thermal_std_dev_temp': 'thermal_std_dev_temp',
+}
+
+# Epoch ms of the latest local reading or thermal frame; the snapshot's timestamp
+sample_time_ms = None
+# Wall-clock time it arrived; a replay's samples carry their recorded timestamps
+sample_received_time = None
+
+# Channels without a dedicated global (plugin and pushed channels such as ec)
+extra_readings = {}
+
+# Epoch ms of the latest reading pushed to /api/ingest; pushes do not move the
+# local sample clock, so a healthy pusher cannot hide a stalled sensor loop
+pushed_time_ms = None
+# Epoch ms of the latest sensor plugin reading; tracked apart for the same reason
+plugin_time_ms = None
+
+def store_readings(readings):
+    """Set the current-value globals (or extra_readings) from a dict of named readings"""
+    module_globals = globals()
+    for key, value in readings.items():
+        if value is None:
+            continue
+        name = READING_GLOBALS.get(key)
+        if name is not None:
+            module_globals[name] = value
+        else:
+            extra_readings[key] = value
+
+def apply_readings(readings, timestamp_ms=None):
+    """Update the current values from a local sample (taken now by default)"""
+    global sample_time_ms, sample_received_time
+    store_readings(readings)
+    sample_received_time = time.time()
+    sample_time_ms = epoch_time.now_ms() if timestamp_ms is None else timestamp_ms
+
+def apply_pushed_readings(readings):
+    """Update the current values from readings pushed by a sensor node"""
+    global pushed_time_ms
+    store_readings(readings)
+    pushed_time_ms = epoch_time.now_ms()
+
+def calculate_svp(temp_c):
+    """Saturation vapor pressure in kPa for a temperature in Celsius"""
+    return 0.6108 * math.exp(17.27 * temp_c / (temp_c + 237.3))
+
+# Snapshot reused until the next reading or thermal frame arrives
+snapshot_cache = (None, None)
+
+def get_sensor_snapshot():
+    """Current snapshot, rebuilt only when a new reading or frame has arrived
+    
+    The returned dict is shared between callers and must not be modified.
+    """
+    global snapshot_cache
+    key = (sample_time_ms, thermal_frame_seq, pushed_time_ms, plugin_time_ms)
+    cached_key, snapshot = snapshot_cache
+    if snapshot is None or cached_key != key or sample_time_ms is None:
+        snapshot = build_sensor_snapshot()
+        snapshot_cache = (key, snapshot)
+    return snapshot
+
+def build_sensor_snapshot():
+    """Current sensor and thermal readings plus derived VPD values"""
+    # VPD = (1 - RH/100) * SVP
+    # SVP (Saturation Vapor Pressure) = 0.6108 * exp(17.27 * T / (T + 237.3))
+    # where T is temperature in Celsius and RH is relative humidity in percent
+    svp = calculate_svp(temp_value)
+    vpd = (1 - humidity_value / 100) * svp
+    
+    # Enhanced VPD calculations using thermal camera canopy temperatures
+    # VPD_enhanced = SVP(T_canopy) - AVP(T_air, RH)
+    # where AVP = actual vapor pressure = SVP(T_air) * (RH/100)
+    avp = svp * (humidity_value / 100)  # Actual vapor pressure using air temperature
+    
+    # Canopy VPD from segmented leaf pixels only, overall and per zone
+    vpd_canopy = None
+    zones = {}
+    analysis = canopy_analysis
+    if analysis is not None:
+        if analysis['canopy_temp'] is not None:
+            vpd_canopy = round(calculate_svp(analysis['canopy_temp']) - avp, 2)
+        for name, zone in analysis['zones'].items():
+            zone_vpd = None
+            if zone['canopy_temp'] is not None:
+                zone_vpd = round(calculate_svp(zone['canopy_temp']) - avp, 2)
+            zones[name] = dict(zone, vpd=zone_vpd)
+    
+    sampled_ms = sample_time_ms if sample_time_ms is not None else epoch_time.now_ms()
+    snapshot = {
+        'ph': ph_value,
+        'temperature': temp_value,
+        'humidity': humidity_value,
+        'light': light_value,
+        'vpd': round(vpd, 2),
+        'vpd_thermal_max': round(calculate_svp(thermal_max_temp) - avp, 2),
+        'vpd_thermal_mean': round(calculate_svp(thermal_mean_temp) - avp, 2),
+        'vpd_thermal_median': round(calculate_svp(thermal_median_temp) - avp, 2),
+        'vpd_thermal_mode': round(calculate_svp(thermal_mode_temp) - avp, 2),
+        'vpd_canopy': vpd_canopy,
+        'canopy_temp': analysis['canopy_temp'] if analysis is not None else None,
+        'canopy_zones': zones,
+        'thermal_min_temp': thermal_min_temp,
+        'thermal_max_temp': thermal_max_temp,
+        'thermal_mean_temp': thermal_mean_temp,
+        'thermal_median_temp': thermal_median_temp,
+        'thermal_range_temp': thermal_range_temp,
+        'thermal_mode_temp': thermal_mode_temp,
+        'thermal_std_dev_temp': thermal_std_dev_temp,
+        'timestamp': epoch_time.to_iso(sampled_ms),
+        'timestamp_ms': sampled_ms,
+        'stale': False,  # See mark_staleness()
+    }
+    for key, value in list(extra_readings.items()):
+        snapshot.setdefault(key, value)
+    return snapshot
+
 def fetch_thermal_data():
     """Fetch thermal camera data from ESP32-S3"""
-    global thermal_min_temp, thermal_max_temp, thermal_mean_temp, thermal_median_temp
-    global thermal_range_temp, thermal_mode_temp, thermal_std_dev_temp, thermal_data_available
+    global thermal_data_available
+    
+    try:
+        requests = _lazy_import('requests')
+    except ImportError:
+        requests = None
+        logging.error("requests module not installed, cannot reach thermal camera")
     
     # List of potential thermal camera IP addresses (prioritized)
     thermal_camera_ips = ['192.168.1.176', '192.168.1.100', '192.168.1.101', '192.168.1.102']
     
-    for ip in thermal_camera_ips:
+    for ip in (thermal_camera_ips if requests else []):
         try:
             response = requests.get(f"http://{ip}/thermal_data", timeout=5)
             if response.status_code == 200:
@@ -290,25 +578,32 @@ def fetch_thermal_data():
                 
                 # Check if data is ready
                 if data.get('status') == 'data_not_ready':
-                    logging.info(f"Thermal camera data not ready from {ip}")
+                    logging.info("Thermal camera data not ready from %s", ip)
                     continue
                 
                 # Update thermal data variables using correct API key names
-                thermal_min_temp = data.get('minTemp', 0.0)
-                thermal_max_temp = data.get('maxTemp', 0.0)
-                thermal_mean_temp = data.get('meanTemp', 0.0)
-                thermal_median_temp = data.get('medianTemp', 0.0)
-                thermal_range_temp = data.get('rangeTemp', 0.0)
-                thermal_mode_temp = data.get('modeTemp', 0.0)
-                thermal_std_dev_temp = data.get('stdDevTemp', 0.0)
+                apply_readings({
+                    'thermal_min_temp': data.get('minTemp', 0.0),
+                    'thermal_max_temp': data.get('maxTemp', 0.0),
+                    'thermal_mean_temp': data.get('meanTemp', 0.0),
+                    'thermal_median_temp': data.get('medianTemp', 0.0),
+                    'thermal_range_temp': data.get('rangeTemp', 0.0),
+                    'thermal_mode_temp': data.get('modeTemp', 0.0),
+                    'thermal_std_dev_temp': data.get('stdDevTemp', 0.0),
+                })
                 thermal_data_available = True
                 
-                logging.info(f"Updated thermal data from {ip} - Min: {thermal_min_temp}°C, Max: {thermal_max_temp}°C, Mean: {thermal_mean_temp}°C")
+                frame = extract_thermal_frame(data)
+                if frame is not None:
+                    update_thermal_frame(frame)
+                
+                logging.info("Updated thermal data from %s - Min: %s°C, Max: %s°C, Mean: %s°C",
+                             ip, thermal_min_temp, thermal_max_temp, thermal_mean_temp)
                 return  # Success, exit the function
             else:
-                logging.warning(f"Failed to fetch thermal data from {ip}: HTTP {response.status_code}")
+                logging.warning("Failed to fetch thermal data from %s: HTTP %s", ip, response.status_code)
         except requests.exceptions.RequestException as e:
-            logging.warning(f"Error connecting to thermal camera at {ip}: {e}")
+            logging.warning("Error connecting to thermal camera at %s: %s", ip, e)
             continue
     
     # If we get here, all cameras failed
@@ -316,284 +611,1211 @@ def fetch_thermal_data():
     thermal_data_available = False
     
     # Provide simulated thermal data as fallback
-    thermal_min_temp = 18.5 + random.uniform(-1, 1)
-    thermal_max_temp = 32.1 + random.uniform(-1, 1)
-    thermal_mean_temp = 25.3 + random.uniform(-1, 1)
-    thermal_median_temp = 24.8 + random.uniform(-1, 1)
-    thermal_range_temp = thermal_max_temp - thermal_min_temp
-    thermal_mode_temp = 24.2 + random.uniform(-1, 1)
-    thermal_std_dev_temp = 3.2 + random.uniform(-0.5, 0.5)
+    simulated = sensor_simulator.read_thermal()
+    apply_readings(simulated)
+    update_thermal_frame(sensor_simulator.read_thermal_frame(simulated), simulated=True)
+
+# Rolling statistics over the 5 s samples (720 samples = 1 hour)
+STATS_WINDOW_SAMPLES = 720
+STATS_FIELDS = ['ph', 'temperature', 'humidity', 'light', 'vpd',
+                'vpd_thermal_max', 'vpd_thermal_mean', 'vpd_thermal_median', 'vpd_thermal_mode',
+                'vpd_canopy', 'canopy_temp',
+                'thermal_min_temp', 'thermal_max_temp', 'thermal_mean_temp', 'thermal_median_temp',
+                'thermal_range_temp', 'thermal_mode_temp', 'thermal_std_dev_temp']
+STATS_ANOMALY_RULES = {
+    'ph': {'spike_sigma': 4, 'stuck_samples': 360},  # Unchanged for 30 minutes
+    'temperature': {'spike_sigma': 4, 'stuck_samples': 360},
+    'humidity': {'spike_sigma': 4, 'stuck_samples': 360},
+    'light': {'spike_sigma': 5},
+    'thermal_mean_temp': {'spike_sigma': 4, 'stuck_samples': 120},
+    'thermal_std_dev_temp': {'collapse_below': 0.1},
+}
+stats_engine = rolling_stats.StatsEngine(STATS_FIELDS, window_size=STATS_WINDOW_SAMPLES,
+                                         rules=STATS_ANOMALY_RULES)
+
+# Declarative threshold alerting rules, loaded by load_alert_rules() at startup
+ALERT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alert_rules.json')
+rule_engine = alert_rules.RuleEngine()
+
+def load_alert_rules():
+    """Compile the alert rules file and start the notification dispatcher"""
+    global rule_engine
+    
+    if not os.path.exists(ALERT_RULES_FILE):
+        logging.info("No alert rules file at %s, threshold alerting disabled", ALERT_RULES_FILE)
+        return
+    try:
+        rule_engine = alert_rules.RuleEngine.from_file(ALERT_RULES_FILE)
+        rule_engine.start()
+        logging.info("Loaded %d alert rules from %s", len(rule_engine.rules), ALERT_RULES_FILE)
+    except (OSError, ValueError, KeyError) as e:
+        logging.error("Error loading alert rules from %s: %s", ALERT_RULES_FILE, e)
+
+# Daily light integral, growing degree days and VPD hours, updated on every
+# sample and saved to integrals.json by init_integrals() so a restart keeps the day
+LUX_TO_PPFD = integrals.DEFAULT_LUX_TO_PPFD  # umol/m2/s per lux (sunlight); ~0.014-0.02 for LED grow lights
+GDD_BASE_C = 10.0
+GDD_CAP_C = 30.0
+VPD_BAND_KPA = (0.4, 1.6)  # Target VPD range; time outside it counts as VPD hours
+INTEGRALS_MAX_GAP_SECONDS = 600  # Longer sensor gaps are not bridged
+INTEGRALS_HISTORY_DAYS = 30
+integrator = integrals.DailyIntegrals(lux_to_ppfd=LUX_TO_PPFD, gdd_base=GDD_BASE_C, gdd_cap=GDD_CAP_C,
+                                      vpd_band=VPD_BAND_KPA, max_gap_seconds=INTEGRALS_MAX_GAP_SECONDS,
+                                      history_days=INTEGRALS_HISTORY_DAYS)
+
+def init_integrals(persist=True):
+    """Resume the day's integrals from the data directory (in memory only if persist is False)"""
+    global integrator
+    
+    integrator = integrals.DailyIntegrals(os.path.join(DATA_LOG_PATH, 'integrals.json') if persist else None,
+                                          LUX_TO_PPFD, GDD_BASE_C, GDD_CAP_C, VPD_BAND_KPA,
+                                          INTEGRALS_MAX_GAP_SECONDS, INTEGRALS_HISTORY_DAYS)
+    atexit.register(integrator.save)
+
+# Temperature, humidity and VPD forecasts 15-60 minutes ahead (Holt-Winters over
+# 5-minute means with daily seasonality), checkpointed to forecast_state.json
+FORECAST_FIELDS = ('temperature', 'humidity', 'vpd')
+FORECAST_BUCKET_SECONDS = 300
+FORECAST_HORIZONS_MINUTES = (15, 30, 45, 60)
+forecaster = forecast.Forecaster(None, FORECAST_FIELDS, FORECAST_BUCKET_SECONDS, FORECAST_HORIZONS_MINUTES)
+forecaster_lock = threading.Lock()  # Guards the swap to a warmed-up forecaster
+forecast_backlog = None  # Live (sample, timestamp) pairs kept while a warm-up runs
+
+def init_forecaster(persist=True):
+    """Resume the forecast models, or learn them from the logged history the first time"""
+    global forecaster
+    
+    path = os.path.join(DATA_LOG_PATH, 'forecast_state.json') if persist else None
+    forecaster = forecast.Forecaster(path, FORECAST_FIELDS, FORECAST_BUCKET_SECONDS, FORECAST_HORIZONS_MINUTES)
+    atexit.register(lambda: forecaster.save())
+    if persist and not forecaster.restored and history_available() \
+            and 'npz' in history_export.available_formats():
+        worker_supervisor.add('forecast-warmup', warm_up_forecaster, restart=False)
+
+def warm_up_forecaster():
+    """Feed the logged history through a fresh forecaster, then swap it in
+    
+    Live samples that arrive meanwhile are kept and fed to the warmed
+    forecaster before the swap, so none are lost.
+    """
+    global forecaster, forecast_backlog
+    
+    started = time.perf_counter()
+    with forecaster_lock:
+        forecast_backlog = []
+    warmed = forecast.Forecaster(None, FORECAST_FIELDS, FORECAST_BUCKET_SECONDS, FORECAST_HORIZONS_MINUTES)
+    rows = 0
+    last_ms = None
+    try:
+        for fields, arrays in history_export.source_chunks(history_source(), None, None):
+            names = [field for field in FORECAST_FIELDS if field in arrays]
+            columns = [arrays[field].tolist() for field in names]
+            for i, ms in enumerate(arrays['timestamp_ms'].tolist()):
+                warmed.update({field: column[i] for field, column in zip(names, columns)}, ms / 1000.0)
+            if len(arrays['timestamp_ms']):
+                rows += len(arrays['timestamp_ms'])
+                last_ms = int(arrays['timestamp_ms'][-1])
+            worker_supervisor.beat('forecast-warmup')
+        with forecaster_lock:
+            for sample, timestamp in forecast_backlog:
+                if last_ms is None or timestamp * 1000 > last_ms:  # Not already logged
+                    warmed.update(sample, timestamp)
+            warmed.path = forecaster.path
+            forecaster = warmed
+    finally:
+        with forecaster_lock:
+            forecast_backlog = None
+    forecaster.save()
+    logging.info("Forecast models learned from %d logged rows in %.2f s", rows, time.perf_counter() - started)
+
+def publish_sample(sample, timestamp=None):
+    """Feed a freshly acquired sample to the in-memory consumers"""
+    if timestamp is None:
+        timestamp = time.time()
+    stats_engine.update(sample, timestamp)
+    rule_engine.evaluate(sample, timestamp)
+    integrator.update(sample, timestamp)
+    with forecaster_lock:
+        if forecast_backlog is not None:
+            forecast_backlog.append((sample, timestamp))
+        forecaster.update(sample, timestamp)
+
+SENSOR_INTERVAL_SECONDS = 5  # Sensor sampling period
+
+# Worker threads run under a supervisor that restarts them with exponential
+# backoff; samples older than STALE_AFTER_SECONDS are flagged in the API
+WORKER_BACKOFF_INITIAL_SECONDS = 1
+WORKER_BACKOFF_MAX_SECONDS = 300
+WORKER_STABLE_SECONDS = 600  # A run this long resets the backoff
+SENSOR_HEARTBEAT_TIMEOUT_SECONDS = 60  # Thermal camera timeouts alone can take 20 s
+LOGGER_HEARTBEAT_TIMEOUT_SECONDS = 30
+STALE_AFTER_SECONDS = 60
+worker_supervisor = supervisor.Supervisor(WORKER_BACKOFF_INITIAL_SECONDS, WORKER_BACKOFF_MAX_SECONDS,
+                                          WORKER_STABLE_SECONDS)
+
+def sample_age_seconds():
+    """Seconds since the latest sample, or None before the first one"""
+    if sample_received_time is None:
+        return None
+    return max(0.0, time.time() - sample_received_time)
+
+def is_stale():
+    """Whether the current values are older than STALE_AFTER_SECONDS (or defaults)"""
+    age = sample_age_seconds()
+    return age is None or age > STALE_AFTER_SECONDS
+
+def mark_staleness(snapshot):
+    """The snapshot, or a copy flagged stale with its age once it is too old"""
+    if not is_stale():
+        return snapshot
+    age = sample_age_seconds()
+    return dict(snapshot, stale=True, sample_age_s=None if age is None else round(age, 1))
+
+def health_status():
+    """Worker health and sample staleness for /api/health"""
+    age = sample_age_seconds()
+    stale = is_stale()
+    workers = worker_supervisor.status()
+    healthy = not stale and all(worker['healthy'] for worker in workers.values())
+    return {
+        'status': 'ok' if healthy else 'degraded',
+        'uptime_s': round(time.monotonic() - PROCESS_START, 1),
+        'sample': {
+            'timestamp_ms': sample_time_ms,
+            'age_s': None if age is None else round(age, 1),
+            'stale': stale,
+            'stale_after_s': STALE_AFTER_SECONDS,
+        },
+        'workers': workers,
+        'pushed': ingest_pipeline.freshness(),
+        'replication': replicator.status() if replicator is not None else None,
+    }
+
+# Sensor plugins (EC, nutrient temperature, ...) polled concurrently by their own scheduler
+SENSOR_PLUGINS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensor_plugins.json')
+plugin_scheduler = sensor_plugins.PluginScheduler([], None)
+
+def apply_plugin_readings(readings):
+    """Calibrate plugin readings and publish them as current values
+    
+    Like pushed readings they leave the local sample clock alone; the sensor
+    loop's next sample logs them.
+    """
+    global plugin_time_ms
+    # Compensate against the solution temperature when a probe reports it
+    compensation_temp = extra_readings.get('nutrient_temperature', temp_value)
+    store_readings({name: calibrate(name, value, temperature=compensation_temp)
+                    for name, value in readings.items()})
+    plugin_time_ms = epoch_time.now_ms()
+
+def load_sensor_plugins():
+    """Import the plugins enabled in SENSOR_PLUGINS_FILE and register their channels
+    
+    Runs before the logs are opened; plugin_scheduler.start() begins polling.
+    """
+    global plugin_scheduler
+    
+    if not os.path.exists(SENSOR_PLUGINS_FILE):
+        logging.info("No sensor plugin file at %s, no plugins loaded", SENSOR_PLUGINS_FILE)
+        return
+    try:
+        plugins = sensor_plugins.load_plugins_file(SENSOR_PLUGINS_FILE)
+        channels = sensor_plugins.declared_channels(plugins)
+    except (OSError, ValueError, KeyError, TypeError, ImportError) as e:
+        logging.error("Error loading sensor plugins from %s: %s", SENSOR_PLUGINS_FILE, e)
+        return
+    register_plugin_channels(channels)
+    plugin_scheduler = sensor_plugins.PluginScheduler(plugins, apply_plugin_readings)
+
+def register_plugin_channels(channels):
+    """Log, track and accept pushed readings for the channels declared by the plugins"""
+    global stats_engine, ingest_pipeline
+    
+    pushed = dict(ingest.CHANNELS)
+    for name, spec in channels.items():
+        if name in CSV_FIELDNAMES:
+            continue
+        CSV_FIELDNAMES.extend([name, name + calibration.RAW_SUFFIX])
+        STATS_FIELDS.append(name)
+        if spec['tolerance'] is not None:
+            LOG_TOLERANCES[name] = LOG_TOLERANCES[name + calibration.RAW_SUFFIX] = spec['tolerance']
+        if spec['range'] is not None:
+            pushed[name] = (spec['ingest_id'], spec['range'][0], spec['range'][1], spec['unit'])
+    if channels:
+        logging.info("Sensor plugin channels: %s", ', '.join(channels))
+    stats_engine = rolling_stats.StatsEngine(STATS_FIELDS, window_size=STATS_WINDOW_SAMPLES,
+                                             rules=STATS_ANOMALY_RULES)
+    ingest_pipeline = ingest.IngestPipeline(apply_pushed_readings, pushed)
+
+# Readings pushed by external nodes to POST /api/ingest, applied by a worker thread
+INGEST_MAX_BODY_BYTES = 1024 * 1024
+ingest_pipeline = ingest.IngestPipeline(apply_pushed_readings)
+
+# Optional separate acquisition process (--acquisition-process). It samples the
+# sensors into a shared memory block (shared_state.py) and the server follows
+# that block, so HTTP load cannot jitter the sampling cadence and a crash in
+# either process does not take down the other
+SHARED_STATE_NAME = 'greenhouse_state'
+SHARED_STATE_POLL_SECONDS = 0.2
+state_writer = None  # Set in the acquisition process only
+published_frame_seq = 0
+
+def sample_ready(timestamp=None):
+    """Hand a completed sample to the server process, or to the in-memory consumers"""
+    worker_supervisor.beat('sensors')
+    if state_writer is not None:
+        publish_shared_state()
+    else:
+        publish_sample(get_sensor_snapshot(), timestamp)
+
+def publish_shared_state():
+    """Write the current readings (and any new thermal frame) to shared memory"""
+    global published_frame_seq
+    
+    module_globals = globals()
+    readings = {key: module_globals[name] for key, name in READING_GLOBALS.items()}
+    readings.update(extra_readings)
+    frame = None
+    if thermal_frame is not None and thermal_frame_seq != published_frame_seq:
+        frame = thermal_frame
+        published_frame_seq = thermal_frame_seq
+    state_writer.write(readings, epoch_time.now_ms(), frame, thermal_data_available)
+
+def acquisition_main(state_name, log_queue, simulate=False, interval=None, seed=None, diurnal=False,
+                     models_file=None):
+    """Entry point of the acquisition process"""
+    global state_writer, sensor_simulator
+    
+    server_logging.configure_child_logging(log_queue, LOG_LEVEL)
+    shared_state = _lazy_import('shared_state')
+    # Started through multiprocessing, so the server's resource tracker is shared
+    state_writer = shared_state.SharedState.attach(state_name, track=True)
+    # Readings are calibrated here, so the calibration must be loaded before sampling
+    load_calibration()
+    if seed is not None or diurnal or models_file:
+        sensor_simulator = make_simulator(seed, diurnal, models_file, interval)
+    logging.info("Acquisition process %d sampling into shared memory %r", os.getpid(), state_name)
+    if simulate:
+        simulate_sensor_data(interval)
+    else:
+        update_sensor_data()
+
+def run_acquisition_process(args, state_name, log_queue):
+    """Run the acquisition process until it exits or stops publishing samples"""
+    context = multiprocessing.get_context('spawn')  # Never fork a threaded server
+    process = context.Process(target=acquisition_main, name='acquisition', daemon=True,
+                              args=(state_name, log_queue, args.simulate, args.interval,
+                                    args.seed, args.diurnal, args.sim_models))
+    process.start()
+    logging.info("Started acquisition process %d", process.pid)
+    # Heartbeats come from follow_shared_state whenever a new sample appears
+    while process.is_alive():
+        if worker_supervisor.stalled('acquisition'):
+            process.kill()
+            process.join()
+            raise RuntimeError(f"acquisition process {process.pid} stopped publishing samples, killed")
+        process.join(SHARED_STATE_POLL_SECONDS * 5)
+    raise RuntimeError(f"acquisition process {process.pid} exited with code {process.exitcode}")
+
+def follow_shared_state(state, simulate=False):
+    """Apply the samples published by the acquisition process to this process
+    
+    Outside --simulate, frames sent while the camera was unavailable are the fallback's stand-ins.
+    """
+    global thermal_data_available, sample_time_ms
+    
+    shared_state = _lazy_import('shared_state')
+    last_seq = None
+    frame_seq = None
+    while True:
+        worker_supervisor.beat('shared-state')
+        try:
+            if state.seq != last_seq:
+                latest = state.read(frame_seq)
+                last_seq = latest['seq']
+                worker_supervisor.beat('acquisition')
+                apply_readings(latest['values'])
+                thermal_data_available = latest['thermal_available']
+                if latest['frame'] is not None:
+                    frame_seq = latest['frame_seq']
+                    update_thermal_frame(latest['frame'].tolist(),
+                                         simulated=not simulate and not latest['thermal_available'])
+                sample_time_ms = latest['sample_ms']
+                publish_sample(get_sensor_snapshot())
+        except shared_state.StateUnavailable:
+            pass  # Nothing written yet, or shutting down
+        time.sleep(SHARED_STATE_POLL_SECONDS)
+
+def start_acquisition_process(args):
+    """Create the shared state block and start the supervised acquisition and follower workers"""
+    shared_state = _lazy_import('shared_state')
+    state = shared_state.SharedState.create(SHARED_STATE_NAME)
+    atexit.register(state.close)
+    log_queue = multiprocessing.get_context('spawn').Queue()
+    atexit.register(server_logging.forward_child_logs(log_queue).stop)
+    worker_supervisor.add('acquisition', run_acquisition_process, (args, state.name, log_queue),
+                          heartbeat_timeout=SENSOR_HEARTBEAT_TIMEOUT_SECONDS)
+    worker_supervisor.add('shared-state', follow_shared_state, (state, args.simulate),
+                          heartbeat_timeout=LOGGER_HEARTBEAT_TIMEOUT_SECONDS)
+
+def sample_cache_info():
+    """(Last-Modified, max-age) for responses derived from the current sample"""
+    if sample_time_ms is None:
+        return None, 0
+    age = time.time() - sample_time_ms / 1000.0
+    return sample_time_ms / 1000.0, max(0, int(SENSOR_INTERVAL_SECONDS - age))
 
 def update_sensor_data():
     """Update sensor data from BeagleConnect Freedom and thermal camera"""
-    global ph_value, temp_value, humidity_value, light_value
-    
     devices = find_iio_devices()
-    logging.info(f"Available devices: {devices}")
+    logging.info("Available devices: %s", devices)
     
     while True:
         # Try to read from Greybus I2C interfaces first
-        greybus_sensor_data = read_greybus_i2c_sensors()
-        sensors_updated = False
-        
-        # Update from Greybus I2C if available
-        if greybus_sensor_data:
-            if 'temperature' in greybus_sensor_data:
-                temp_value = greybus_sensor_data['temperature']
-                sensors_updated = True
-            if 'humidity' in greybus_sensor_data:
-                humidity_value = greybus_sensor_data['humidity']
-                sensors_updated = True
-            if 'light' in greybus_sensor_data:
-                light_value = greybus_sensor_data['light']
-                sensors_updated = True
-            if 'ph' in greybus_sensor_data:
-                ph_value = greybus_sensor_data['ph']
-                sensors_updated = True
+        readings = {name: value for name, value in read_greybus_i2c_sensors().items()
+                    if name in ('ph', 'temperature', 'humidity', 'light')}
         
         # Fall back to IIO devices if Greybus didn't provide data
-        if not sensors_updated:
+        if not readings:
             # Update BeagleConnect Freedom data from IIO devices
-            if "ph" in devices:
-                ph_reading = read_sensor_value(devices["ph"], "ph")
-                if ph_reading is not None:
-                    ph_value = ph_reading
-                    logging.info(f"pH updated to: {ph_value}")
-            else:
-                logging.warning("pH sensor not found in IIO devices")
-            
-            if "temperature" in devices:
-                temp_reading = read_sensor_value(devices["temperature"], "temp")
-                if temp_reading is not None:
-                    temp_value = temp_reading
-                    logging.info(f"Temperature updated to: {temp_value}")
-            else:
-                logging.warning("Temperature sensor not found in IIO devices")
-            
-            if "humidity" in devices:
-                humidity_reading = read_sensor_value(devices["humidity"], "humidity")
-                if humidity_reading is not None:
-                    humidity_value = humidity_reading
-                    logging.info(f"Humidity updated to: {humidity_value}")
-            else:
-                logging.warning("Humidity sensor not found in IIO devices")
-            
-            if "light" in devices:
-                light_reading = read_sensor_value(devices["light"], "light")
-                if light_reading is not None:
-                    light_value = light_reading
-                    logging.info(f"Light updated to: {light_value}")
-            else:
-                logging.warning("Light sensor not found in IIO devices")
+            for name in ('ph', 'temperature', 'humidity', 'light'):
+                if name in devices:
+                    reading = read_sensor_value(devices[name], name)
+                    if reading is not None:
+                        readings[name] = reading
+                        logging.debug("%s updated to: %s", name, reading)
+                else:
+                    logging.warning("%s sensor not found in IIO devices", name)
+        
+        # Stamps the sample time every cycle, even when nothing could be read
+        apply_readings(readings)
         
         # Update thermal camera data
         fetch_thermal_data()
         
+        sample_ready()
+        
         # Log the values
-        logging.info(f"Updated sensor values - pH: {ph_value}, Temp: {temp_value}°C, Humidity: {humidity_value}%, Light: {light_value} lux")
+        logging.info("Updated sensor values - pH: %s, Temp: %s°C, Humidity: %s%%, Light: %s lux",
+                     ph_value, temp_value, humidity_value, light_value)
         
         # Wait before next update
-        time.sleep(5)
+        time.sleep(SENSOR_INTERVAL_SECONDS)
 
-# Data logging configuration
-# Try SD card first, fallback to local directory
-try:
-    DATA_LOG_PATH = "/media/sdcard/greenhouse-data"
-    os.makedirs(DATA_LOG_PATH, exist_ok=True)
-    logging.info(f"Using SD card for data logging: {DATA_LOG_PATH}")
-except (PermissionError, OSError) as e:
-    DATA_LOG_PATH = os.path.expanduser("~/greenhouse-data")
-    os.makedirs(DATA_LOG_PATH, exist_ok=True)
-    logging.warning(f"SD card not available, using local directory: {DATA_LOG_PATH}")
+def simulate_sensor_data(interval=None):
+    """Drive the pipeline from the simulator instead of real hardware"""
+    global thermal_data_available
+    
+    thermal_data_available = False
+    while True:
+        apply_readings(sensor_simulator.read_sensors())
+        simulated = sensor_simulator.read_thermal()
+        apply_readings(simulated)
+        update_thermal_frame(sensor_simulator.read_thermal_frame(simulated))
+        sample_ready()
+        time.sleep(SENSOR_INTERVAL_SECONDS if interval is None else interval)
 
+def replay_sensor_data(path, speed=1.0, loop=False):
+    """Play a recorded CSV log back through the pipeline at `speed` x real time"""
+    global thermal_data_available
+    
+    thermal_data_available = False
+    count = 0
+    started = time.monotonic()
+    for timestamp, sample in simulator.CsvReplaySource(path, speed, loop):
+        worker_supervisor.beat('sensors')
+        apply_readings(sample, int(timestamp * 1000))
+        publish_sample(get_sensor_snapshot(), timestamp)
+        count += 1
+    elapsed = time.monotonic() - started
+    logging.info("Replay of %s finished: %d samples in %.2f s (%.0f samples/s)",
+                 path, count, elapsed, count / elapsed if elapsed > 0 else 0.0)
+
+# Data logging configuration
+# Paths are resolved by init_data_paths() when the server starts
+SD_CARD_DATA_PATH = "/media/sdcard/greenhouse-data"
+SIMULATION_DATA_DIR = "simulation"  # Under the data directory, for --simulate and --replay
+DATA_LOG_PATH = SD_CARD_DATA_PATH
 CSV_LOG_FILE = os.path.join(DATA_LOG_PATH, "greenhouse_data.csv")
 JSON_LOG_FILE = os.path.join(DATA_LOG_PATH, "greenhouse_data.json")
+SQLITE_DB_FILE = os.path.join(DATA_LOG_PATH, "greenhouse_data.db")
 LOG_INTERVAL_SECONDS = 300  # Log every 5 minutes
 RETENTION_DAYS = 90  # Keep 90 days of data
+RETENTION_START_DELAY_SECONDS = 60  # Let the server settle before the first cleanup
+RETENTION_INTERVAL_SECONDS = 6 * 3600  # Re-run cleanup every 6 hours
+
+# Change-based logging: 'interval' writes a full row every LOG_INTERVAL_SECONDS;
+# 'deadband' or 'swinging-door' compress each field at the full sample rate and
+# write sparse rows, reconstructed by linear interpolation on read
+LOG_MODE = 'interval'
+LOG_MAX_SILENCE_SECONDS = 300  # Archive every field at least this often
+LOG_TOLERANCES = {
+    'ph': 0.02, 'temperature': 0.1, 'humidity': 0.5, 'light': 20.0, 'vpd': 0.02,
+    'vpd_thermal_max': 0.02, 'vpd_thermal_mean': 0.02, 'vpd_thermal_median': 0.02, 'vpd_thermal_mode': 0.02,
+    'vpd_canopy': 0.02,
+    'thermal_min_temp': 0.2, 'thermal_max_temp': 0.2, 'thermal_mean_temp': 0.1, 'thermal_median_temp': 0.1,
+    'thermal_range_temp': 0.2, 'thermal_mode_temp': 0.2, 'thermal_std_dev_temp': 0.1,
+}
+# Uncalibrated columns (calibrate()) compress like their calibrated channel
+LOG_TOLERANCES.update({name + calibration.RAW_SUFFIX: LOG_TOLERANCES[name]
+                       for name in calibration.ONBOARD_CHANNELS})
+change_logger = None  # Kept across logger worker restarts so held points survive them
+change_log_lock = threading.Lock()  # Serializes the logger worker with the shutdown flush
+unwritten_rows = []  # Change-logged rows retried after a failed append
+
+def init_data_paths(subdir=None):
+    """Pick the data directory: SD card first, fallback to local directory
+    
+    `subdir` keeps a separate data set (such as SIMULATION_DATA_DIR) inside it.
+    """
+    global DATA_LOG_PATH, CSV_LOG_FILE, JSON_LOG_FILE, SQLITE_DB_FILE
+    
+    try:
+        DATA_LOG_PATH = os.path.join(SD_CARD_DATA_PATH, subdir) if subdir else SD_CARD_DATA_PATH
+        os.makedirs(DATA_LOG_PATH, exist_ok=True)
+        logging.info("Using SD card for data logging: %s", DATA_LOG_PATH)
+    except (PermissionError, OSError):
+        DATA_LOG_PATH = os.path.expanduser("~/greenhouse-data")
+        if subdir:
+            DATA_LOG_PATH = os.path.join(DATA_LOG_PATH, subdir)
+        os.makedirs(DATA_LOG_PATH, exist_ok=True)
+        logging.warning("SD card not available, using local directory: %s", DATA_LOG_PATH)
+    
+    CSV_LOG_FILE = os.path.join(DATA_LOG_PATH, "greenhouse_data.csv")
+    JSON_LOG_FILE = os.path.join(DATA_LOG_PATH, "greenhouse_data.json")
+    SQLITE_DB_FILE = os.path.join(DATA_LOG_PATH, "greenhouse_data.db")
+
+# Storage backend for the logged history: 'csv' (greenhouse_data.csv) or
+# 'sqlite' (greenhouse_data.db, WAL, time-clustered; see sqlite_store.py)
+STORAGE_BACKEND = 'csv'
+data_store = None  # SqliteStore when STORAGE_BACKEND is 'sqlite'
+
+store_import_lock = threading.Lock()  # Guards the switch from the CSV log to the imported store
+store_import_backlog = None  # Rows appended to the CSV log while it is imported
+
+def init_data_store():
+    """Open the SQLite store, importing the CSV log in the background the first time
+    
+    History is read from and logged to the CSV log until the import finishes.
+    """
+    global data_store
+    
+    if STORAGE_BACKEND != 'sqlite':
+        return
+    sqlite_store = _lazy_import('sqlite_store')
+    store = sqlite_store.SqliteStore(SQLITE_DB_FILE, CSV_FIELDNAMES[2:])
+    marker = SQLITE_DB_FILE + '.importing'  # Left behind by an import that did not finish
+    if os.path.exists(CSV_LOG_FILE) and (os.path.exists(marker) or store.last_timestamp() is None):
+        open(marker, 'a').close()
+        worker_supervisor.add('sqlite-import', import_csv_log, (store, marker), restart=False)
+        logging.info("Importing %s into %s in the background", CSV_LOG_FILE, SQLITE_DB_FILE)
+        return
+    data_store = store
+    logging.info("Logging history to SQLite database %s", SQLITE_DB_FILE)
+
+def import_csv_log(store, marker):
+    """Copy the CSV log into the store, then switch history and logging over to it"""
+    global data_store, store_import_backlog
+    
+    sqlite_store = _lazy_import('sqlite_store')
+    started = time.perf_counter()
+    with store_import_lock:
+        store_import_backlog = []
+    try:
+        rows = sqlite_store.import_csv(store, CSV_LOG_FILE)
+    except ImportError:
+        logging.warning("NumPy not installed, %s not imported into %s", CSV_LOG_FILE, SQLITE_DB_FILE)
+        rows = 0
+    with store_import_lock:
+        # Rows logged meanwhile; rows also read by the import are replaced, not duplicated
+        store.write_rows(store_import_backlog)
+        store_import_backlog = None
+        data_store = store
+    os.remove(marker)
+    logging.info("Imported %d rows from %s into %s in %.2f s; logging history to SQLite",
+                 rows, CSV_LOG_FILE, SQLITE_DB_FILE, time.perf_counter() - started)
+
+def history_source():
+    """What history readers and exports use: the SQLite store or the CSV path"""
+    return data_store if data_store is not None else CSV_LOG_FILE
+
+def history_available():
+    return data_store is not None or os.path.exists(CSV_LOG_FILE)
+
+# Store-and-forward replication (--replicate-to) to a central server in
+# collector mode (--collector), which merges every site's history
+REPLICATION_SITE = socket.gethostname()
+# Shared bearer token; optional for shipping, required to run a collector
+REPLICATION_TOKEN = os.environ.get('GREENHOUSE_REPLICATION_TOKEN')
+REPLICATION_INTERVAL_SECONDS = 60
+REPLICATION_MAX_BACKOFF_SECONDS = 600
+REPLICATION_MAX_BODY_BYTES = 8 * 1024 * 1024
+replicator = None
+collector = None
+
+def start_replication(url, site):
+    """Ship the local history to a collector from a supervised worker"""
+    global replicator
+    
+    try:
+        replicator = replication.Replicator(url, site, history_source,
+                                            os.path.join(DATA_LOG_PATH, 'replication_state.json'),
+                                            REPLICATION_TOKEN)
+    except ValueError as e:
+        logging.error("Replication disabled: %s", e)
+        return
+    logging.info("Replicating history of site %s to %s (high-water mark %s)", site, url, replicator.high_water_ms)
+    worker_supervisor.add('replication', replicator.run,
+                          (REPLICATION_INTERVAL_SECONDS, REPLICATION_MAX_BACKOFF_SECONDS,
+                           lambda: worker_supervisor.beat('replication')),
+                          heartbeat_timeout=2 * REPLICATION_MAX_BACKOFF_SECONDS)
+
+def start_collector():
+    """Accept replicated history from other sites at /api/replicate"""
+    global collector
+    
+    try:
+        collector = replication.Collector(os.path.join(DATA_LOG_PATH, 'sites'), REPLICATION_TOKEN)
+    except ValueError as e:
+        logging.error("Collector mode disabled: %s", e)
+        return
+    logging.info("Collector mode: %d sites in %s", len(collector.sites()), collector.directory)
 
 # Global variables for data logging
 last_log_time = 0
-csv_headers_written = False
+csv_log_lock = threading.Lock()  # Serializes appends with retention and migration rewrites
+
+# CSV columns; timestamp_ms (int64 UTC epoch ms) is what range scans and
+# retention compare, the ISO timestamp is only kept for people and notebooks.
+# The enabled sensor plugins' channels are appended by register_plugin_channels()
+CSV_FIELDNAMES = ['timestamp', 'timestamp_ms', 'ph', 'temperature', 'humidity', 'light', 'vpd',
+                  'vpd_thermal_max', 'vpd_thermal_mean', 'vpd_thermal_median', 'vpd_thermal_mode', 'vpd_canopy',
+                  'thermal_min_temp', 'thermal_max_temp', 'thermal_mean_temp', 'thermal_median_temp',
+                  'thermal_range_temp', 'thermal_mode_temp', 'thermal_std_dev_temp',
+                  'ph_raw', 'temperature_raw', 'humidity_raw', 'light_raw']
+
+MIGRATE_BATCH_ROWS = 5000  # Rows held in memory while rewriting the CSV log
+
+def _migrated_rows(batch):
+    """Rows of `batch` with epoch timestamps, dropping rows whose time can't be parsed
+    
+    An existing timestamp_ms is kept (the ISO column only has second
+    resolution); legacy rows without one are converted from their naive local
+    ISO timestamps in one pass.
+    """
+    legacy = []
+    for row in batch:
+        try:
+            row['timestamp_ms'] = int(row.get('timestamp_ms') or '')
+        except ValueError:
+            row['timestamp_ms'] = None
+            legacy.append(row)
+    stamps = epoch_time.parse_iso_array([row.get('timestamp', '') for row in legacy])
+    for row, ms in zip(legacy, stamps):
+        if ms != epoch_time.INVALID_MS:
+            row['timestamp_ms'] = int(ms)
+    kept = [row for row in batch if row['timestamp_ms'] is not None]
+    for row in kept:
+        row['timestamp'] = epoch_time.to_iso(row['timestamp_ms'])
+    return kept
+
+def migrate_csv_log():
+    """Rewrite a CSV log with older columns (or repeated headers) under CSV_FIELDNAMES
+    
+    Columns of a plugin that is no longer enabled are kept at the end, so no
+    data is dropped. Rows are streamed to the new file MIGRATE_BATCH_ROWS at a time.
+    """
+    if not os.path.exists(CSV_LOG_FILE):
+        return
+    with open(CSV_LOG_FILE, 'r', newline='') as f:
+        header = next(csv.reader(f), None) or []
+    CSV_FIELDNAMES.extend(name for name in header if name not in CSV_FIELDNAMES)
+    if header == CSV_FIELDNAMES:
+        return
+    
+    started = time.perf_counter()
+    with csv_log_lock:
+        # Older versions wrote a header on every restart; collect every column first
+        with open(CSV_LOG_FILE, 'r', newline='') as infile:
+            for row in csv.reader(infile):
+                if row and row[0] == 'timestamp':
+                    CSV_FIELDNAMES.extend(name for name in row if name not in CSV_FIELDNAMES)
+        
+        temp_file = CSV_LOG_FILE + ".temp"
+        total = kept = 0
+        with open(CSV_LOG_FILE, 'r', newline='') as infile, open(temp_file, 'w', newline='') as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES, extrasaction='ignore')
+            writer.writeheader()
+            header = None
+            batch = []
+            for row in itertools.chain(csv.reader(infile), [None]):
+                if row is None or len(batch) >= MIGRATE_BATCH_ROWS:
+                    total += len(batch)
+                    rows = _migrated_rows(batch)
+                    writer.writerows(rows)
+                    kept += len(rows)
+                    batch = []
+                if not row:
+                    continue
+                if row[0] == 'timestamp':
+                    header = row
+                elif header is not None:
+                    batch.append(dict(zip(header, row)))
+        os.replace(temp_file, CSV_LOG_FILE)
+    logging.info("Migrated %s to the current columns: %d of %d rows kept in %.2f s",
+                 CSV_LOG_FILE, kept, total, time.perf_counter() - started)
+
+def append_csv_rows(rows):
+    """Append rows to the CSV log, writing the header to a new file"""
+    with csv_log_lock, open(CSV_LOG_FILE, 'a', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES, extrasaction='ignore')
+        
+        if csvfile.tell() == 0:
+            writer.writeheader()
+        
+        writer.writerows(rows)
+
+def append_rows(rows):
+    """Append logged rows to the configured storage backend"""
+    with store_import_lock:
+        if data_store is not None:
+            data_store.write_rows(rows)
+        else:
+            append_csv_rows(rows)
+            if store_import_backlog is not None:
+                store_import_backlog.extend(rows)
+    if gap_index is not None:
+        gap_index.observe([row['timestamp_ms'] for row in rows])
+
+# Intervals without logged rows (sensor stalls, reboots), indexed as rows are
+# written and saved to greenhouse_gaps.json; rows are normally at most
+# LOG_INTERVAL_SECONDS (or LOG_MAX_SILENCE_SECONDS) apart
+GAP_THRESHOLD_SECONDS = 600
+gap_index = None
+
+def last_logged_ms():
+    """Timestamp of the newest logged row, or None"""
+    if data_store is not None:
+        return data_store.last_timestamp()
+    try:
+        with open(CSV_LOG_FILE, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            return _row_epoch_ms(f.read().rstrip(b'\n').rsplit(b'\n', 1)[-1].decode())
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def rebuild_gap_index():
+    """Index the gaps of the existing history (once, or after a threshold change)"""
+    started = time.perf_counter()
+    chunks = (arrays['timestamp_ms'] for fields, arrays in history_export.source_chunks(history_source(), None, None))
+    count = gap_index.rebuild(chunks) if history_available() else gap_index.rebuild([])
+    logging.info("Indexed %d gaps in the logged history in %.2f s", count, time.perf_counter() - started)
+
+def init_gap_index():
+    """Load the gap index, rebuilding it in the background when missing"""
+    global gap_index
+    
+    gap_index = gaps.GapIndex(os.path.join(DATA_LOG_PATH, 'greenhouse_gaps.json'), GAP_THRESHOLD_SECONDS * 1000)
+    if gap_index.load():
+        gap_index.last_ms = last_logged_ms()  # A reboot shows up as a gap before the next row
+    elif 'npz' in history_export.available_formats():
+        worker_supervisor.add('gap-index', rebuild_gap_index, restart=False)
+
+def init_change_logger():
+    """Start change-based logging, flushing the held points at exit"""
+    global change_logger
+    
+    if LOG_MODE == 'interval':
+        return
+    change_logger = deadband.ChangeLogger(CSV_FIELDNAMES[2:], LOG_MODE, LOG_TOLERANCES,
+                                          LOG_MAX_SILENCE_SECONDS * 1000)
+    atexit.register(flush_change_logger)
+    logging.info("Change-based logging (%s) at the %s s sample rate", LOG_MODE, SENSOR_INTERVAL_SECONDS)
+
+def write_change_rows(rows):
+    """Append change-logged rows, keeping them for the next attempt if the append fails"""
+    for row in rows:
+        row['timestamp'] = epoch_time.to_iso(row['timestamp_ms'])
+    unwritten_rows.extend(rows)
+    if unwritten_rows:
+        append_rows(unwritten_rows)
+        del unwritten_rows[:]
+
+def flush_change_logger():
+    """Write the held-back row and every point the compressors hold"""
+    with change_log_lock:
+        try:
+            write_change_rows(change_logger.flush())
+        except Exception as e:
+            logging.error("Lost %d change-logged rows on shutdown: %s", len(unwritten_rows), e)
 
 def log_data():
-    global last_log_time, csv_headers_written
+    global last_log_time
+    
+    last_sample_ms = None
     
     while True:
+        worker_supervisor.beat('logger')
+        
+        # Feed every new sample to the compressors; only archived points are written
+        if change_logger is not None:
+            data = get_sensor_snapshot()
+            if data['timestamp_ms'] != last_sample_ms:
+                last_sample_ms = data['timestamp_ms']
+                with change_log_lock:
+                    write_change_rows(change_logger.update(last_sample_ms, data))
+        
         current_time = time.time()
         if current_time - last_log_time >= LOG_INTERVAL_SECONDS:
             last_log_time = current_time
             
+            data = get_sensor_snapshot()
+            
             # Log to CSV
-            with open(CSV_LOG_FILE, 'a', newline='') as csvfile:
-                fieldnames = ['timestamp', 'ph', 'temperature', 'humidity', 'vpd', 'vpd_thermal_max', 'vpd_thermal_mean', 'vpd_thermal_median', 'vpd_thermal_mode', 'thermal_min_temp', 'thermal_max_temp', 'thermal_mean_temp', 'thermal_median_temp', 'thermal_range_temp', 'thermal_mode_temp', 'thermal_std_dev_temp']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                if not csv_headers_written:
-                    writer.writeheader()
-                    csv_headers_written = True
-                
-                # Calculate VPD
-                svp = 0.6108 * math.exp(17.27 * temp_value / (temp_value + 237.3))
-                vpd = (1 - humidity_value / 100) * svp
-                
-                # Enhanced VPD calculations using thermal camera canopy temperatures
-                avp = svp * (humidity_value / 100)  # Actual vapor pressure using air temperature
-                
-                # Calculate enhanced VPD for each thermal measurement
-                svp_thermal_max = 0.6108 * math.exp(17.27 * thermal_max_temp / (thermal_max_temp + 237.3))
-                vpd_thermal_max = svp_thermal_max - avp
-                
-                svp_thermal_mean = 0.6108 * math.exp(17.27 * thermal_mean_temp / (thermal_mean_temp + 237.3))
-                vpd_thermal_mean = svp_thermal_mean - avp
-                
-                svp_thermal_median = 0.6108 * math.exp(17.27 * thermal_median_temp / (thermal_median_temp + 237.3))
-                vpd_thermal_median = svp_thermal_median - avp
-                
-                svp_thermal_mode = 0.6108 * math.exp(17.27 * thermal_mode_temp / (thermal_mode_temp + 237.3))
-                vpd_thermal_mode = svp_thermal_mode - avp
-                
-                writer.writerow({
-                    'timestamp': datetime.now().isoformat(),
-                    'ph': ph_value,
-                    'temperature': temp_value,
-                    'humidity': humidity_value,
-                    'vpd': round(vpd, 2),
-                    'vpd_thermal_max': round(vpd_thermal_max, 2),
-                    'vpd_thermal_mean': round(vpd_thermal_mean, 2),
-                    'vpd_thermal_median': round(vpd_thermal_median, 2),
-                    'vpd_thermal_mode': round(vpd_thermal_mode, 2),
-                    'thermal_min_temp': thermal_min_temp,
-                    'thermal_max_temp': thermal_max_temp,
-                    'thermal_mean_temp': thermal_mean_temp,
-                    'thermal_median_temp': thermal_median_temp,
-                    'thermal_range_temp': thermal_range_temp,
-                    'thermal_mode_temp': thermal_mode_temp,
-                    'thermal_std_dev_temp': thermal_std_dev_temp
-                })
+            if change_logger is None:
+                append_rows([data])
             
             # Log to JSON
-            data = {
-                'timestamp': datetime.now().isoformat(),
-                'ph': ph_value,
-                'temperature': temp_value,
-                'humidity': humidity_value,
-                'vpd': round(vpd, 2),
-                'vpd_thermal_max': round(vpd_thermal_max, 2),
-                'vpd_thermal_mean': round(vpd_thermal_mean, 2),
-                'vpd_thermal_median': round(vpd_thermal_median, 2),
-                'vpd_thermal_mode': round(vpd_thermal_mode, 2),
-                'thermal_min_temp': thermal_min_temp,
-                'thermal_max_temp': thermal_max_temp,
-                'thermal_mean_temp': thermal_mean_temp,
-                'thermal_median_temp': thermal_median_temp,
-                'thermal_range_temp': thermal_range_temp,
-                'thermal_mode_temp': thermal_mode_temp,
-                'thermal_std_dev_temp': thermal_std_dev_temp
-            }
             with open(JSON_LOG_FILE, 'w') as jsonfile:
                 json.dump(data, jsonfile)
+            
+            if data['canopy_zones']:
+                logging.info("Canopy VPD %s kPa; zones: %s", data['vpd_canopy'],
+                             ', '.join(f"{name} {zone['vpd']} kPa ({zone['canopy_temp']} C, {zone['canopy_fraction']:.0%} canopy)"
+                                       for name, zone in data['canopy_zones'].items()))
         
         # Wait before next log
         time.sleep(1)
 
+def _row_epoch_ms(line):
+    """timestamp_ms of a CSV data line (the second, unquoted column)"""
+    try:
+        return int(line.split(',', 2)[1])
+    except (IndexError, ValueError):
+        return None
+
 def cleanup_old_data():
     """Remove data older than RETENTION_DAYS"""
     try:
-        cutoff_date = datetime.now() - timedelta(days=RETENTION_DAYS)
+        cutoff_ms = epoch_time.now_ms() - RETENTION_DAYS * 86400000
         
-        # Clean up CSV file
+        if gap_index is not None:
+            gap_index.prune(cutoff_ms)
+        
+        # The SQLite store deletes by primary key range in one statement
+        if data_store is not None:
+            dropped = data_store.delete_before(cutoff_ms)
+            if dropped:
+                logging.info("Cleaned up %d rows older than %d days", dropped, RETENTION_DAYS)
+            return
+        
+        # Rows are appended in time order, so everything from the first row
+        # inside the retention period onwards is kept and copied in bulk
         if os.path.exists(CSV_LOG_FILE):
-            temp_file = CSV_LOG_FILE + ".temp"
-            with open(CSV_LOG_FILE, 'r') as infile, open(temp_file, 'w', newline='') as outfile:
-                reader = csv.reader(infile)
-                writer = csv.writer(outfile)
-                
-                header = next(reader, None)
-                if header:
-                    writer.writerow(header)
+            with csv_log_lock:
+                with open(CSV_LOG_FILE, 'r', newline='') as infile:
+                    header = infile.readline()
+                    dropped = 0
+                    first_kept = ''
+                    for line in infile:
+                        ms = _row_epoch_ms(line)
+                        if ms is not None and ms >= cutoff_ms:
+                            first_kept = line
+                            break
+                        dropped += 1
+                    if dropped == 0:
+                        return
                     
-                for row in reader:
-                    if row and len(row) > 0:
-                        try:
-                            row_date = datetime.fromisoformat(row[0].replace('Z', '+00:00'))
-                            if row_date >= cutoff_date:
-                                writer.writerow(row)
-                        except (ValueError, IndexError):
-                            # Keep rows that can't be parsed (might be header)
-                            writer.writerow(row)
-            
-            os.replace(temp_file, CSV_LOG_FILE)
-            logging.info(f"Cleaned up data older than {RETENTION_DAYS} days")
+                    temp_file = CSV_LOG_FILE + ".temp"
+                    with open(temp_file, 'w', newline='') as outfile:
+                        outfile.write(header)
+                        outfile.write(first_kept)
+                        shutil.copyfileobj(infile, outfile)
+                
+                os.replace(temp_file, CSV_LOG_FILE)
+            logging.info("Cleaned up %d rows older than %d days", dropped, RETENTION_DAYS)
     except Exception as e:
-        logging.error(f"Error during data cleanup: {e}")
+        logging.error("Error during data cleanup: %s", e)
+
+def log_cache_info():
+    """(Last-Modified, max-age) for responses derived from the CSV log"""
+    try:
+        modified = data_store.last_write_time if data_store is not None else os.path.getmtime(CSV_LOG_FILE)
+    except OSError:
+        return None, 0
+    if change_logger is not None:
+        return modified, 0  # Rows may be appended after any sample
+    return modified, max(0, int(LOG_INTERVAL_SECONDS - (time.time() - last_log_time)))
 
 def get_data_summary():
     """Get summary statistics from logged data"""
     try:
+        if data_store is not None:
+            records, first_ms, last_ms = data_store.summary()
+            if not records:
+                return {"error": "No data available"}
+            return {
+                "total_records": records,
+                "first_record": epoch_time.to_iso(first_ms),
+                "last_record": epoch_time.to_iso(last_ms),
+                "first_record_ms": first_ms,
+                "last_record_ms": last_ms,
+                "file_size_mb": round(data_store.size_bytes() / (1024 * 1024), 2),
+                "storage": STORAGE_BACKEND,
+                "log_mode": LOG_MODE,
+                "compression": change_logger.status() if change_logger is not None else None,
+                "gaps": gap_index.status() if gap_index is not None else None
+            }
+        
         if not os.path.exists(CSV_LOG_FILE):
             return {"error": "No data file found"}
         
-        with open(CSV_LOG_FILE, 'r') as file:
-            reader = csv.DictReader(file)
-            rows = list(reader)
-            
-        if not rows:
+        # Only the first and last rows are parsed; the rest is just counted
+        with open(CSV_LOG_FILE, 'rb') as file:
+            file.readline()
+            first_line = file.readline()
+            records = 1 if first_line else 0
+            last_line = first_line
+            for block in iter(lambda: file.read(1 << 20), b''):
+                records += block.count(b'\n')
+            if records > 1:
+                file.seek(max(0, file.tell() - 4096))
+                last_line = file.read().rstrip(b'\n').rsplit(b'\n', 1)[-1]
+        
+        if not records:
             return {"error": "No data available"}
         
+        first_ms = _row_epoch_ms(first_line.decode())
+        last_ms = _row_epoch_ms(last_line.decode())
         return {
-            "total_records": len(rows),
-            "first_record": rows[0]["timestamp"] if rows else None,
-            "last_record": rows[-1]["timestamp"] if rows else None,
-            "file_size_mb": round(os.path.getsize(CSV_LOG_FILE) / (1024 * 1024), 2)
+            "total_records": records,
+            "first_record": epoch_time.to_iso(first_ms) if first_ms is not None else None,
+            "last_record": epoch_time.to_iso(last_ms) if last_ms is not None else None,
+            "first_record_ms": first_ms,
+            "last_record_ms": last_ms,
+            "file_size_mb": round(os.path.getsize(CSV_LOG_FILE) / (1024 * 1024), 2),
+            "storage": STORAGE_BACKEND,
+            "log_mode": LOG_MODE,
+            "compression": change_logger.status() if change_logger is not None else None,
+            "gaps": gap_index.status() if gap_index is not None else None
         }
     except Exception as e:
         return {"error": str(e)}
 
-# Run data cleanup at startup
-cleanup_old_data()
+# Logged history served by /api/history, reloaded only when the CSV changes
+HISTORY_DEFAULT_FIELDS = ['temperature', 'humidity', 'vpd']
+HISTORY_DEFAULT_WIDTH = 600  # Roughly one point per chart pixel
+HISTORY_MAX_WIDTH = 5000
+history_cache_lock = threading.Lock()
+history_cache = {'key': None, 'columns': None}
+
+def reconstruct_columns(columns):
+    """Fill in the cells change-logged rows leave empty (in place)
+    
+    In 'interval' mode every row is complete, so an empty cell is a failed
+    read and stays empty.
+    """
+    if LOG_MODE == 'interval':
+        return
+    timestamps = columns['timestamp_ms']
+    max_gap_ms = 2 * LOG_MAX_SILENCE_SECONDS * 1000
+    for name, values in columns.items():
+        if name != 'timestamp_ms':
+            columns[name] = deadband.reconstruct(timestamps, values, max_gap_ms)
+
+def load_store_columns(start_ms=None, end_ms=None, store=None):
+    """Logged columns for a time range, read from a SQLite store by primary key"""
+    # Widen the range so empty cells at its edges interpolate from points outside it
+    margin_ms = 2 * LOG_MAX_SILENCE_SECONDS * 1000
+    columns = history_export.load_columns(store or data_store,
+                                          None if start_ms is None else start_ms - margin_ms,
+                                          None if end_ms is None else end_ms + margin_ms)
+    reconstruct_columns(columns)
+    return columns
 
-# Start the sensor update thread
-sensor_thread = threading.Thread(target=update_sensor_data, daemon=True)
-sensor_thread.start()
+def get_history_columns():
+    """All logged columns as NumPy arrays, cached until the CSV file changes"""
+    stat = os.stat(CSV_LOG_FILE)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with history_cache_lock:
+        if history_cache['key'] != key:
+            started = time.perf_counter()
+            columns = history_export.load_columns(CSV_LOG_FILE)
+            timestamps = columns['timestamp_ms']
+            if len(timestamps) > 1 and (timestamps[1:] < timestamps[:-1]).any():
+                # A clock step (e.g. NTP after boot) left rows out of order
+                order = timestamps.argsort(kind='stable')
+                columns = {name: values[order] for name, values in columns.items()}
+            reconstruct_columns(columns)
+            history_cache['columns'] = columns
+            history_cache['key'] = key
+            logging.debug("Loaded %d history rows in %.3f s", len(history_cache['columns']['timestamp_ms']),
+                          time.perf_counter() - started)
+        return history_cache['columns']
 
-# Start the data logging thread
-log_thread = threading.Thread(target=log_data, daemon=True)
-log_thread.start()
+def _json_values(values):
+    """Array as a JSON-safe list (NaN becomes null)"""
+    return [None if value != value else value for value in values.tolist()]
+
+def query_history(fields=None, start_ms=None, end_ms=None, width=HISTORY_DEFAULT_WIDTH, method='lttb',
+                  store=None, fill=None, step_ms=None):
+    """Downsampled series of logged fields between two epoch-ms times (of `store` if given)
+    
+    With fill, each series gets a gap mask and points that show the gaps
+    (see gaps.mark_gaps); with step_ms it is resampled onto a regular grid
+    instead of downsampled, and cells inside gaps are filled per `fill`.
+    """
+    if method not in downsample.METHODS:
+        raise ValueError(f"method must be one of {', '.join(downsample.METHODS)}")
+    if not 3 <= width <= HISTORY_MAX_WIDTH:
+        raise ValueError(f"width must be between 3 and {HISTORY_MAX_WIDTH}")
+    if fill is not None and fill not in gaps.FILLS:
+        raise ValueError(f"fill must be one of {', '.join(gaps.FILLS)}")
+    if step_ms is not None and step_ms <= 0:
+        raise ValueError("step must be positive")
+    if store is not None or data_store is not None:
+        columns = load_store_columns(start_ms, end_ms, store)
+    else:
+        columns = get_history_columns()
+    fields = fields or HISTORY_DEFAULT_FIELDS
+    unknown = [field for field in fields if field not in columns or field == 'timestamp_ms']
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    
+    # Rows are in time order, so the range is two binary searches on the epochs
+    np = _lazy_import('numpy')
+    timestamps = columns['timestamp_ms']
+    first = 0 if start_ms is None else int(np.searchsorted(timestamps, start_ms, side='left'))
+    last = len(timestamps) if end_ms is None else int(np.searchsorted(timestamps, end_ms, side='right'))
+    
+    start = int(timestamps[first]) if last > first else start_ms
+    end = int(timestamps[last - 1]) if last > first else end_ms
+    # Replicated sites have no gap index; their few rows are scanned instead
+    if store is None and gap_index is not None:
+        gap_list = gap_index.between(start, end)
+    else:
+        gap_list = gaps.find_gaps(timestamps[first:last], GAP_THRESHOLD_SECONDS * 1000)
+    
+    grid = None
+    if step_ms is not None and last > first:
+        grid_start = start_ms if start_ms is not None else start
+        grid_end = end_ms if end_ms is not None else end
+        if (grid_end - grid_start) // step_ms + 1 > HISTORY_MAX_WIDTH:
+            raise ValueError(f"step too small, at most {HISTORY_MAX_WIDTH} points per series")
+        grid = np.arange(grid_start, grid_end + 1, step_ms, dtype=np.int64)
+    
+    series = {}
+    for field in fields:
+        t, v = timestamps[first:last], columns[field][first:last]
+        if grid is not None:
+            v, mask = gaps.resample(t, v, grid, gap_list, fill or 'null')
+            series[field] = {'t': grid.tolist(), 'v': _json_values(v), 'gap': mask.tolist()}
+            continue
+        t, v = downsample.downsample(t, v, width, method)
+        if fill is not None:
+            t, v, mask = gaps.mark_gaps(t, v, gap_list, fill)
+            series[field] = {'t': t.tolist(), 'v': _json_values(v), 'gap': mask.tolist()}
+        else:
+            series[field] = {'t': t.tolist(), 'v': _json_values(v)}
+    return {
+        'start': start,
+        'end': end,
+        'rows': last - first,
+        'method': 'resample' if grid is not None else method,
+        'width': width if grid is None else len(grid),
+        'fill': fill,
+        'step': step_ms,
+        'gaps': gap_list,
+        'series': series,
+    }
+
+def retention_worker():
+    """Run cleanup_old_data in the background instead of blocking startup"""
+    time.sleep(RETENTION_START_DELAY_SECONDS)
+    while True:
+        worker_supervisor.beat('retention')
+        cleanup_old_data()
+        time.sleep(RETENTION_INTERVAL_SECONDS)
+
+# JSON endpoints served by api_response(), individually or through /api/batch
+JSON_ENDPOINTS = ('/api/sensors', '/api/data', '/api/stats', '/api/alerts', '/api/canopy',
+                  '/api/thermal/archive', '/api/data-summary', '/api/history', '/api/ingest',
+                  '/api/plugins', '/api/health', '/api/integrals', '/api/forecast')
+BATCH_MAX_REQUESTS = 16
+BATCH_MAX_BODY_BYTES = 64 * 1024
+
+def api_response(path, query, authorization=None):
+    """(status, data, cache_info) for one JSON endpoint; see SensorHandler.send_json
+    
+    `authorization` is the request's Authorization header, checked for other sites' history.
+    """
+    # For JSON API endpoint
+    if path == '/api/sensors':
+        return 200, mark_staleness(get_sensor_snapshot()), sample_cache_info()
+    
+    # For /api/data endpoint (same as /api/sensors for compatibility)
+    elif path == '/api/data':
+        return 200, mark_staleness(get_sensor_snapshot()), sample_cache_info()
+    
+    # Rolling-window statistics for each field
+    elif path == '/api/stats':
+        return 200, stats_engine.stats(), sample_cache_info()
+    
+    # Active anomaly alerts (spikes, stuck sensors) and recent history
+    elif path == '/api/alerts':
+        alerts = stats_engine.alerts()
+        alerts.update(rule_engine.status())
+        return 200, alerts, sample_cache_info()
+    
+    # Canopy segmentation result and per-zone canopy VPD
+    elif path == '/api/canopy':
+        if canopy_segmenter is None:
+            return 503, {'error': 'Canopy zone analysis disabled'}, (None, 0)
+        snapshot = get_sensor_snapshot()
+        analysis = canopy_analysis or {}
+        return 200, {
+            'method': canopy_segmenter.method,
+            'threshold': analysis.get('threshold'),
+            'canopy_pixels': analysis.get('canopy_pixels'),
+            'canopy_temp': snapshot['canopy_temp'],
+            'vpd_canopy': snapshot['vpd_canopy'],
+            'frame_seq': thermal_frame_seq,
+            'simulated_frame': thermal_frame_simulated,
+            'zones': snapshot['canopy_zones'],
+            'stale': is_stale(),
+        }, sample_cache_info()
+    
+    # Thermal frame archive size and segments
+    elif path == '/api/thermal/archive':
+        if thermal_frame_archive is None:
+            return 503, {"error": "Thermal frame archive disabled"}, (None, 0)
+        return 200, thermal_frame_archive.summary(), (None, 0)
+    
+    # For data summary endpoint
+    elif path == '/api/data-summary':
+        return 200, get_data_summary(), log_cache_info()
+    
+    # Downsampled history for charts: ?fields=a,b&start=&end=&width=600&method=lttb|minmax|none
+    elif path == '/api/history':
+        if 'npz' not in history_export.available_formats():
+            return 503, {'error': 'NumPy not installed, history unavailable'}, (None, 0)
+        # A collector serves any replicated site with ?site=, to holders of the replication token
+        store = None
+        if 'site' in query:
+            if collector is not None and not collector.authorized(authorization):
+                return 401, {'error': 'Missing or wrong replication token'}, (None, 0)
+            store = collector.existing_store(query['site'][0]) if collector is not None else None
+            if store is None:
+                return 404, {'error': f"Unknown site {query['site'][0]!r}"}, (None, 0)
+        elif not history_available():
+            return 404, {'error': 'No data file found'}, (None, 0)
+        try:
+            fields = query['fields'][0].split(',') if 'fields' in query else None
+            start = epoch_time.parse_time(query['start'][0]) if 'start' in query else None
+            end = epoch_time.parse_time(query['end'][0]) if 'end' in query else None
+            width = int(query.get('width', [HISTORY_DEFAULT_WIDTH])[0])
+            fill = query['fill'][0] if 'fill' in query else None
+            step = int(float(query['step'][0]) * 1000) if 'step' in query else None  # Seconds
+            return 200, query_history(fields, start, end, width, query.get('method', ['lttb'])[0], store,
+                                      fill, step), \
+                (None, 0) if store is not None else log_cache_info()
+        except ValueError as e:
+            return 400, {'error': str(e)}, (None, 0)
+    
+    # Push ingest counters and the latest readings per source
+    elif path == '/api/ingest':
+        return 200, ingest_pipeline.status(), (None, 0)
+    
+    # Worker threads and sample staleness; 503 while degraded for external monitors
+    elif path == '/api/health':
+        health = health_status()
+        return (200 if health['status'] == 'ok' else 503), health, (None, 0)
+    
+    # Daily light integral, growing degree days and VPD hours: today so far and past days
+    elif path == '/api/integrals':
+        return 200, integrator.status(), sample_cache_info()
+    
+    # Temperature, humidity and VPD forecasts, recomputed when a 5-minute bucket closes
+    elif path == '/api/forecast':
+        return 200, forecaster.status(), sample_cache_info()
+    
+    # Installed and scheduled sensor plugins
+    elif path == '/api/plugins':
+        return 200, {'installed': sorted(sensor_plugins.discover()),
+                     'plugins': plugin_scheduler.status(),
+                     'last_reading_ms': plugin_time_ms}, (None, 0)
+    
+    return 404, {'error': f"Unknown endpoint {path}"}, (None, 0)
+
+def batch_response(sub_requests, authorization=None):
+    """(status, data, cache_info) answering a list or {name: path} dict of sub-requests"""
+    if not sub_requests:
+        return 400, {'error': 'No requests, pass ?r=/api/... or POST {"requests": [...]}'}, (None, 0)
+    if len(sub_requests) > BATCH_MAX_REQUESTS:
+        return 400, {'error': f"At most {BATCH_MAX_REQUESTS} requests per batch"}, (None, 0)
+    
+    names = list(sub_requests) if isinstance(sub_requests, dict) else None
+    targets = list(sub_requests.values()) if names is not None else list(sub_requests)
+    responses = []
+    last_modified, max_age = None, None
+    for target in targets:
+        if not isinstance(target, str):
+            responses.append({'status': 400, 'body': {'error': 'Requests must be path strings'}})
+            continue
+        url = urllib.parse.urlsplit(target)
+        if url.path not in JSON_ENDPOINTS:
+            responses.append({'path': target, 'status': 404,
+                              'body': {'error': f"Not a batchable endpoint: {url.path}"}})
+            continue
+        status, data, (modified, age) = api_response(url.path, urllib.parse.parse_qs(url.query), authorization)
+        responses.append({'path': target, 'status': status, 'body': data})
+        if status == 200:
+            # The batch is as fresh as its newest part and expires with its first
+            if modified is not None:
+                last_modified = modified if last_modified is None else max(last_modified, modified)
+            max_age = age if max_age is None else min(max_age, age)
+    
+    if names is not None:
+        responses = dict(zip(names, responses))
+    return 200, {'responses': responses}, (last_modified, max_age or 0)
+
+# Compressed JSON bodies, shared by every connection
+compressed_bodies = http_cache.CompressedBodyCache()
 
 # HTTP request handler
 class SensorHandler(http.server.SimpleHTTPRequestHandler):
     def do_GET(self):
         global ph_value, temp_value, humidity_value, thermal_min_temp, thermal_max_temp, thermal_mean_temp, thermal_median_temp, thermal_range_temp, thermal_mode_temp, thermal_std_dev_temp, thermal_data_available
         
-        if self.path == '/':
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path
+        query = urllib.parse.parse_qs(url.query)
+        
+        if path == '/':
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
             
-            # Calculate VPD
-            # VPD = (1 - RH/100) * SVP
-            # SVP (Saturation Vapor Pressure) = 0.6108 * exp(17.27 * T / (T + 237.3))
-            # where T is temperature in Celsius and RH is relative humidity in percent
-            svp = 0.6108 * math.exp(17.27 * temp_value / (temp_value + 237.3))
-            vpd = (1 - humidity_value / 100) * svp
-            
-            # Enhanced VPD calculations using thermal camera canopy temperatures
-            # VPD_enhanced = SVP(T_canopy) - AVP(T_air, RH)
-            # where AVP = actual vapor pressure = SVP(T_air) * (RH/100)
-            avp = svp * (humidity_value / 100)  # Actual vapor pressure using air temperature
-            
-            # Calculate enhanced VPD for each thermal measurement
-            svp_thermal_max = 0.6108 * math.exp(17.27 * thermal_max_temp / (thermal_max_temp + 237.3))
-            vpd_thermal_max = svp_thermal_max - avp
-            
-            svp_thermal_mean = 0.6108 * math.exp(17.27 * thermal_mean_temp / (thermal_mean_temp + 237.3))
-            vpd_thermal_mean = svp_thermal_mean - avp
-            
-            svp_thermal_median = 0.6108 * math.exp(17.27 * thermal_median_temp / (thermal_median_temp + 237.3))
-            vpd_thermal_median = svp_thermal_median - avp
-            
-            svp_thermal_mode = 0.6108 * math.exp(17.27 * thermal_mode_temp / (thermal_mode_temp + 237.3))
-            vpd_thermal_mode = svp_thermal_mode - avp
+            snapshot = get_sensor_snapshot()
+            vpd = snapshot['vpd']
+            vpd_thermal_max = snapshot['vpd_thermal_max']
+            vpd_thermal_mean = snapshot['vpd_thermal_mean']
+            vpd_thermal_median = snapshot['vpd_thermal_median']
+            vpd_thermal_mode = snapshot['vpd_thermal_mode']
+            canopy_boxes = ''
+            for name, zone in snapshot['canopy_zones'].items():
+                zone_vpd = '--' if zone['vpd'] is None else f"{zone['vpd']:.2f}"
+                leaf_temp = '--' if zone['canopy_temp'] is None else f"{zone['canopy_temp']:.1f}"
+                canopy_boxes += f"""
+                    <div class="sensor-box" style="background-color: #1b2d00;">
+                        <h2>Canopy VPD ({name})</h2>
+                        <div class="sensor-value" style="color: #8bc34a">{zone_vpd} kPa</div>
+                        <div style="color: #888; font-size: 12px; text-align: center; margin-top: 5px;">
+                            Leaf temp: {leaf_temp}&deg;C, {zone['canopy_fraction']:.0%} of zone is canopy
+                        </div>
+                    </div>
+"""
             
             # Create HTML response with improved dark mode, landscape layout, and timestamp header
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -946,6 +2168,15 @@ class SensorHandler(http.server.SimpleHTTPRequestHandler):
                     </div>
                 </div>
                 
+                <h2 style="color: #8bc34a; text-align: center; margin: 20px 0;">Canopy VPD by Zone (leaf pixels only)</h2>
+                <div class="dashboard-container">{canopy_boxes or '<div style="color: #888;">No thermal frame yet</div>'}
+                </div>
+                
+                <!-- Thermal heatmap rendered by this server (no extra camera requests) -->
+                <div style="text-align: center; margin: 20px 0;">
+                    <img src="/api/thermal/frame.png?scale=10" alt="Thermal heatmap" style="max-width: 100%; border-radius: 8px; border: 1px solid #333;" onerror="this.style.display='none'">
+                </div>
+                
                 <!-- View Camera Data Button -->
                 <a href="http://192.168.1.176/" target="_blank" class="view-camera-button" title="Open Thermal Camera Interface">
                     View Camera Data
@@ -1088,7 +2319,21 @@ class SensorHandler(http.server.SimpleHTTPRequestHandler):
                             <ul>
                                 <li><code>/api/data</code> - Current sensor data (JSON)</li>
                                 <li><code>/api/data-summary</code> - Data logging summary</li>
+                                <li><code>/api/stats</code> - Rolling 1-hour statistics per sensor</li>
+                                <li><code>/api/alerts</code> - Spike, stuck-sensor and threshold rule alerts</li>
+                                <li><code>/api/thermal/frame.png</code> - Latest thermal heatmap image</li>
+                                <li><code>/api/canopy</code> - Canopy temperature and VPD per zone</li>
                                 <li><code>/download/csv</code> - Download historical data</li>
+                                <li><code>/api/history?fields=temperature,vpd&amp;width=600</code> - Downsampled history for charts (LTTB or min/max)</li>
+                                <li><code>/api/history?fields=vpd&amp;step=300&amp;fill=previous</code> - History on a regular grid with a gap mask (fill: null, previous, linear)</li>
+                                <li><code>/api/batch?r=/api/sensors&amp;r=/api/data-summary</code> - Several JSON endpoints in one response (or POST {"requests": [...]})</li>
+                                <li><code>/api/replicate</code> - Replicated sites (collector mode)</li>
+                                <li><code>/api/integrals</code> - Daily light integral, growing degree days, VPD hours</li>
+                                <li><code>/api/forecast</code> - Temperature, humidity and VPD forecasts 15-60 minutes ahead</li>
+                                <li><code>/api/health</code> - Worker health and sample staleness</li>
+                                <li><code>/api/plugins</code> - Installed and scheduled sensor plugins</li>
+                                <li><code>POST /api/ingest</code> - Push readings from sensor nodes (JSON lines or binary, see ingest.py)</li>
+                                <li><code>/api/export?format=npz</code> - Historical data as Parquet, Arrow or NPZ</li>
                             </ul>
                         </div>
                         
@@ -1138,142 +2383,387 @@ class SensorHandler(http.server.SimpleHTTPRequestHandler):
             """
             
             self.wfile.write(html.encode())
-            logging.info(f"Served sensor data - pH: {ph_value}, Temp: {temp_value}°C, Humidity: {humidity_value}%, VPD: {vpd:.2f} kPa")
+            logging.debug("Served sensor data - pH: %s, Temp: %s°C, Humidity: %s%%, VPD: %.2f kPa",
+                          ph_value, temp_value, humidity_value, vpd)
             return
         
-        # For JSON API endpoint
-        elif self.path == '/api/sensors':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
-            # Calculate VPD
-            svp = 0.6108 * math.exp(17.27 * temp_value / (temp_value + 237.3))
-            vpd = (1 - humidity_value / 100) * svp
-            
-            # Enhanced VPD calculations using thermal camera canopy temperatures
-            avp = svp * (humidity_value / 100)  # Actual vapor pressure using air temperature
-            
-            # Calculate enhanced VPD for each thermal measurement
-            svp_thermal_max = 0.6108 * math.exp(17.27 * thermal_max_temp / (thermal_max_temp + 237.3))
-            vpd_thermal_max = svp_thermal_max - avp
-            
-            svp_thermal_mean = 0.6108 * math.exp(17.27 * thermal_mean_temp / (thermal_mean_temp + 237.3))
-            vpd_thermal_mean = svp_thermal_mean - avp
-            
-            svp_thermal_median = 0.6108 * math.exp(17.27 * thermal_median_temp / (thermal_median_temp + 237.3))
-            vpd_thermal_median = svp_thermal_median - avp
-            
-            svp_thermal_mode = 0.6108 * math.exp(17.27 * thermal_mode_temp / (thermal_mode_temp + 237.3))
-            vpd_thermal_mode = svp_thermal_mode - avp
-            
-            data = {
-                'ph': ph_value,
-                'temperature': temp_value,
-                'humidity': humidity_value,
-                'vpd': round(vpd, 2),
-                'vpd_thermal_max': round(vpd_thermal_max, 2),
-                'vpd_thermal_mean': round(vpd_thermal_mean, 2),
-                'vpd_thermal_median': round(vpd_thermal_median, 2),
-                'vpd_thermal_mode': round(vpd_thermal_mode, 2),
-                'thermal_min_temp': thermal_min_temp,
-                'thermal_max_temp': thermal_max_temp,
-                'thermal_mean_temp': thermal_mean_temp,
-                'thermal_median_temp': thermal_median_temp,
-                'thermal_range_temp': thermal_range_temp,
-                'thermal_mode_temp': thermal_mode_temp,
-                'thermal_std_dev_temp': thermal_std_dev_temp,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            self.wfile.write(json.dumps(data).encode())
+        # JSON API endpoints (shared with /api/batch)
+        elif path in JSON_ENDPOINTS:
+            status, data, cache_info = api_response(path, query, self.headers.get('Authorization'))
+            self.send_json(data, status, cache_info)
             return
             
-        # For /api/data endpoint (same as /api/sensors for compatibility)
-        elif self.path == '/api/data':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
-            # Calculate VPD
-            svp = 0.6108 * math.exp(17.27 * temp_value / (temp_value + 237.3))
-            vpd = (1 - humidity_value / 100) * svp
-            
-            # Enhanced VPD calculations using thermal camera canopy temperatures
-            avp = svp * (humidity_value / 100)  # Actual vapor pressure using air temperature
-            
-            # Calculate enhanced VPD for each thermal measurement
-            svp_thermal_max = 0.6108 * math.exp(17.27 * thermal_max_temp / (thermal_max_temp + 237.3))
-            vpd_thermal_max = svp_thermal_max - avp
-            
-            svp_thermal_mean = 0.6108 * math.exp(17.27 * thermal_mean_temp / (thermal_mean_temp + 237.3))
-            vpd_thermal_mean = svp_thermal_mean - avp
-            
-            svp_thermal_median = 0.6108 * math.exp(17.27 * thermal_median_temp / (thermal_median_temp + 237.3))
-            vpd_thermal_median = svp_thermal_median - avp
-            
-            svp_thermal_mode = 0.6108 * math.exp(17.27 * thermal_mode_temp / (thermal_mode_temp + 237.3))
-            vpd_thermal_mode = svp_thermal_mode - avp
-            
-            data = {
-                'ph': ph_value,
-                'temperature': temp_value,
-                'humidity': humidity_value,
-                'light': light_value,
-                'vpd': round(vpd, 2),
-                'vpd_thermal_max': round(vpd_thermal_max, 2),
-                'vpd_thermal_mean': round(vpd_thermal_mean, 2),
-                'vpd_thermal_median': round(vpd_thermal_median, 2),
-                'vpd_thermal_mode': round(vpd_thermal_mode, 2),
-                'thermal_min_temp': thermal_min_temp,
-                'thermal_max_temp': thermal_max_temp,
-                'thermal_mean_temp': thermal_mean_temp,
-                'thermal_median_temp': thermal_median_temp,
-                'thermal_range_temp': thermal_range_temp,
-                'thermal_mode_temp': thermal_mode_temp,
-                'thermal_std_dev_temp': thermal_std_dev_temp,
-                'timestamp': datetime.now().isoformat()
-            }
+        # Collector mode: per-site summary, or ?site= for a site's high-water mark
+        elif path == '/api/replicate':
+            if collector is None:
+                self.send_json({'error': 'Not running in collector mode'}, status=404)
+                return
+            status, data = replication.collector_response(collector, 'GET', query, self.headers)
+            self.send_json(data, status)
+            return
             
-            self.wfile.write(json.dumps(data).encode())
+        # Several JSON endpoints in one response: ?r=/api/sensors&r=/api/history%3Ffields%3Dvpd
+        elif path == '/api/batch':
+            status, data, cache_info = batch_response(query.get('r', []), self.headers.get('Authorization'))
+            self.send_json(data, status, cache_info)
             return
             
-        # For data summary endpoint
-        elif self.path == '/api/data-summary':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
+        # Latest (or archived, with ?t=epoch) thermal frame as a heatmap PNG or raw float32
+        elif path in ('/api/thermal/frame.png', '/api/thermal/frame.bin'):
+            self.send_thermal_frame(path.endswith('.png'), query)
+            return
             
-            data_summary = get_data_summary()
-            self.wfile.write(json.dumps(data_summary).encode())
+        # Logged history as a compressed columnar file (Parquet, Arrow or NPZ)
+        elif path == '/api/export':
+            self.send_history_export(query)
             return
             
         # For CSV download endpoint
-        elif self.path == '/download/csv':
+        elif path == '/download/csv':
             self.send_response(200)
             self.send_header('Content-type', 'text/csv')
             self.send_header('Content-Disposition', 'attachment; filename="greenhouse_data.csv"')
             self.end_headers()
             
+            if data_store is not None:
+                self.send_store_csv()
+                return
             with open(CSV_LOG_FILE, 'rb') as file:
                 self.wfile.write(file.read())
             return
             
         return http.server.SimpleHTTPRequestHandler.do_GET(self)
     
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        
+        # POST {"requests": ["/api/sensors", ...]} or {"requests": {"name": "/api/...", ...}}
+        if url.path == '/api/batch':
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                if not 0 < length <= BATCH_MAX_BODY_BYTES:
+                    raise ValueError(f"Body must be 1 to {BATCH_MAX_BODY_BYTES} bytes")
+                sub_requests = json.loads(self.rfile.read(length))['requests']
+                if not isinstance(sub_requests, (list, dict)):
+                    raise ValueError("requests must be a list or an object")
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json({'error': f"Invalid batch request: {e}"}, status=400)
+                return
+            status, data, cache_info = batch_response(sub_requests, self.headers.get('Authorization'))
+            self.send_json(data, status, cache_info)
+            return
+        
+        # Readings pushed by sensor nodes as JSON lines or the binary format (see ingest.py)
+        elif url.path == '/api/ingest':
+            length = self.headers.get('Content-Length', '')
+            length = int(length) if length.isdigit() else 0
+            if not 0 < length <= INGEST_MAX_BODY_BYTES:
+                self.send_json({'error': f"Body must be 1 to {INGEST_MAX_BODY_BYTES} bytes"}, status=413)
+                return
+            try:
+                result = ingest_pipeline.submit(self.rfile.read(length))
+            except ValueError as e:
+                self.send_json({'error': f"Invalid ingest batch: {e}"}, status=400)
+                return
+            except ingest.QueueFull as e:
+                self.send_body(json.dumps({'error': str(e)}).encode(), 'application/json', 503,
+                               headers={'Retry-After': '1'})
+                return
+            self.send_json(result, status=202 if result['accepted'] else 400)
+            return
+        
+        # Replicated history batches from other sites (collector mode, see replication.py)
+        elif url.path == '/api/replicate':
+            if collector is None:
+                self.send_json({'error': 'Not running in collector mode'}, status=404)
+                return
+            length = self.headers.get('Content-Length', '')
+            length = int(length) if length.isdigit() else 0
+            if not 0 < length <= REPLICATION_MAX_BODY_BYTES:
+                self.send_json({'error': f"Body must be 1 to {REPLICATION_MAX_BODY_BYTES} bytes"}, status=413)
+                return
+            status, data = replication.collector_response(collector, 'POST', {}, self.headers,
+                                                          self.rfile.read(length))
+            self.send_json(data, status)
+            return
+        
+        self.send_json({'error': f"Unknown endpoint {url.path}"}, status=404)
+    
+    def send_body(self, body, content_type, status=200, headers=None):
+        """Send a complete response body with its length"""
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_json(self, data, status=200, cache_info=(None, 0)):
+        """Send a JSON response body, compressed and conditional where possible
+        
+        cache_info is (Last-Modified epoch seconds or None, max-age seconds).
+        """
+        body = json.dumps(data).encode()
+        if status != 200:
+            self.send_body(body, 'application/json', status)
+            return
+        
+        last_modified, max_age = cache_info
+        etag = http_cache.make_etag(body)
+        headers = {'ETag': etag, 'Cache-Control': f'max-age={max_age}', 'Vary': 'Accept-Encoding'}
+        if last_modified is not None:
+            headers['Last-Modified'] = http_cache.http_date(last_modified)
+        if http_cache.is_not_modified(self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since'),
+                                      etag, last_modified):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        
+        if len(body) >= http_cache.COMPRESS_MIN_BYTES:
+            encoding = http_cache.negotiate_encoding(self.headers.get('Accept-Encoding'))
+            if encoding is not None:
+                body = compressed_bodies.get(etag, body, encoding)
+                headers['Content-Encoding'] = encoding
+        self.send_body(body, 'application/json', headers=headers)
+    
+    def send_history_export(self, query):
+        """Export the logged history in the requested columnar format"""
+        formats = history_export.available_formats()
+        if not formats:
+            self.send_json({'error': 'NumPy not installed, export unavailable'}, status=503)
+            return
+        fmt = query.get('format', [formats[0]])[0]
+        if fmt not in formats:
+            self.send_json({'error': f"Unsupported format {fmt!r}", 'formats': formats}, status=400)
+            return
+        if not history_available():
+            self.send_json({'error': 'No data file found'}, status=404)
+            return
+        try:
+            start = epoch_time.parse_time(query['start'][0]) if 'start' in query else None
+            end = epoch_time.parse_time(query['end'][0]) if 'end' in query else None
+        except ValueError:
+            self.send_json({'error': 'start and end must be epoch seconds or ISO times'}, status=400)
+            return
+        
+        suffix, content_type = history_export.FORMATS[fmt]
+        with tempfile.TemporaryFile() as exported:
+            started = time.perf_counter()
+            rows = history_export.export_history(history_source(), exported, fmt, start, end)
+            size = exported.tell()
+            logging.info("Exported %d rows as %s (%d bytes) in %.3f s", rows, fmt, size,
+                         time.perf_counter() - started)
+            exported.seek(0)
+            self.send_response(200)
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(size))
+            self.send_header('Content-Disposition', f'attachment; filename="greenhouse_data{suffix}"')
+            self.send_header('X-Export-Rows', str(rows))
+            self.end_headers()
+            shutil.copyfileobj(exported, self.wfile)
+    
+    def send_store_csv(self):
+        """Stream the SQLite history in the CSV log's layout"""
+        text = io.TextIOWrapper(self.wfile, encoding='utf-8', newline='', write_through=True)
+        writer = csv.writer(text)
+        writer.writerow(['timestamp', 'timestamp_ms'] + data_store.fields)
+        for fields, arrays in data_store.iter_chunks():
+            stamps = epoch_time.to_iso_array(arrays['timestamp_ms'])
+            timestamps = arrays['timestamp_ms'].tolist()
+            columns = [arrays[name].tolist() for name in fields]
+            writer.writerows([stamp, t] + ['' if v != v else v for v in values]
+                             for stamp, t, *values in zip(stamps, timestamps, *columns))
+        text.detach()
+    
+    def send_thermal_frame(self, as_png, query):
+        """Serve a thermal frame rendered as PNG or as raw float32 pixels"""
+        try:
+            _lazy_import('numpy')
+        except ImportError:
+            self.send_json({"error": "NumPy not installed, thermal rendering unavailable"}, status=503)
+            return
+        try:
+            scale = min(max(int(query.get('scale', ['10'])[0]), 1), THERMAL_RENDER_MAX_SCALE)
+            at = float(query['t'][0]) if 't' in query else None
+            if at is not None and not (math.isfinite(at) and 0 <= at < THERMAL_MAX_TIMESTAMP):
+                raise ValueError(at)
+        except ValueError:
+            self.send_json({"error": "Invalid scale or t parameter"}, status=400)
+            return
+        
+        if at is None:
+            frame, seq, frame_time = thermal_frame, thermal_frame_seq, thermal_frame_time
+            simulated = thermal_frame_simulated
+            if frame is None:
+                self.send_json({"error": "No thermal frame available yet"}, status=404)
+                return
+            # Rendered once per frame sequence number, shared by every viewer
+            if as_png:
+                body = thermal_frame_cache.get(seq, ('png', scale),
+                                               lambda: thermal_render.render_png(frame, scale))
+            else:
+                body = thermal_frame_cache.get(seq, ('bin',),
+                                               lambda: thermal_render.encode_frame_bin(frame))
+        else:
+            archived = thermal_frame_archive.read_at(at) if thermal_frame_archive is not None else None
+            if archived is None:
+                self.send_json({"error": "No archived thermal frame at that time"}, status=404)
+                return
+            frame_time, frame = archived
+            seq = None
+            simulated = False
+            body = thermal_render.render_png(frame, scale) if as_png else thermal_render.encode_frame_bin(frame)
+        
+        headers = {'X-Frame-Time': f"{frame_time:.3f}", 'X-Frame-Shape': '24x32'}
+        if seq is not None:
+            headers['X-Frame-Seq'] = str(seq)
+        if simulated:
+            headers['X-Frame-Simulated'] = '1'
+        self.send_body(body, 'image/png' if as_png else 'application/octet-stream', headers=headers)
+    
     def log_message(self, format, *args):
-        # Override to use our logger instead of printing to stderr
-        logging.info("%s - %s" % (self.address_string(), format % args))
+        # Override to use our logger instead of printing to stderr.
+        # Access logs are debug-only so polling clients don't flood the log file.
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("%s - %s", self.address_string(), format % args)
 
-# Run the server
 PORT = 8080  # Changed from 1880 to avoid conflict with Node-RED
-with socketserver.TCPServer(("", PORT), SensorHandler) as httpd:
-    print(f"Server running at http://localhost:{PORT}")
-    logging.info(f"Server started on port {PORT}")
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        pass
-    finally:
-        httpd.server_close()
-        logging.info("Server stopped")
+
+class SensorHTTPServer(socketserver.TCPServer):
+    # Rebind immediately after a systemd restart instead of waiting out TIME_WAIT
+    allow_reuse_address = True
+
+def make_simulator(seed=None, diurnal=False, models_file=None, interval=None):
+    """Simulator with the built-in models, or those of a models file (see simulator.load_models)"""
+    if models_file:
+        sensor_models, diurnal_models, thermal_models = simulator.load_models(models_file)
+    else:
+        sensor_models, diurnal_models, thermal_models = (simulator.DEFAULT_SENSOR_MODELS,
+                                                         simulator.DIURNAL_SENSOR_MODELS,
+                                                         simulator.DEFAULT_THERMAL_MODELS)
+    return simulator.SensorSimulator(seed, diurnal_models if diurnal else sensor_models, thermal_models,
+                                     interval=SENSOR_INTERVAL_SECONDS if interval is None else interval)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Greenhouse monitoring web server")
+    parser.add_argument('--port', type=int, default=PORT, help="HTTP port (default %(default)s)")
+    parser.add_argument('--simulate', action='store_true',
+                        help="Use the sensor simulator instead of real hardware")
+    parser.add_argument('--seed', type=int, help="Seed for repeatable simulated data")
+    parser.add_argument('--diurnal', action='store_true',
+                        help="Simulate a 24 hour day instead of the short demo cycles")
+    parser.add_argument('--interval', type=float,
+                        help="Simulated sample period in seconds (e.g. 0.005 for load tests)")
+    parser.add_argument('--sim-models', metavar='JSON',
+                        help="Simulator models overriding the built-in ones, see simulator.load_models")
+    parser.add_argument('--replay', metavar='CSV', help="Replay a recorded greenhouse_data.csv")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Replay speed multiplier, 0 for as fast as possible")
+    parser.add_argument('--loop', action='store_true', help="Restart the replay when it ends")
+    parser.add_argument('--acquisition-process', action='store_true',
+                        help="Sample sensors in a separate, supervised process that shares the "
+                             "latest readings through shared memory")
+    parser.add_argument('--storage', choices=('csv', 'sqlite'), default=STORAGE_BACKEND,
+                        help="History storage backend (default %(default)s)")
+    parser.add_argument('--diagnostics-port', type=int, metavar='PORT',
+                        help="Serve memory/CPU diagnostics (/debug) on 127.0.0.1:PORT, see diagnostics.py")
+    parser.add_argument('--replicate-to', metavar='URL',
+                        help="Ship the logged history to a collector, e.g. http://central:8080/api/replicate")
+    parser.add_argument('--site', default=REPLICATION_SITE,
+                        help="Site name used for replication (default: host name, %(default)s)")
+    parser.add_argument('--collector', action='store_true',
+                        help="Accept and merge replicated history from other sites "
+                             "(requires GREENHOUSE_REPLICATION_TOKEN)")
+    parser.add_argument('--log-mode', choices=('interval',) + deadband.MODES, default=LOG_MODE,
+                        help="CSV logging: a row every %d s, or per-field change-based (default %%(default)s)"
+                        % LOG_INTERVAL_SECONDS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global sensor_simulator, LOG_MODE, STORAGE_BACKEND
+    
+    args = parse_args(argv)
+    LOG_MODE = args.log_mode
+    STORAGE_BACKEND = args.storage
+    setup_logging()
+    load_sensor_plugins()  # Their channels decide the logged columns
+    # Simulated and replayed data never mixes with the greenhouse's own log
+    init_data_paths(SIMULATION_DATA_DIR if args.simulate or args.replay else None)
+    if args.replay and os.path.exists(CSV_LOG_FILE) and os.path.samefile(args.replay, CSV_LOG_FILE):
+        sys.exit(f"Cannot replay {args.replay}: it is the log the replay writes to")
+    migrate_csv_log()
+    init_data_store()
+    init_gap_index()
+    init_integrals(persist=not args.replay)  # Each replay starts its sums from scratch
+    init_forecaster(persist=not args.replay)
+    load_calibration()
+    load_alert_rules()
+    load_canopy_zones()
+    init_thermal_archive()
+    
+    if args.seed is not None or args.diurnal or args.sim_models:
+        try:
+            sensor_simulator = make_simulator(args.seed, args.diurnal, args.sim_models, args.interval)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            sys.exit(f"Cannot load simulator models from {args.sim_models}: {e}")
+    
+    # Start the supervised sensor update worker (or process)
+    if args.replay:
+        # A finished replay is not restarted unless it loops
+        worker_supervisor.add('sensors', replay_sensor_data, (args.replay, args.speed, args.loop),
+                              restart=args.loop)
+    elif args.acquisition_process:
+        start_acquisition_process(args)
+    elif args.simulate:
+        worker_supervisor.add('sensors', simulate_sensor_data, (args.interval,),
+                              heartbeat_timeout=SENSOR_HEARTBEAT_TIMEOUT_SECONDS)
+    else:
+        worker_supervisor.add('sensors', update_sensor_data,
+                              heartbeat_timeout=SENSOR_HEARTBEAT_TIMEOUT_SECONDS)
+    
+    # Start the data logging worker
+    init_change_logger()
+    worker_supervisor.add('logger', log_data, heartbeat_timeout=LOGGER_HEARTBEAT_TIMEOUT_SECONDS)
+    
+    # Apply readings pushed to /api/ingest
+    ingest_pipeline.start()
+    
+    # Poll sensor plugins alongside the main sensor loop
+    plugin_scheduler.start()
+    
+    # Start the retention worker (the CSV rewrite no longer delays startup)
+    worker_supervisor.add('retention', retention_worker)
+    
+    # Opt-in profiling endpoints on a separate, loopback-only listener
+    if args.diagnostics_port:
+        diagnostics = _lazy_import('diagnostics')
+        worker_supervisor.add('diagnostics', diagnostics.serve, (args.diagnostics_port,))
+    
+    if args.collector:
+        start_collector()
+    if args.replicate_to:
+        start_replication(args.replicate_to, args.site)
+    
+    # systemd stops the service with SIGTERM; exit normally so the atexit hooks
+    # (held change-logged rows, integrals, forecast state) still run
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    # Run the server
+    with SensorHTTPServer(("", args.port), SensorHandler) as httpd:
+        startup_seconds = time.monotonic() - PROCESS_START
+        print(f"Server running at http://localhost:{args.port}")
+        logging.info("Server started on port %d (accepting after %.3f s)", args.port, startup_seconds)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+            logging.info("Server stopped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+DS18B20 temperature probe on the kernel 1-Wire bus (w1-gpio + w1-therm).
+
+Reading w1_slave triggers a conversion that blocks for up to 750 ms, so
+this is a blocking plugin run on the scheduler's thread pool.
+
+Options: device (a 28-xxxxxxxxxxxx id; default the first probe found),
+channel (default "nutrient_temperature").
+"""
+
+import glob
+import os
+
+from sensor_plugins import SensorPlugin
+
+W1_DEVICES = '/sys/bus/w1/devices'
+
+
+class Ds18b20Sensor(SensorPlugin):
+    """Temperature in Celsius from a DS18B20 via sysfs"""
+
+    interval = 10.0
+
+    def __init__(self, device=None, channel='nutrient_temperature', **options):
+        super().__init__(**options)
+        self.device = device
+        self.channel = channel
+        self.channels = {channel: 'C'}
+        self.ranges = {channel: (-10.0, 60.0)}
+        self.tolerances = {channel: 0.1}
+
+    def _path(self):
+        if self.device is None:
+            probes = sorted(glob.glob(os.path.join(W1_DEVICES, '28-*')))
+            if not probes:
+                return None
+            self.device = os.path.basename(probes[0])
+        return os.path.join(W1_DEVICES, self.device, 'w1_slave')
+
+    def available(self):
+        path = self._path()
+        return path is not None and os.path.exists(path)
+
+    def read(self):
+        with open(self._path(), 'r') as f:
+            crc_line, data_line = f.read().splitlines()[:2]
+        if not crc_line.endswith('YES'):
+            raise IOError(f"DS18B20 {self.device} CRC check failed")
+        millidegrees = int(data_line.rsplit('t=', 1)[1])
+        if millidegrees == 85000:
+            raise IOError(f"DS18B20 {self.device} returned its power-on value (85 C)")
+        return {self.channel: millidegrees / 1000.0}
+
+
+SENSOR_PLUGIN = Ds18b20Sensor
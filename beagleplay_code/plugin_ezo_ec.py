@@ -0,0 +1,69 @@
+"""
+Atlas Scientific EZO-EC conductivity circuit on I2C.
+
+The EZO takes a command string, needs ~600 ms to process a reading and
+then returns a status byte followed by an ASCII, NUL-terminated value.
+The wait is an asyncio sleep, so it does not hold a scheduler thread.
+Uses raw /dev/i2c-N reads as in Atlas's own examples (no smbus needed).
+
+Options: bus (default 2), address (default 0x64), channel (default "ec").
+"""
+
+import asyncio
+import fcntl
+import os
+
+from sensor_plugins import SensorPlugin
+
+I2C_SLAVE = 0x0703
+RESPONSE_SUCCESS = 1
+READ_DELAY_SECONDS = 0.6
+
+
+class EzoEcSensor(SensorPlugin):
+    """Electrical conductivity in uS/cm from an EZO-EC circuit"""
+
+    interval = 10.0
+
+    def __init__(self, bus=2, address=0x64, channel='ec', **options):
+        super().__init__(**options)
+        self.device = f'/dev/i2c-{bus}'
+        self.address = address
+        self.channel = channel
+        self.channels = {channel: 'uS/cm'}
+        self.ranges = {channel: (0.0, 200000.0)}
+        self.tolerances = {channel: 10.0}
+        self._fd = None
+
+    def _open(self):
+        if self._fd is None:
+            fd = os.open(self.device, os.O_RDWR)
+            fcntl.ioctl(fd, I2C_SLAVE, self.address)
+            self._fd = fd
+        return self._fd
+
+    def available(self):
+        return os.path.exists(self.device)
+
+    async def read(self):
+        fd = self._open()
+        try:
+            os.write(fd, b'R')
+            await asyncio.sleep(READ_DELAY_SECONDS)
+            response = os.read(fd, 31)
+        except OSError:
+            self.close()  # Reopen on the next poll, e.g. after a bus reset
+            raise
+        if not response or response[0] != RESPONSE_SUCCESS:
+            raise IOError(f"EZO-EC at {self.address:#x} returned status {response[:1]!r}")
+        # With only EC enabled the payload is just the value, e.g. b"1413.2\x00..."
+        text = response[1:].split(b'\x00', 1)[0].decode('ascii')
+        return {self.channel: float(text.split(',')[0])}
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+SENSOR_PLUGIN = EzoEcSensor
@@ -0,0 +1,460 @@
+"""
+Store-and-forward replication of the logged history to a central collector.
+
+Each site runs a Replicator that ships records newer than its high-water
+mark (the timestamp_ms of the last record the collector acknowledged) as
+gzip-compressed JSON batches:
+
+  POST /api/replicate   Content-Encoding: gzip
+    {"site": "north", "fields": ["ph", ...],
+     "timestamp_ms": [...], "columns": {"ph": [6.1, null, ...], ...}}
+  -> {"site": "north", "accepted": 500, "high_water_ms": 1790000000000}
+
+The mark only advances after a 2xx response and is persisted atomically,
+so an outage just leaves records waiting in the local log (CSV or SQLite)
+until the collector is reachable again. The collector merges by (site,
+timestamp_ms) with INSERT OR REPLACE, so a batch re-sent after a lost
+acknowledgement is not duplicated. A site that lost its state file asks
+the collector for its high-water mark (GET /api/replicate?site=...) before
+sending anything.
+
+The Collector keeps one SQLite store per site and is used by the server's
+collector mode (ph_web_server.py --collector). It requires a shared bearer
+token for every request, including a site's history (/api/history?site=).
+For trying a site out without a central server, a stand-in collector runs
+standalone:
+
+  python3 replication.py collect --port 9090 --dir /tmp/collector --token SECRET
+"""
+
+import argparse
+import csv
+import gzip
+import hmac
+import http.server
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+import sqlite_store
+
+DEFAULT_BATCH_ROWS = 5000
+MAX_BATCH_BYTES = 16 * 1024 * 1024  # Decompressed
+SITE_NAME = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+
+class ReplicationError(Exception):
+    """The collector rejected a batch or could not be reached"""
+
+
+def _csv_rows_after(csv_path, after_ms, limit):
+    """(fields, rows) of up to `limit` CSV records newer than after_ms.
+
+    Rows are appended in time order, so the first newer row is found by
+    bisecting on file offsets instead of parsing the whole log.
+    """
+    with open(csv_path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode()]), [])
+        data_start = f.tell()
+
+        def line_at(pos):
+            """(offset, bytes) of the first full line starting at or after pos"""
+            if pos <= data_start:
+                f.seek(data_start)
+            else:
+                f.seek(pos - 1)
+                f.readline()
+            return f.tell(), f.readline()
+
+        def newer(line):
+            try:
+                return not line or int(line.split(b',', 2)[1]) > after_ms
+            except (IndexError, ValueError):
+                return False
+
+        low, high = data_start, os.fstat(f.fileno()).st_size
+        while low < high:
+            mid = (low + high) // 2
+            if newer(line_at(mid)[1]):
+                high = mid
+            else:
+                low = mid + 1
+        f.seek(line_at(low)[0])
+        lines = [line.decode() for line in itertools.islice(f, limit)]
+
+    positions = {name: i for i, name in enumerate(header)}
+    fields = [name for name in header if name not in ('timestamp', 'timestamp_ms')]
+    ts_index = positions.get('timestamp_ms')
+    rows = []
+    for row in csv.reader(lines):
+        if ts_index is None or len(row) <= ts_index or not row[ts_index].isdigit():
+            continue
+        timestamp = int(row[ts_index])
+        if timestamp <= after_ms:
+            continue
+        rows.append([timestamp] + [_cell_value(row, positions[name]) for name in fields])
+    return fields, rows
+
+
+def _cell_value(row, i):
+    """A CSV cell as a finite float, or None when empty or corrupt (e.g. a torn last line)"""
+    try:
+        value = float(row[i]) if i < len(row) and row[i] != '' else None
+    except ValueError:
+        return None
+    return value if value is None or math.isfinite(value) else None
+
+
+def _store_rows_after(store, after_ms, limit):
+    for fields, arrays in store.iter_chunks(after_ms + 1, None, limit):
+        columns = [arrays[name].tolist() for name in fields]
+        rows = [[timestamp] + [None if value != value else value for value in values]
+                for timestamp, *values in zip(arrays['timestamp_ms'].tolist(), *columns)]
+        return fields, rows
+    return list(store.fields), []
+
+
+def encode_batch(site, fields, rows):
+    """gzip-compressed JSON body for a batch of [timestamp_ms, value, ...] rows"""
+    payload = {
+        'site': site,
+        'fields': fields,
+        'timestamp_ms': [row[0] for row in rows],
+        'columns': {name: [row[i] for row in rows] for i, name in enumerate(fields, 1)},
+    }
+    return gzip.compress(json.dumps(payload, separators=(',', ':')).encode(), 6)
+
+
+class Replicator:
+    """Ships new records from the local history to a collector; see the module docstring"""
+
+    def __init__(self, url, site, source, state_path, token=None, batch_rows=DEFAULT_BATCH_ROWS, timeout=30):
+        if not SITE_NAME.match(site):
+            raise ValueError(f"Invalid site name {site!r}")
+        self.url = url
+        self.site = site
+        self.source = source  # Callable returning a CSV path or a SqliteStore
+        self.state_path = state_path
+        self.token = token
+        self.batch_rows = batch_rows
+        self.timeout = timeout
+        self.high_water_ms = None
+        self.shipped_rows = 0
+        self.shipped_bytes = 0
+        self.last_success = None
+        self.last_error = None
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if state.get('url') == self.url and state.get('site') == self.site:
+                self.high_water_ms = int(state['high_water_ms'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _save_state(self):
+        temp_path = self.state_path + '.temp'
+        with open(temp_path, 'w') as f:
+            json.dump({'url': self.url, 'site': self.site, 'high_water_ms': self.high_water_ms}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.state_path)
+
+    def _request(self, method, url, body=None):
+        headers = {'Accept': 'application/json'}
+        if body is not None:
+            headers.update({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        request = urllib.request.Request(url, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            raise ReplicationError(f"collector answered {e.code}: {e.read()[:200]!r}") from e
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise ReplicationError(f"collector unreachable: {e}") from e
+
+    def _resume_point(self):
+        """Ask the collector how far it has this site when there is no local state"""
+        query = urllib.parse.urlencode({'site': self.site})
+        result = self._request('GET', f"{self.url}?{query}")
+        self.high_water_ms = int(result.get('high_water_ms') or 0)
+        self._save_state()
+        logging.info("Replication of %s resumes after %s (from the collector)", self.site, self.high_water_ms)
+
+    def pending(self):
+        """(fields, rows) of the next batch after the high-water mark"""
+        source = self.source()
+        after_ms = self.high_water_ms or 0
+        if isinstance(source, str):
+            if not os.path.exists(source):
+                return [], []
+            return _csv_rows_after(source, after_ms, self.batch_rows)
+        return _store_rows_after(source, after_ms, self.batch_rows)
+
+    def ship_once(self):
+        """Send one batch; returns the number of records acknowledged (0 when caught up)"""
+        if self.high_water_ms is None:
+            self._resume_point()
+        fields, rows = self.pending()
+        if not rows:
+            return 0
+        body = encode_batch(self.site, fields, rows)
+        result = self._request('POST', self.url, body)
+        self.high_water_ms = max(self.high_water_ms, rows[-1][0])
+        self._save_state()
+        self.shipped_rows += len(rows)
+        self.shipped_bytes += len(body)
+        self.last_success = time.time()
+        logging.debug("Replicated %d records (%d bytes) to %s, collector has %s",
+                      len(rows), len(body), self.url, result.get('high_water_ms'))
+        return len(rows)
+
+    def run(self, interval=60, max_backoff=600, heartbeat=None):
+        """Ship until caught up, then every `interval` s; back off while unreachable"""
+        backoff = interval
+        while True:
+            if heartbeat is not None:
+                heartbeat()
+            try:
+                while self.ship_once() >= self.batch_rows:
+                    if heartbeat is not None:
+                        heartbeat()
+                self.last_error = None
+                backoff = interval
+            except ReplicationError as e:
+                self.last_error = str(e)
+                logging.warning("Replication to %s failed, retrying in %d s: %s", self.url, backoff, e)
+                time.sleep(backoff)
+                backoff = min(max_backoff, backoff * 2)
+                continue
+            time.sleep(interval)
+
+    def status(self):
+        return {
+            'collector': self.url,
+            'site': self.site,
+            'high_water_ms': self.high_water_ms,
+            'shipped_rows': self.shipped_rows,
+            'shipped_bytes': self.shipped_bytes,
+            'last_success': self.last_success,
+            'last_error': self.last_error,
+        }
+
+
+def _is_int64(value):
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63
+
+
+def _is_number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:  # An int too large for a float
+        return False
+
+
+class Collector:
+    """Merges batches from many sites into one SQLite store per site
+
+    A token is required: without one, anyone who can reach the port could
+    create a database for any site name and read every site's history.
+    """
+
+    def __init__(self, directory, token):
+        if not token:
+            raise ValueError("a collector needs a replication token (GREENHOUSE_REPLICATION_TOKEN or --token)")
+        self.directory = directory
+        self.token = token
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stores = {}
+        self.last_received = {}
+        for name in os.listdir(directory):
+            if name.endswith('.db') and SITE_NAME.match(name[:-3]):
+                self.store(name[:-3])
+
+    def store(self, site):
+        with self._lock:
+            store = self._stores.get(site)
+            if store is None:
+                store = sqlite_store.SqliteStore(os.path.join(self.directory, site + '.db'), [])
+                self._stores[site] = store
+            return store
+
+    def sites(self):
+        with self._lock:
+            return sorted(self._stores)
+
+    def existing_store(self, site):
+        """The store of a site that has replicated to this collector, or None"""
+        with self._lock:
+            return self._stores.get(site)
+
+    def authorized(self, authorization):
+        return hmac.compare_digest(authorization or '', f'Bearer {self.token}')
+
+    def receive(self, body, content_encoding=None):
+        """Merge one batch; returns the acknowledgement. Raises ValueError for bad batches"""
+        if content_encoding == 'gzip':
+            try:
+                with gzip.GzipFile(fileobj=io.BytesIO(body)) as f:
+                    body = f.read(MAX_BATCH_BYTES + 1)
+            except (OSError, EOFError, zlib.error) as e:
+                raise ValueError(f"corrupt gzip body: {e}") from e
+            if len(body) > MAX_BATCH_BYTES:
+                raise ValueError(f"batch larger than {MAX_BATCH_BYTES} bytes decompressed")
+        elif content_encoding not in (None, '', 'identity'):
+            raise ValueError(f"unsupported Content-Encoding {content_encoding!r}")
+        try:
+            batch = json.loads(body)
+            site = batch['site']
+            fields = batch['fields']
+            timestamps = batch['timestamp_ms']
+            columns = batch['columns']
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"malformed batch: {e}") from e
+        if not isinstance(site, str) or not SITE_NAME.match(site):
+            raise ValueError(f"invalid site name {site!r}")
+        if not isinstance(fields, list) or not all(isinstance(name, str) and re.match(r'^[A-Za-z0-9_]{1,64}$', name)
+                                                   for name in fields):
+            raise ValueError("invalid field names")
+        if not isinstance(timestamps, list) or not all(_is_int64(timestamp) for timestamp in timestamps):
+            raise ValueError("timestamp_ms must be a list of integer epoch milliseconds")
+        if not isinstance(columns, dict) or not all(isinstance(columns.get(name), list) for name in fields):
+            raise ValueError("columns must map every field to a list")
+        if any(len(columns[name]) != len(timestamps) for name in fields):
+            raise ValueError("column lengths differ from timestamp_ms")
+        if not all(value is None or _is_number(value) for name in fields for value in columns[name]):
+            raise ValueError("column values must be numbers or null")
+
+        store = self.store(site)
+        store.ensure_fields(fields)
+        rows = [{'timestamp_ms': int(timestamp)} for timestamp in timestamps]
+        for name in fields:
+            for row, value in zip(rows, columns[name]):
+                if value is not None:
+                    row[name] = float(value)
+        accepted = store.write_rows(rows)
+        self.last_received[site] = time.time()
+        return {'site': site, 'accepted': accepted, 'high_water_ms': store.last_timestamp()}
+
+    def high_water(self, site):
+        if not SITE_NAME.match(site):
+            raise ValueError(f"invalid site name {site!r}")
+        store = self.existing_store(site)
+        return {'site': site, 'high_water_ms': store.last_timestamp() if store is not None else None}
+
+    def summary(self):
+        with self._lock:
+            stores = dict(self._stores)
+        sites = {}
+        for site, store in sorted(stores.items()):
+            records, first_ms, last_ms = store.summary()
+            sites[site] = {'records': records, 'first_record_ms': first_ms, 'last_record_ms': last_ms,
+                           'last_received': self.last_received.get(site),
+                           'file_size_mb': round(store.size_bytes() / (1024 * 1024), 2)}
+        return {'sites': sites}
+
+
+def collector_response(collector, method, query, headers, body=None):
+    """(status, data) for a collector request; shared by the server and the stand-in"""
+    if not collector.authorized(headers.get('Authorization')):
+        return 401, {'error': 'Missing or wrong replication token'}
+    try:
+        if method == 'POST':
+            return 200, collector.receive(body, headers.get('Content-Encoding'))
+        if 'site' in query:
+            return 200, collector.high_water(query['site'][0])
+        return 200, collector.summary()
+    except (ValueError, OSError) as e:
+        return 400, {'error': str(e)}
+    except sqlite3.Error as e:
+        logging.error("Collector store error: %s", e)
+        return 500, {'error': f"Store error: {e}"}
+
+
+def collector_server(port, directory, token):
+    """Minimal stand-in collector answering /api/replicate (not yet serving)"""
+    collector = Collector(directory, token)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def _reply(self, status, data):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path != '/api/replicate':
+                return self._reply(404, {'error': 'Not found'})
+            self._reply(*collector_response(collector, 'GET', urllib.parse.parse_qs(url.query), self.headers))
+
+        def do_POST(self):
+            if urllib.parse.urlsplit(self.path).path != '/api/replicate':
+                return self._reply(404, {'error': 'Not found'})
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            self._reply(*collector_response(collector, 'POST', {}, self.headers, body))
+
+    server = http.server.ThreadingHTTPServer(('', port), Handler)
+    server.collector = collector
+    return server
+
+
+def serve_collector(port, directory, token):
+    """Run the stand-in collector until interrupted"""
+    with collector_server(port, directory, token) as server:
+        print(f"Collector listening on port {server.server_address[1]}, storing sites in {directory}")
+        server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Greenhouse history replication")
+    sub = parser.add_subparsers(dest='command', required=True)
+    collect = sub.add_parser('collect', help="Run a stand-in collector")
+    collect.add_argument('--port', type=int, default=9090)
+    collect.add_argument('--dir', default='collector-data', help="Directory for the per-site databases")
+    collect.add_argument('--token', required=True, help="Bearer token the sites must send")
+    ship = sub.add_parser('ship', help="Ship a CSV log or SQLite database once, until caught up")
+    ship.add_argument('source', help="greenhouse_data.csv or greenhouse_data.db")
+    ship.add_argument('url', help="Collector URL, e.g. http://host:8080/api/replicate")
+    ship.add_argument('--site', required=True)
+    ship.add_argument('--state', default='replication_state.json')
+    ship.add_argument('--token')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    if args.command == 'collect':
+        serve_collector(args.port, args.dir, args.token)
+    else:
+        source = args.source if args.source.endswith('.csv') else sqlite_store.SqliteStore(args.source, [])
+        replicator = Replicator(args.url, args.site, lambda: source, args.state, args.token)
+        total = 0
+        while True:
+            shipped = replicator.ship_once()
+            total += shipped
+            if shipped < replicator.batch_rows:
+                break
+        print(f"Shipped {total} records, high-water mark {replicator.high_water_ms}")
+
+
+if __name__ == '__main__':
+    main()
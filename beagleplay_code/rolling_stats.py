@@ -0,0 +1,205 @@
+"""
+Rolling-window statistics and anomaly detection for live sensor samples.
+
+Every field keeps a fixed-size ring buffer of its most recent samples and
+updates mean, standard deviation, min/max and an EWMA in O(1) per sample,
+so the web server can answer /api/stats and /api/alerts from memory
+without touching the data log on disk.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+
+
+class RollingWindow:
+    """O(1) moving statistics over the last `size` samples of one field"""
+
+    def __init__(self, size, ewma_alpha=0.1):
+        self.size = size
+        self.ewma_alpha = ewma_alpha
+        self._buffer = [0.0] * size
+        self._head = 0  # Index of the next slot to write
+        self._count = 0
+        self._seq = 0  # Total samples ever added, used by the min/max deques
+        self._mean = 0.0
+        self._m2 = 0.0  # Sum of squared deviations from the mean
+        self._min = deque()  # (seq, value), values increasing
+        self._max = deque()  # (seq, value), values decreasing
+        self.ewma = None
+        self.last = None
+        self.repeat_count = 0  # Consecutive samples equal to the last one
+
+    def add(self, value):
+        if value == self.last:
+            self.repeat_count += 1
+        else:
+            self.repeat_count = 1
+        self.last = value
+
+        if self._count < self.size:
+            # Window still filling: standard Welford update
+            self._count += 1
+            delta = value - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (value - self._mean)
+        else:
+            # Window full: replace the oldest sample in place
+            old = self._buffer[self._head]
+            old_mean = self._mean
+            self._mean += (value - old) / self.size
+            self._m2 += (value - old) * (value - self._mean + old - old_mean)
+            if self._m2 < 0.0:
+                self._m2 = 0.0  # Guard against float drift
+        self._buffer[self._head] = value
+        self._head = (self._head + 1) % self.size
+
+        seq = self._seq
+        self._seq += 1
+        expired = seq - self.size
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((seq, value))
+        while self._min[0][0] <= expired:
+            self._min.popleft()
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((seq, value))
+        while self._max[0][0] <= expired:
+            self._max.popleft()
+
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            self.ewma += self.ewma_alpha * (value - self.ewma)
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def std_dev(self):
+        if self._count < 2:
+            return 0.0
+        return math.sqrt(self._m2 / (self._count - 1))
+
+    @property
+    def minimum(self):
+        return self._min[0][1] if self._min else None
+
+    @property
+    def maximum(self):
+        return self._max[0][1] if self._max else None
+
+    def summary(self):
+        return {
+            'count': self._count,
+            'last': self.last,
+            'mean': round(self._mean, 4),
+            'std_dev': round(self.std_dev, 4),
+            'min': self.minimum,
+            'max': self.maximum,
+            'ewma': round(self.ewma, 4) if self.ewma is not None else None,
+        }
+
+
+class StatsEngine:
+    """Rolling statistics and anomaly flags for a set of sample fields.
+
+    `rules` maps a field name to optional detector settings:
+      spike_sigma    - flag samples this many std-devs away from the window mean
+      stuck_samples  - flag a value that repeats this many samples in a row
+      collapse_below - flag values below this floor (e.g. a thermal std-dev
+                       collapsing to zero when the camera image freezes)
+    """
+
+    def __init__(self, fields, window_size=720, ewma_alpha=0.1, rules=None,
+                 min_samples=30, history_size=200):
+        self.fields = list(fields)
+        self.window_size = window_size
+        self.rules = rules or {}
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._windows = {field: RollingWindow(window_size, ewma_alpha) for field in self.fields}
+        self._active = {}  # (field, kind) -> alert dict
+        self._history = deque(maxlen=history_size)
+        self.last_update = None
+
+    def update(self, sample, timestamp=None):
+        """Add one sample (a dict of field -> value) and re-evaluate alerts"""
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+            self.last_update = timestamp
+            for field in self.fields:
+                value = sample.get(field)
+                if not isinstance(value, (int, float)):
+                    continue
+                window = self._windows[field]
+                rule = self.rules.get(field, {})
+
+                # Spikes are judged against the window before the new sample
+                spike_sigma = rule.get('spike_sigma')
+                if spike_sigma and window.count >= self.min_samples:
+                    std_dev = window.std_dev
+                    deviation = abs(value - window.mean)
+                    spiking = std_dev > 0 and deviation > spike_sigma * std_dev
+                    self._set_alert(field, 'spike', spiking, value, timestamp,
+                                    f"{field} deviates {deviation:.2f} from mean {window.mean:.2f}")
+
+                window.add(value)
+
+                stuck_samples = rule.get('stuck_samples')
+                if stuck_samples:
+                    stuck = window.repeat_count >= stuck_samples
+                    self._set_alert(field, 'stuck', stuck, value, timestamp,
+                                    f"{field} unchanged for {window.repeat_count} samples")
+
+                collapse_below = rule.get('collapse_below')
+                if collapse_below is not None:
+                    collapsed = value < collapse_below
+                    self._set_alert(field, 'collapse', collapsed, value, timestamp,
+                                    f"{field} {value} below {collapse_below}")
+
+    def _set_alert(self, field, kind, active, value, timestamp, message):
+        key = (field, kind)
+        if active:
+            if key not in self._active:
+                alert = {
+                    'field': field,
+                    'type': kind,
+                    'value': value,
+                    'since': timestamp,
+                    'message': message,
+                }
+                self._active[key] = alert
+                self._history.append(dict(alert, event='raised'))
+            else:
+                self._active[key]['value'] = value
+                self._active[key]['message'] = message
+        elif key in self._active:
+            alert = self._active.pop(key)
+            self._history.append(dict(alert, event='cleared', value=value, cleared=timestamp))
+
+    def stats(self):
+        """Summary of every field's rolling window"""
+        with self._lock:
+            return {
+                'window_size': self.window_size,
+                'last_update': self.last_update,
+                'fields': {field: window.summary() for field, window in self._windows.items()},
+            }
+
+    def alerts(self):
+        """Currently active alerts and the recent raise/clear history"""
+        with self._lock:
+            return {
+                'active': [dict(alert) for alert in self._active.values()],
+                'history': list(self._history),
+            }
@@ -0,0 +1,180 @@
+"""
+Sensor plugins: self-describing reading sources run by a concurrent scheduler.
+
+A plugin is a SensorPlugin subclass in a module named plugin_<type>.py next
+to this file, exported as SENSOR_PLUGIN. It declares its channels (name ->
+unit), default poll interval, and either a blocking read() or an
+`async def read()`. New probes are added by dropping in a module and an
+entry in sensor_plugins.json; the sensor loop is not touched:
+
+  {"plugins": [
+     {"type": "ezo_ec", "enabled": true, "bus": 2, "address": 100, "interval": 10},
+     {"type": "ds18b20", "enabled": true, "channel": "nutrient_temperature"}]}
+
+The channels of the enabled plugins are the only plugin channels the
+server logs, tracks and accepts on /api/ingest (see declared_channels);
+"ingest_ids" gives a channel a binary ingest id, e.g. {"ec": 5}.
+
+Plugin types are discovered from file names without importing anything;
+only the modules of enabled entries are imported. The scheduler runs one
+asyncio task per plugin in its own thread: async reads interleave on the
+event loop, blocking reads go to a small thread pool, so a slow 1-Wire
+conversion never delays an I2C probe or the main sensor loop.
+"""
+
+import asyncio
+import glob
+import importlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODULE_PREFIX = 'plugin_'
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class SensorPlugin:
+    """Base class for sensor plugins; options come from the config entry"""
+
+    channels = {}  # channel name -> unit
+    ranges = {}  # channel name -> (min, max) of plausible values, for pushed readings
+    tolerances = {}  # channel name -> change-logging deadband
+    interval = 10.0  # Default poll interval in seconds
+
+    def __init__(self, interval=None, ingest_ids=None, **options):
+        if interval is not None:
+            self.interval = float(interval)
+        self.ingest_ids = dict(ingest_ids or {})
+        self.options = options
+
+    def available(self):
+        """Whether the hardware is present; unavailable plugins are not scheduled"""
+        return True
+
+    def read(self):
+        """Return {channel: value} (None values are skipped); may be async"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def discover(directory=PLUGIN_DIR):
+    """Plugin type -> module name for every plugin module, without importing them"""
+    types = {}
+    for path in glob.glob(os.path.join(directory, MODULE_PREFIX + '*.py')):
+        module = os.path.basename(path)[:-3]
+        types[module[len(MODULE_PREFIX):]] = module
+    return types
+
+
+def load_plugins(config, directory=PLUGIN_DIR):
+    """Instantiate the enabled plugins of a config dict, importing only their modules"""
+    types = discover(directory)
+    plugins = []
+    for entry in config.get('plugins', []):
+        options = dict(entry)
+        plugin_type = options.pop('type', None)
+        if not options.pop('enabled', True):
+            continue
+        module_name = types.get(plugin_type)
+        if module_name is None:
+            raise ValueError(f"Unknown sensor plugin type {plugin_type!r} (available: {', '.join(sorted(types))})")
+        plugin_class = importlib.import_module(module_name).SENSOR_PLUGIN
+        plugins.append(plugin_class(**options))
+    return plugins
+
+
+def load_plugins_file(path, directory=PLUGIN_DIR):
+    with open(path, 'r') as f:
+        return load_plugins(json.load(f), directory)
+
+
+def declared_channels(plugins):
+    """Channel name -> {'unit', 'range', 'tolerance', 'ingest_id'} over all plugins"""
+    channels = {}
+    for plugin in plugins:
+        for name, unit in plugin.channels.items():
+            if name in channels:
+                raise ValueError(f"Channel {name!r} is declared by more than one plugin")
+            channels[name] = {'unit': unit, 'range': plugin.ranges.get(name),
+                              'tolerance': plugin.tolerances.get(name), 'ingest_id': plugin.ingest_ids.get(name)}
+    return channels
+
+
+class PluginScheduler:
+    """Polls plugins concurrently and passes their readings to `apply`"""
+
+    def __init__(self, plugins, apply, max_workers=4):
+        self.plugins = plugins
+        self.apply = apply
+        self.max_workers = max_workers
+        self._thread = None
+        self._lock = threading.Lock()
+        self._status = {id(plugin): {'type': type(plugin).__name__, 'channels': dict(plugin.channels),
+                                     'interval': plugin.interval, 'active': False, 'reads': 0,
+                                     'errors': 0, 'last_read': None, 'last_error': None,
+                                     'last_duration_ms': None, 'readings': {}}
+                        for plugin in plugins}
+
+    def start(self):
+        if self._thread is None and self.plugins:
+            self._thread = threading.Thread(target=self._run, name='sensor-plugins', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='sensor-plugin') as pool:
+            loop = asyncio.get_running_loop()
+            active = []
+            for plugin in self.plugins:
+                try:
+                    present = await loop.run_in_executor(pool, plugin.available)
+                except Exception as e:
+                    logging.error("Sensor plugin %s probe failed: %s", type(plugin).__name__, e)
+                    present = False
+                if present:
+                    active.append(plugin)
+                    self._status[id(plugin)]['active'] = True
+                else:
+                    logging.warning("Sensor plugin %s: hardware not found, not scheduled", type(plugin).__name__)
+            logging.info("Scheduling %d sensor plugins: %s", len(active),
+                         ', '.join(type(plugin).__name__ for plugin in active))
+            await asyncio.gather(*(self._poll(plugin, loop, pool) for plugin in active))
+
+    async def _poll(self, plugin, loop, pool):
+        status = self._status[id(plugin)]
+        is_async = inspect.iscoroutinefunction(plugin.read)
+        while True:
+            started = time.monotonic()
+            try:
+                if is_async:
+                    values = await plugin.read()
+                else:
+                    values = await loop.run_in_executor(pool, plugin.read)
+                values = {name: value for name, value in (values or {}).items() if value is not None}
+                if values:
+                    self.apply(values)
+                with self._lock:
+                    status['reads'] += 1
+                    status['last_read'] = time.time()
+                    status['readings'] = values
+            except Exception as e:
+                with self._lock:
+                    status['errors'] += 1
+                    status['last_error'] = str(e)
+                logging.error("Sensor plugin %s read failed: %s", type(plugin).__name__, e)
+            elapsed = time.monotonic() - started
+            status['last_duration_ms'] = round(elapsed * 1000, 1)
+            await asyncio.sleep(max(0.0, plugin.interval - elapsed))
+
+    def status(self):
+        """Per-plugin channels, schedule and read statistics"""
+        with self._lock:
+            return [dict(status) for status in self._status.values()]
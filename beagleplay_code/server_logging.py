@@ -0,0 +1,171 @@
+"""
+Low-overhead logging setup for the greenhouse web server.
+
+Records are handed to a QueueHandler on the calling thread and written to
+disk by a QueueListener thread, so sensor and HTTP threads never wait on
+the SD card. Messages are not formatted until the listener writes them.
+A throttle filter drops repeated messages from the same call site and the
+log file is rotated by size.
+"""
+
+import copy
+import json
+import logging
+import logging.handlers
+import pickle
+import queue
+import threading
+import time
+
+DEFAULT_FORMAT = '%(asctime)s - %(message)s'
+
+
+class ThrottleFilter(logging.Filter):
+    """Rate-limit and deduplicate records per call site.
+
+    Each call site (file + line) may emit up to `burst` records per
+    `interval` seconds, and a record identical to the last one emitted from
+    that call site is dropped until the interval expires. The next record
+    that gets through reports how many were suppressed.
+    """
+
+    def __init__(self, interval=60.0, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._sites = {}
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                # [window_start, emitted_in_window, suppressed, last_args]
+                site = [now, 0, 0, None]
+                self._sites[key] = site
+
+            if now - site[0] >= self.interval:
+                site[0] = now
+                site[1] = 0
+            elif site[1] >= self.burst or record.args == site[3]:
+                site[2] += 1
+                return False
+
+            site[1] += 1
+            site[3] = record.args
+            suppressed = site[2]
+            site[2] = 0
+
+        if suppressed:
+            # Merge the args first so a literal % in the message stays literal
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = ()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock QueueHandler merges msg and args on the calling thread; since
+    the queue never leaves this process the record can be passed as-is.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(log_file, level=logging.INFO, json_format=False,
+                      max_bytes=5 * 1024 * 1024, backup_count=3,
+                      throttle_interval=60.0, throttle_burst=5):
+    """Install the queued, throttled, rotating log path on the root logger.
+
+    Returns the running QueueListener; call stop() on it at shutdown to
+    flush pending records.
+    """
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count)
+    if json_format:
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(DEFAULT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(ThrottleFilter(throttle_interval, throttle_burst))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    return listener
+
+
+class _ForwardHandler(logging.Handler):
+    """Re-dispatch records from another process to this process's loggers"""
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def forward_child_logs(log_queue):
+    """Feed records that child processes put on log_queue into this process's log.
+
+    Returns the running QueueListener.
+    """
+    listener = logging.handlers.QueueListener(log_queue, _ForwardHandler())
+    listener.start()
+    return listener
+
+
+class _ChildQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for a child process: keeps msg and args apart where they pickle.
+
+    The parent's ThrottleFilter tells records from one call site apart by
+    their args, so they are only merged into the message when they cannot
+    cross the process boundary.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            pickle.dumps(record.args)
+        except Exception:
+            record.msg = record.getMessage()
+            record.args = ()
+        return record
+
+
+def configure_child_logging(log_queue, level=logging.INFO):
+    """Send all records of a child process to the parent through log_queue"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_ChildQueueHandler(log_queue))
+    root.setLevel(level)
@@ -13,7 +13,7 @@ echo "🌱 Setting up automated greenhouse sensor system..."
 
 # Deploy updated Python web server
 echo "📁 Deploying updated web server code..."
-scp ph_web_server.py ${BEAGLEPLAY_USER}@${BEAGLEPLAY_IP}:/home/debian/
+scp *.py *.json ${BEAGLEPLAY_USER}@${BEAGLEPLAY_IP}:/home/debian/
 
 # Deploy custom gbridge service
 echo "🔧 Deploying custom gbridge service..."
@@ -0,0 +1,229 @@
+"""
+Latest sensor state in a shared memory block, guarded by an flock and a write sequence.
+
+The acquisition process is the single writer; the web server and any
+other local consumer (Node-RED bridge, exporters) map the same block and
+read it without pipes, sockets or serialization. The layout is a fixed
+NumPy structured record:
+
+  magic        b'GHSTATE3' (layout version)
+  seq          write sequence; odd while a write is in progress
+  writer_pid   pid of the acquisition process
+  sample_ms    epoch ms of the sample
+  frame_seq    incremented for every new thermal frame
+  flags        FLAG_THERMAL_AVAILABLE, FLAG_FRAME
+  values       float64 per name in FIELDS (NaN = no reading); sensor plugins
+               are polled by the server process and are not shared here
+  frame        float32[768] latest thermal frame (24 x 32, row-major)
+
+Writes and reads take an flock on the block (exclusive for the writer,
+shared for readers). NumPy stores are plain memory writes with no
+ordering guarantees, so without a lock a reader on a weakly ordered CPU
+(the BeaglePlay's ARM64 cores) could see the new seq with old values;
+the lock's acquire and release order them. Readers poll the lock without
+blocking, and the copy is ~3 KB, so neither side waits for more than
+microseconds. seq stays a cheap lock-free change check, and a record
+left with an odd seq by a writer that died mid-write is reported as
+unavailable rather than read torn.
+
+  python3 shared_state.py [name]   prints the current state as JSON
+"""
+
+import fcntl
+import json
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+DEFAULT_NAME = 'greenhouse_state'
+MAGIC = b'GHSTATE3'
+FRAME_PIXELS = 768
+
+FIELDS = ('ph', 'temperature', 'humidity', 'light',
+          'thermal_min_temp', 'thermal_max_temp', 'thermal_mean_temp', 'thermal_median_temp',
+          'thermal_range_temp', 'thermal_mode_temp', 'thermal_std_dev_temp',
+          # Uncalibrated readings, logged next to the calibrated ones
+          'ph_raw', 'temperature_raw', 'humidity_raw', 'light_raw')
+
+FLAG_THERMAL_AVAILABLE = 1
+FLAG_FRAME = 2
+
+STATE_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('seq', '<u8'),
+    ('writer_pid', '<i8'),
+    ('sample_ms', '<i8'),
+    ('frame_seq', '<u8'),
+    ('flags', '<u8'),
+    ('values', '<f8', (len(FIELDS),)),
+    ('frame', '<f4', (FRAME_PIXELS,)),
+])
+
+READ_RETRIES = 1000
+SHM_DIR = '/dev/shm'
+
+
+class StateUnavailable(Exception):
+    """No consistent state could be read (no writer yet, or a stuck write)"""
+
+
+class SharedState:
+    """One shared memory block holding the latest sample; see the module docstring"""
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        self.name = shm.name
+        # A descriptor of our own for the flock (POSIX shared memory lives in /dev/shm)
+        self._lock_fd = os.open(os.path.join(SHM_DIR, shm.name.lstrip('/')), os.O_RDONLY)
+        self.record = np.ndarray((), dtype=STATE_DTYPE, buffer=shm.buf)  # Zero-copy view
+        self._seq = self.record['seq'].reshape(1)  # In-place view of the counter
+
+    @classmethod
+    def create(cls, name=DEFAULT_NAME):
+        """Create the block (replacing a stale one left by a crashed server)"""
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=STATE_DTYPE.itemsize)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=STATE_DTYPE.itemsize)
+        state = cls(shm, owner=True)
+        state.record[()] = np.zeros((), dtype=STATE_DTYPE)
+        state.record['magic'] = MAGIC
+        state.record['values'] = np.nan
+        return state
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME, track=False):
+        """Map an existing block for reading or as the writer.
+
+        Independent consumers leave track False so that their resource
+        tracker does not unlink the block when they exit; processes started
+        by the server through multiprocessing share its tracker and pass True.
+        """
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name, track=track)
+        else:
+            shm = shared_memory.SharedMemory(name)
+            if not track:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        if bytes(shm.buf[:len(MAGIC)]) != MAGIC:
+            shm.close()
+            raise ValueError(f"Shared memory block {name!r} does not hold greenhouse state")
+        return cls(shm, owner=False)
+
+    def write(self, values, sample_ms, frame=None, thermal_available=False):
+        """Publish a sample (single writer only); frame is written when given"""
+        record = self.record
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            self._write(record, values, sample_ms, frame, thermal_available)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _write(self, record, values, sample_ms, frame, thermal_available):
+        if self._seq[0] & 1:
+            self._seq[0] += 1  # The previous writer died mid-write
+        self._seq[0] += 1  # Odd: write in progress
+        record['values'] = [np.nan if values.get(name) is None else values[name] for name in FIELDS]
+        record['sample_ms'] = sample_ms
+        flags = FLAG_THERMAL_AVAILABLE if thermal_available else 0
+        if frame is not None:
+            record['frame'] = frame
+            record['frame_seq'] += 1
+            flags |= FLAG_FRAME
+        elif record['frame_seq']:
+            flags |= FLAG_FRAME
+        record['flags'] = flags
+        record['writer_pid'] = os.getpid()
+        self._seq[0] += 1  # Even: consistent again
+
+    @property
+    def seq(self):
+        """Current write sequence (cheap change check before a full read)"""
+        if self._seq is None:
+            raise StateUnavailable(f"{self.name!r} is closed")
+        return int(self._seq[0])
+
+    def read(self, frame_seq_seen=None):
+        """A consistent copy of the state as a dict.
+
+        The thermal frame is only copied when its sequence differs from
+        frame_seq_seen; otherwise 'frame' is None.
+        """
+        record = self.record
+        if record is None:
+            raise StateUnavailable(f"{self.name!r} is closed")
+        fd = self._lock_fd
+        for attempt in range(READ_RETRIES):
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(0)  # The writer holds it for microseconds
+        else:
+            raise StateUnavailable(f"{self.name!r} stayed locked for {READ_RETRIES} attempts")
+        try:
+            before = int(self._seq[0])
+            values = record['values'].copy()
+            sample_ms = int(record['sample_ms'])
+            frame_seq = int(record['frame_seq'])
+            flags = int(record['flags'])
+            writer_pid = int(record['writer_pid'])
+            frame = None
+            if flags & FLAG_FRAME and frame_seq != frame_seq_seen:
+                frame = record['frame'].copy()
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        if before == 0:
+            raise StateUnavailable(f"Nothing has been written to {self.name!r} yet")
+        if before & 1:
+            raise StateUnavailable(f"The writer of {self.name!r} died in the middle of a write")
+        return {
+            'seq': before,
+            'writer_pid': writer_pid,
+            'sample_ms': sample_ms,
+            'thermal_available': bool(flags & FLAG_THERMAL_AVAILABLE),
+            'frame_seq': frame_seq,
+            'frame': frame,
+            'values': {name: float(value) for name, value in zip(FIELDS, values.tolist())
+                       if value == value},  # Skip NaN
+        }
+
+    def close(self):
+        """Unmap the block, and remove it if this process created it"""
+        self.record = None
+        self._seq = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # A reader still holds a view; the mapping goes with the process
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    state = SharedState.attach(argv[0] if argv else DEFAULT_NAME)
+    try:
+        snapshot = state.read()
+    finally:
+        state.close()
+    snapshot.pop('frame')
+    print(json.dumps(snapshot))
+
+
+if __name__ == '__main__':
+    main()
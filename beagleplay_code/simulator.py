@@ -0,0 +1,222 @@
+"""
+Simulated and replayed sensor sources.
+
+SensorSimulator generates seeded, deterministic sensor and thermal camera
+readings from configurable diurnal models; it replaces the ad-hoc
+random.uniform fallbacks that used to live in the sensor and thermal
+readers. CsvReplaySource plays back a recorded greenhouse_data.csv at N x
+speed so the rest of the pipeline can be exercised with real data.
+"""
+
+import csv
+import json
+import math
+import random
+import time
+from datetime import datetime
+
+# Each model: value = base + amplitude * sin(2*pi*(t + phase) / period) + noise
+# "follows" adds a multiple of another channel's periodic variation, and
+# "clamp" bounds the result. Periods match the original inline generator.
+DEFAULT_SENSOR_MODELS = {
+    'temperature': {'base': 25.0, 'amplitude': 3.0, 'period': 2 * math.pi * 3600, 'noise': 0.5},
+    'humidity': {'base': 55.0, 'follows': ('temperature', -2.0), 'noise': 2.0, 'clamp': (30, 80)},
+    'light': {'base': 800.0, 'amplitude': 600.0, 'period': 2 * math.pi * 7200, 'noise': 50.0, 'clamp': (50, None)},
+    'ph': {'base': 6.8, 'amplitude': 0.6, 'period': 2 * math.pi * 10800, 'noise': 0.1, 'clamp': (5.5, 8.5)},
+}
+
+# Thermal camera statistics when no camera is reachable
+DEFAULT_THERMAL_MODELS = {
+    'thermal_min_temp': {'base': 18.5, 'noise': 1.0},
+    'thermal_max_temp': {'base': 32.1, 'noise': 1.0},
+    'thermal_mean_temp': {'base': 25.3, 'noise': 1.0},
+    'thermal_median_temp': {'base': 24.8, 'noise': 1.0},
+    'thermal_mode_temp': {'base': 24.2, 'noise': 1.0},
+    'thermal_std_dev_temp': {'base': 3.2, 'noise': 0.5},
+}
+
+# A real 24 hour cycle peaking mid-afternoon, for longer simulations
+DIURNAL_SENSOR_MODELS = {
+    'temperature': {'base': 22.0, 'amplitude': 6.0, 'period': 86400, 'phase': -32400, 'noise': 0.2},
+    'humidity': {'base': 60.0, 'follows': ('temperature', -2.5), 'noise': 1.0, 'clamp': (20, 95)},
+    'light': {'base': 600.0, 'amplitude': 900.0, 'period': 86400, 'phase': -21600, 'noise': 30.0, 'clamp': (0, None)},
+    'ph': {'base': 6.5, 'amplitude': 0.2, 'period': 86400, 'noise': 0.05, 'clamp': (5.5, 8.5)},
+}
+
+
+# Where a seeded simulator's clock starts (2025-06-21T00:00:00Z)
+SEEDED_START = 1750464000.0
+
+
+def load_models(path):
+    """Sensor, diurnal and thermal models from a JSON file, each over the defaults.
+
+    The file may hold any of "sensors", "diurnal" and "thermal", each
+    mapping channel names to models in the format above; a channel given
+    there replaces the built-in model of the same name.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    models = []
+    for section, defaults in (('sensors', DEFAULT_SENSOR_MODELS), ('diurnal', DIURNAL_SENSOR_MODELS),
+                              ('thermal', DEFAULT_THERMAL_MODELS)):
+        merged = dict(defaults)
+        for name, model in config.get(section, {}).items():
+            if 'base' not in model or (model.get('amplitude') and not model.get('period')):
+                raise ValueError(f"{section} model {name!r} needs a base (and a period with an amplitude)")
+            model = dict(model)
+            for key in ('follows', 'clamp'):
+                if key in model:
+                    model[key] = tuple(model[key])
+            merged[name] = model
+        models.append(merged)
+    return tuple(models)
+
+
+class SensorSimulator:
+    """Deterministic sensor readings from diurnal models and a seeded RNG
+
+    Unseeded, the models follow the wall clock. A seeded simulator runs on
+    its own clock instead, starting at SEEDED_START and advancing by
+    `interval` seconds per read_sensors() call, so a seed reproduces the
+    same series whenever it is run.
+    """
+
+    def __init__(self, seed=None, sensor_models=None, thermal_models=None, decimals=1, interval=5.0):
+        self.rng = random.Random(seed)
+        self.sensor_models = sensor_models or DEFAULT_SENSOR_MODELS
+        self.thermal_models = thermal_models or DEFAULT_THERMAL_MODELS
+        self.decimals = decimals
+        self.interval = interval
+        self.clock = None if seed is None else SEEDED_START
+
+    def _now(self, now):
+        if now is not None:
+            return now
+        return time.time() if self.clock is None else self.clock
+
+    def _evaluate(self, models, now):
+        variations = {}
+        values = {}
+        for name, model in models.items():
+            variation = 0.0
+            amplitude = model.get('amplitude')
+            if amplitude:
+                angle = 2 * math.pi * (now + model.get('phase', 0.0)) / model['period']
+                variation = amplitude * math.sin(angle)
+            follows = model.get('follows')
+            if follows:
+                variation += follows[1] * variations.get(follows[0], 0.0)
+            variations[name] = variation
+
+            noise = model.get('noise', 0.0)
+            value = model['base'] + variation + self.rng.uniform(-noise, noise)
+            low, high = model.get('clamp', (None, None))
+            if low is not None:
+                value = max(low, value)
+            if high is not None:
+                value = min(high, value)
+            values[name] = value
+        return values
+
+    def read_sensors(self, now=None):
+        """Simulated temperature, humidity, light and pH readings"""
+        values = self._evaluate(self.sensor_models, self._now(now))
+        if now is None and self.clock is not None:
+            self.clock += self.interval
+        return {name: round(value, self.decimals) for name, value in values.items()}
+
+    def read_thermal(self, now=None):
+        """Simulated thermal camera summary statistics"""
+        values = self._evaluate(self.thermal_models, self._now(now))
+        if 'thermal_max_temp' in values and 'thermal_min_temp' in values:
+            values['thermal_range_temp'] = values['thermal_max_temp'] - values['thermal_min_temp']
+        return values
+
+    def read_thermal_frame(self, stats=None):
+        """Simulated 24 x 32 thermal frame (flat row-major list, Celsius)
+
+        A cool canopy in the middle of the view fading to warmer floor and
+        walls at the edges, spanning the given thermal statistics.
+        """
+        return _simulate_frame(self.rng, stats or self.read_thermal())
+
+
+# Simulated scene layout for thermal frames (rows x columns of the MLX90640)
+FRAME_ROWS = 24
+FRAME_COLS = 32
+
+
+def _frame_weights():
+    """Per-pixel canopy weight: 1 in the middle of the view, 0 at the edges"""
+    weights = []
+    for row in range(FRAME_ROWS):
+        for col in range(FRAME_COLS):
+            dy = (row - (FRAME_ROWS - 1) / 2) / (FRAME_ROWS / 2)
+            dx = (col - (FRAME_COLS - 1) / 2) / (FRAME_COLS / 2)
+            weights.append(max(0.0, 1.0 - (dx * dx + dy * dy)))
+    return weights
+
+_FRAME_WEIGHTS = _frame_weights()
+
+
+def _simulate_frame(rng, stats):
+    # Transpiring leaves run cooler than the sunlit pots and floor around them
+    low = stats.get('thermal_min_temp', 18.0)
+    high = stats.get('thermal_max_temp', 30.0)
+    noise = 0.15 * stats.get('thermal_std_dev_temp', 1.0)
+    return [high - (high - low) * weight + rng.gauss(0.0, noise) for weight in _FRAME_WEIGHTS]
+
+
+def _parse_row(row):
+    sample = {}
+    for key, value in row.items():
+        if key in ('timestamp', 'timestamp_ms') or value in (None, ''):
+            continue
+        try:
+            sample[key] = float(value)
+        except ValueError:
+            pass
+    return sample
+
+
+class CsvReplaySource:
+    """Replay rows of a recorded greenhouse_data.csv as timed samples.
+
+    Yields (timestamp, sample) pairs, sleeping between rows so that the
+    recording plays back `speed` times faster than it was captured. A speed
+    of 0 replays as fast as the consumer can take samples.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+
+    def _rows(self):
+        with open(self.path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    if row.get('timestamp_ms'):
+                        timestamp = int(row['timestamp_ms']) / 1000.0
+                    else:
+                        timestamp = datetime.fromisoformat(row['timestamp'].replace('Z', '+00:00')).timestamp()
+                except (KeyError, TypeError, ValueError, AttributeError):
+                    continue  # Repeated header rows or corrupt lines
+                yield timestamp, _parse_row(row)
+
+    def __iter__(self):
+        while True:
+            first_recorded = None
+            started = time.monotonic()
+            for timestamp, sample in self._rows():
+                if first_recorded is None:
+                    first_recorded = timestamp
+                if self.speed > 0:
+                    due = started + (timestamp - first_recorded) / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                yield timestamp, sample
+            if not self.loop:
+                return
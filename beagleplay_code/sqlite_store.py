@@ -0,0 +1,307 @@
+"""
+SQLite storage backend for the logged sensor history.
+
+An alternative to greenhouse_data.csv for long retention: one table whose
+INTEGER PRIMARY KEY is timestamp_ms, so rows are stored clustered in time
+order in the table B-tree and every time-range query, summary and
+retention pass is an index seek instead of a scan of the whole file.
+
+  - WAL journal (synchronous=NORMAL): HTTP readers never block the logger
+    and the logger never blocks readers; a commit is one sequential WAL
+    append instead of a rewrite
+  - writes from the logger go through one connection as executemany
+    batches in a single transaction
+  - reads use a small pool of read-only connections shared by the HTTP
+    threads
+  - retention is one indexed DELETE ... WHERE timestamp_ms < ?
+  - columns are added with ALTER TABLE when the logged fields grow
+
+iter_chunks()/load_columns() return the same arrays as the CSV readers in
+history_export, so history queries and exports work on either backend.
+
+  python3 sqlite_store.py --benchmark [--days 90]   CSV vs SQLite timings
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+TABLE = 'readings'
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CHUNK_ROWS = 50000
+
+
+class SqliteStore:
+    """Time-indexed readings table; see the module docstring"""
+
+    def __init__(self, path, fields, pool_size=DEFAULT_POOL_SIZE):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._writer = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        self._writer.execute('PRAGMA synchronous=NORMAL')
+        self._writer.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} (timestamp_ms INTEGER PRIMARY KEY)')
+        self.fields = []
+        self.ensure_fields(fields)
+        self.last_write_time = os.path.getmtime(path)
+        self.version = 0  # Bumped on every write or delete, for read caches
+        self._pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect_reader())
+
+    def _connect_reader(self):
+        connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+        connection.execute('PRAGMA query_only=ON')
+        return connection
+
+    def ensure_fields(self, fields):
+        """Add columns for any fields the table does not have yet"""
+        with self._write_lock:
+            existing = [row[1] for row in self._writer.execute(f'PRAGMA table_info({TABLE})')]
+            for name in fields:
+                if name not in existing and name != 'timestamp_ms':
+                    self._writer.execute(f'ALTER TABLE {TABLE} ADD COLUMN "{name}" REAL')
+                    existing.append(name)
+            self.fields = [name for name in existing if name != 'timestamp_ms']
+
+    @contextlib.contextmanager
+    def reader(self):
+        """A pooled read connection (blocks while all are in use)"""
+        connection = self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    def write_rows(self, rows):
+        """Insert (or replace) dict rows keyed by timestamp_ms in one transaction"""
+        if not rows:
+            return 0
+        fields = self.fields
+        columns = ', '.join(['timestamp_ms'] + [f'"{name}"' for name in fields])
+        placeholders = ', '.join('?' * (len(fields) + 1))
+        values = [(int(row['timestamp_ms']),) + tuple(row.get(name) for name in fields) for row in rows]
+        with self._write_lock:
+            self._writer.execute('BEGIN')
+            try:
+                self._writer.executemany(f'INSERT OR REPLACE INTO {TABLE} ({columns}) VALUES ({placeholders})',
+                                         values)
+            except BaseException:
+                self._writer.execute('ROLLBACK')
+                raise
+            self._writer.execute('COMMIT')
+            self.version += 1
+            self.last_write_time = time.time()
+        return len(values)
+
+    def delete_before(self, cutoff_ms):
+        """Drop rows older than cutoff_ms; returns how many were deleted"""
+        with self._write_lock:
+            deleted = self._writer.execute(f'DELETE FROM {TABLE} WHERE timestamp_ms < ?', (cutoff_ms,)).rowcount
+            if deleted:
+                self.version += 1
+                self.last_write_time = time.time()
+        return deleted
+
+    def summary(self):
+        """(row count, first timestamp_ms, last timestamp_ms)"""
+        with self.reader() as connection:
+            # count(*) scans the table; min and max are single B-tree seeks only
+            # as queries of their own, hence the subqueries
+            return connection.execute(f'SELECT count(*), (SELECT min(timestamp_ms) FROM {TABLE}), '
+                                      f'(SELECT max(timestamp_ms) FROM {TABLE}) FROM {TABLE}').fetchone()
+
+    def last_timestamp(self):
+        """timestamp_ms of the newest row (one B-tree seek), or None when empty"""
+        with self.reader() as connection:
+            return connection.execute(f'SELECT max(timestamp_ms) FROM {TABLE}').fetchone()[0]
+
+    def size_bytes(self):
+        """Database plus WAL size on disk"""
+        return sum(os.path.getsize(self.path + suffix) for suffix in ('', '-wal')
+                   if os.path.exists(self.path + suffix))
+
+    def iter_chunks(self, start_ms=None, end_ms=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Yield (fields, arrays) like history_export.iter_chunks, read by primary key range"""
+        import numpy as np
+        fields = list(self.fields)
+        columns = ', '.join(['timestamp_ms'] + [f'"{name}"' for name in fields])
+        where, params = _range_clause(start_ms, end_ms)
+        with self.reader() as connection:
+            cursor = connection.execute(f'SELECT {columns} FROM {TABLE}{where} ORDER BY timestamp_ms', params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield fields, _to_arrays(np, rows, fields)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        with self._write_lock:
+            self._writer.close()
+
+
+def _range_clause(start_ms, end_ms):
+    clauses, params = [], []
+    if start_ms is not None:
+        clauses.append('timestamp_ms >= ?')
+        params.append(int(start_ms))
+    if end_ms is not None:
+        clauses.append('timestamp_ms <= ?')
+        params.append(int(end_ms))
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def _to_arrays(np, rows, fields):
+    # None (SQL NULL) becomes NaN in a float64 array
+    table = np.array(rows, dtype=np.float64).reshape(len(rows), len(fields) + 1)
+    arrays = {'timestamp_ms': np.array([row[0] for row in rows], dtype=np.int64)}
+    for i, name in enumerate(fields, 1):
+        arrays[name] = table[:, i]
+    return arrays
+
+
+def import_csv(store, csv_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Copy a CSV log into the store; returns the number of rows"""
+    import history_export
+    import numpy as np
+    imported = 0
+    for fields, arrays in history_export.iter_chunks(csv_path, chunk_rows=chunk_rows):
+        store.ensure_fields(fields)
+        timestamps = arrays['timestamp_ms'].tolist()
+        columns = [arrays[name].tolist() for name in fields]
+        rows = []
+        for i, timestamp in enumerate(timestamps):
+            row = {'timestamp_ms': timestamp}
+            for name, values in zip(fields, columns):
+                value = values[i]
+                if not np.isnan(value):
+                    row[name] = value
+            rows.append(row)
+        imported += store.write_rows(rows)
+    return imported
+
+
+def _synthetic_rows(days, interval_s, fields, start_ms):
+    import numpy as np
+    count = int(days * 86400 / interval_s)
+    t = start_ms + np.arange(count, dtype=np.int64) * int(interval_s * 1000)
+    phase = (t / 86400000.0) * 2 * np.pi
+    rng = np.random.default_rng(0)
+    columns = {name: np.round(20 + 5 * np.sin(phase + i) + rng.normal(0, 0.2, count), 3)
+               for i, name in enumerate(fields)}
+    return t, columns
+
+
+def benchmark(days=90, interval_s=300, directory=None):
+    """Time the CSV and SQLite paths on a synthetic `days`-day log"""
+    import numpy as np
+    import epoch_time
+    import history_export
+
+    fields = ['ph', 'temperature', 'humidity', 'vpd', 'thermal_mean_temp', 'ec']
+    now_ms = epoch_time.now_ms()
+    start_ms = now_ms - days * 86400000
+    t, columns = _synthetic_rows(days, interval_s, fields, start_ms)
+    rows = [dict(zip(['timestamp_ms'] + fields, values))
+            for values in zip(t.tolist(), *(columns[name].tolist() for name in fields))]
+    day_start = now_ms - 86400000
+    cutoff = start_ms + 86400000  # Retention drops the oldest day
+    results = {'rows': len(rows)}
+
+    directory = tempfile.mkdtemp(dir=directory)
+    try:
+        csv_path = os.path.join(directory, 'bench.csv')
+        started = time.perf_counter()
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['timestamp', 'timestamp_ms'] + fields, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                row['timestamp'] = epoch_time.to_iso(row['timestamp_ms'])
+                writer.writerow(row)
+        results['csv_write_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with open(csv_path, 'rb') as f:
+            count = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) - 1
+        results['csv_summary_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        history = history_export.load_columns(csv_path, day_start, now_ms)
+        results['csv_last_day_s'] = time.perf_counter() - started
+        results['csv_last_day_rows'] = len(history['timestamp_ms'])
+
+        started = time.perf_counter()
+        with open(csv_path, 'r') as infile, open(csv_path + '.temp', 'w') as outfile:
+            outfile.write(infile.readline())
+            for line in infile:
+                if int(line.split(',', 2)[1]) >= cutoff:
+                    outfile.write(line)
+                    break
+            shutil.copyfileobj(infile, outfile)
+        os.replace(csv_path + '.temp', csv_path)
+        results['csv_retention_s'] = time.perf_counter() - started
+        results['csv_bytes'] = os.path.getsize(csv_path)
+
+        store = SqliteStore(os.path.join(directory, 'bench.db'), fields)
+        started = time.perf_counter()
+        for i in range(0, len(rows), 1000):
+            store.write_rows(rows[i:i + 1000])
+        results['sqlite_write_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        count_db = store.summary()[0]
+        results['sqlite_summary_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        history = history_export.load_columns(store, day_start, now_ms)
+        results['sqlite_last_day_s'] = time.perf_counter() - started
+        results['sqlite_last_day_rows'] = len(history['timestamp_ms'])
+
+        started = time.perf_counter()
+        store.delete_before(cutoff)
+        results['sqlite_retention_s'] = time.perf_counter() - started
+        results['sqlite_bytes'] = store.size_bytes()
+        store.close()
+        assert count == count_db == len(rows) and np.isfinite(history['temperature']).all()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite history backend tools")
+    parser.add_argument('--benchmark', action='store_true', help="Compare the CSV and SQLite paths")
+    parser.add_argument('--days', type=float, default=90, help="Synthetic history length (default %(default)s)")
+    parser.add_argument('--interval', type=float, default=300,
+                        help="Synthetic row interval in seconds (default %(default)s)")
+    parser.add_argument('--import-csv', nargs=2, metavar=('CSV', 'DB'), help="Copy a CSV log into a database")
+    args = parser.parse_args(argv)
+
+    if args.import_csv:
+        csv_path, db_path = args.import_csv
+        store = SqliteStore(db_path, [])
+        started = time.perf_counter()
+        rows = import_csv(store, csv_path)
+        store.close()
+        print(f"Imported {rows} rows into {db_path} in {time.perf_counter() - started:.2f} s")
+    if args.benchmark:
+        results = benchmark(args.days, args.interval)
+        print(f"{results['rows']:,} rows ({args.days:g} days at {args.interval:g} s)")
+        for step in ('write', 'summary', 'last_day', 'retention'):
+            csv_s, sqlite_s = results[f'csv_{step}_s'], results[f'sqlite_{step}_s']
+            print(f"  {step:<10} csv {csv_s * 1000:10.1f} ms   sqlite {sqlite_s * 1000:10.1f} ms"
+                  f"   ({csv_s / sqlite_s if sqlite_s else float('inf'):.1f}x)")
+        print(f"  size       csv {results['csv_bytes'] / 1e6:8.1f} MB     sqlite {results['sqlite_bytes'] / 1e6:8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Supervised worker threads with heartbeats and restart backoff.
+
+Each worker's target runs inside a supervisor-owned thread. If it raises
+(or returns when it is meant to run forever) the error is logged and the
+target is started again after an exponential backoff, reset once a run
+has lasted `stable_seconds`. Workers call beat(name) from their loop; a
+worker whose last heartbeat is older than its heartbeat_timeout is
+reported as stalled (Python cannot kill a stuck thread, so whoever owns
+a blocking resource decides what to do about it, see stalled()).
+"""
+
+import logging
+import threading
+import time
+
+
+class Worker:
+    """Bookkeeping for one supervised target"""
+
+    def __init__(self, name, target, args=(), heartbeat_timeout=None, restart=True):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.heartbeat_timeout = heartbeat_timeout
+        self.restart = restart
+        self.state = 'new'
+        self.thread = None
+        self.started_at = None
+        self.last_heartbeat = None
+        self.restarts = 0
+        self.failures = 0  # Consecutive failed runs, drives the backoff
+        self.last_error = None
+        self.last_error_time = None
+
+
+class Supervisor:
+    """Runs workers in threads, restarting failed ones with exponential backoff"""
+
+    def __init__(self, initial_backoff=1.0, max_backoff=300.0, stable_seconds=600.0):
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.stable_seconds = stable_seconds
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, target, args=(), heartbeat_timeout=None, restart=True):
+        """Register and start a worker"""
+        worker = Worker(name, target, args, heartbeat_timeout, restart)
+        with self._lock:
+            if name in self._workers:
+                raise ValueError(f"Worker {name!r} already registered")
+            self._workers[name] = worker
+        worker.thread = threading.Thread(target=self._run, args=(worker,), name=name, daemon=True)
+        worker.thread.start()
+        return worker
+
+    def beat(self, name):
+        """Record a heartbeat (unknown names are ignored, e.g. in a child process)"""
+        worker = self._workers.get(name)
+        if worker is not None:
+            worker.last_heartbeat = time.monotonic()
+
+    def stalled(self, name):
+        """Whether a running worker has missed its heartbeat deadline"""
+        worker = self._workers.get(name)
+        return worker is not None and self._is_stalled(worker, time.monotonic())
+
+    def _is_stalled(self, worker, now):
+        return (worker.state == 'running' and worker.heartbeat_timeout is not None
+                and now - worker.last_heartbeat > worker.heartbeat_timeout)
+
+    def _run(self, worker):
+        while True:
+            worker.started_at = worker.last_heartbeat = time.monotonic()
+            worker.state = 'running'
+            try:
+                worker.target(*worker.args)
+                if not worker.restart:
+                    worker.state = 'finished'
+                    logging.info("Worker %s finished", worker.name)
+                    return
+                error = 'returned unexpectedly'
+            except Exception as e:
+                logging.exception("Worker %s failed", worker.name)
+                error = f"{type(e).__name__}: {e}"
+
+            ran = time.monotonic() - worker.started_at
+            if ran >= self.stable_seconds:
+                worker.failures = 0
+            delay = min(self.max_backoff, self.initial_backoff * 2 ** worker.failures)
+            worker.failures += 1
+            worker.restarts += 1
+            worker.last_error = error
+            worker.last_error_time = time.time()
+            worker.state = 'backoff'
+            logging.error("Worker %s stopped after %.1f s (%s), restarting in %.1f s (restart %d)",
+                          worker.name, ran, error, delay, worker.restarts)
+            time.sleep(delay)
+
+    def status(self):
+        """Per-worker state, heartbeat age and restart history"""
+        now = time.monotonic()
+        with self._lock:
+            workers = list(self._workers.values())
+        return {
+            worker.name: {
+                'state': worker.state,
+                'healthy': worker.state in ('running', 'finished') and not self._is_stalled(worker, now),
+                'stalled': self._is_stalled(worker, now),
+                'heartbeat_age_s': None if worker.last_heartbeat is None else round(now - worker.last_heartbeat, 1),
+                'heartbeat_timeout_s': worker.heartbeat_timeout,
+                'uptime_s': None if worker.started_at is None or worker.state != 'running'
+                            else round(now - worker.started_at, 1),
+                'restarts': worker.restarts,
+                'last_error': worker.last_error,
+                'last_error_time': worker.last_error_time,
+            }
+            for worker in workers
+        }
+
+    def healthy(self):
+        return all(worker['healthy'] for worker in self.status().values())
@@ -0,0 +1,140 @@
+"""
+Replication against a local stand-in collector (replication.collector_server).
+
+  python3 -m pytest test_replication.py    (or python3 -m unittest test_replication)
+"""
+
+import csv
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import replication
+
+TOKEN = 'test-token'
+START_MS = 1790000000000
+STEP_MS = 300000
+
+
+def write_log(path, first, count):
+    """Append `count` CSV rows, numbered from `first`, to a greenhouse_data.csv style log"""
+    new = not os.path.exists(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(['timestamp', 'timestamp_ms', 'ph', 'temperature'])
+        for i in range(first, first + count):
+            writer.writerow(['', START_MS + i * STEP_MS, 6.0 + i / 100, 20.0 + i / 10])
+
+
+class LostAckReplicator(replication.Replicator):
+    """Loses the acknowledgement of the next batch the collector accepts"""
+
+    lose_next_ack = False
+
+    def _request(self, method, url, body=None):
+        result = super()._request(method, url, body)
+        if method == 'POST' and self.lose_next_ack:
+            self.lose_next_ack = False
+            raise replication.ReplicationError("connection reset before the acknowledgement")
+        return result
+
+
+class StandInCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = os.path.join(self.directory, 'greenhouse_data.csv')
+        self.state = os.path.join(self.directory, 'replication_state.json')
+        self.sites = os.path.join(self.directory, 'sites')
+        self.port = 0
+        self.server = None
+        self.start_collector()
+
+    def tearDown(self):
+        self.stop_collector()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def start_collector(self):
+        self.server = replication.collector_server(self.port, self.sites, TOKEN)
+        self.server.allow_reuse_address = True
+        self.port = self.server.server_address[1]
+        self.url = f'http://127.0.0.1:{self.port}/api/replicate'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop_collector(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def replicator(self, cls=replication.Replicator, state=None, batch_rows=50):
+        return cls(self.url, 'north', lambda: self.log, state or self.state, TOKEN, batch_rows=batch_rows, timeout=5)
+
+    def ship_all(self, replicator):
+        total = 0
+        while True:
+            shipped = replicator.ship_once()
+            total += shipped
+            if shipped < replicator.batch_rows:
+                return total
+
+    def collected(self):
+        """(record count, first, last timestamp_ms) the collector holds for the site"""
+        return replication.Collector(self.sites, TOKEN).store('north').summary()
+
+    def test_resumes_after_outage_without_loss(self):
+        write_log(self.log, 0, 120)
+        replicator = self.replicator()
+        self.assertEqual(self.ship_all(replicator), 120)
+
+        self.stop_collector()
+        write_log(self.log, 120, 80)
+        with self.assertRaises(replication.ReplicationError):
+            replicator.ship_once()
+        self.assertEqual(replicator.high_water_ms, START_MS + 119 * STEP_MS)
+
+        self.start_collector()
+        self.assertEqual(self.ship_all(replicator), 80)
+        self.assertEqual(self.collected(), (200, START_MS, START_MS + 199 * STEP_MS))
+
+    def test_resent_batch_after_lost_ack_is_not_duplicated(self):
+        write_log(self.log, 0, 30)
+        replicator = self.replicator(LostAckReplicator)
+        replicator.lose_next_ack = True
+        with self.assertRaises(replication.ReplicationError):
+            replicator.ship_once()
+        self.assertEqual(replicator.high_water_ms, 0)  # Not advanced without the acknowledgement
+        self.assertEqual(self.collected()[0], 30)
+
+        self.assertEqual(self.ship_all(replicator), 30)  # The same batch again
+        self.assertEqual(self.collected(), (30, START_MS, START_MS + 29 * STEP_MS))
+
+    def test_site_without_state_resumes_from_collector_high_water_mark(self):
+        write_log(self.log, 0, 40)
+        self.ship_all(self.replicator())
+        os.remove(self.state)
+
+        write_log(self.log, 40, 10)
+        replicator = self.replicator()
+        self.assertIsNone(replicator.high_water_ms)
+        self.assertEqual(self.ship_all(replicator), 10)
+        self.assertEqual(replicator.shipped_rows, 10)
+        self.assertEqual(self.collected(), (50, START_MS, START_MS + 49 * STEP_MS))
+
+    def test_malformed_batches_are_rejected(self):
+        collector = self.server.collector
+        headers = {'Authorization': f'Bearer {TOKEN}'}
+        for body in (b'{"site": "north", "fields": ["ph"], "timestamp_ms": [null], "columns": {"ph": [1]}}',
+                     b'{"site": "north", "fields": ["ph"], "timestamp_ms": [1], "columns": []}',
+                     b'{"site": "north", "fields": ["ph"], "timestamp_ms": [1], "columns": {"ph": ["x"]}}'):
+            status, data = replication.collector_response(collector, 'POST', {}, headers, body)
+            self.assertEqual(status, 400, data)
+        status, _ = replication.collector_response(collector, 'GET', {}, {})
+        self.assertEqual(status, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
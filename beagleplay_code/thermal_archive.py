@@ -0,0 +1,297 @@
+"""
+Compact append-only archive of thermal camera frames.
+
+Frames (24 x 32 floats in Celsius) are quantized to int16 centi-degrees.
+Each frame is stored either as a keyframe or as the int16 difference from
+the previous frame; either way the payload is zlib-compressed, and since
+consecutive canopy frames barely change the deltas compress very well.
+A keyframe is written every `keyframe_interval` frames and at the start
+of every segment, so decoding any frame never replays more than that
+many deltas.
+
+The archive is split into one segment per UTC day:
+  thermal-YYYYMMDD.bin  concatenated compressed payloads
+  thermal-YYYYMMDD.idx  fixed-size entries (timestamp_ms, offset, length, flags)
+Segments older than `retention_days` are deleted, which bounds disk use.
+Readers memory-map both files, so random access to any past frame only
+touches the pages it needs.
+
+Requires NumPy.
+"""
+
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+FRAME_ROWS = 24
+FRAME_COLS = 32
+FRAME_PIXELS = FRAME_ROWS * FRAME_COLS
+
+INDEX_ENTRY = struct.Struct('<qQII')  # timestamp_ms, offset, length, flags
+FLAG_KEYFRAME = 1
+
+SEGMENT_PREFIX = 'thermal-'
+
+
+def quantize(frame):
+    """Convert a frame in Celsius to int16 centi-degrees"""
+    import numpy as np
+    array = np.asarray(frame, dtype=np.float64).reshape(FRAME_PIXELS)
+    return np.clip(np.rint(array * 100.0), -32768, 32767).astype('<i2')
+
+
+def dequantize(frame):
+    """Convert int16 centi-degrees back to a float32 (24, 32) frame in Celsius"""
+    import numpy as np
+    return (frame.astype(np.float32) / np.float32(100.0)).reshape(FRAME_ROWS, FRAME_COLS)
+
+
+def _segment_day(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d')
+
+
+class _SegmentReader:
+    """Memory-mapped view of one segment's index and data files"""
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self._index_size = -1
+        self._index_map = None
+        self._data_map = None
+        self._data_size = -1
+        self.timestamps = []
+
+    def refresh(self):
+        """Re-map the files if the writer has appended since the last read"""
+        index_size = os.path.getsize(self.base_path + '.idx')
+        if index_size != self._index_size:
+            if self._index_map is not None:
+                self._index_map.close()
+            self._index_map = None
+            usable = index_size - index_size % INDEX_ENTRY.size
+            if usable:
+                with open(self.base_path + '.idx', 'rb') as f:
+                    self._index_map = mmap.mmap(f.fileno(), usable, access=mmap.ACCESS_READ)
+            self._index_size = index_size
+            known = len(self.timestamps) * INDEX_ENTRY.size
+            if usable < known:
+                self.timestamps = []
+                known = 0
+            # Only unpack the entries appended since the last refresh
+            self.timestamps.extend(INDEX_ENTRY.unpack_from(self._index_map, i)[0]
+                                   for i in range(known, usable, INDEX_ENTRY.size))
+
+        data_size = os.path.getsize(self.base_path + '.bin')
+        if data_size != self._data_size:
+            if self._data_map is not None:
+                self._data_map.close()
+            self._data_map = None
+            if data_size:
+                with open(self.base_path + '.bin', 'rb') as f:
+                    self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._data_size = data_size
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def entry(self, i):
+        return INDEX_ENTRY.unpack_from(self._index_map, i * INDEX_ENTRY.size)
+
+    def payload(self, i):
+        import numpy as np
+        _, offset, length, _ = self.entry(i)
+        return np.frombuffer(zlib.decompress(self._data_map[offset:offset + length]), dtype='<i2')
+
+    def decode(self, i):
+        """Decode frame i: its keyframe plus the deltas that follow it"""
+        import numpy as np
+        start = i
+        while not self.entry(start)[3] & FLAG_KEYFRAME:
+            start -= 1
+        frame = self.payload(start)
+        if start < i:
+            deltas = np.stack([self.payload(j) for j in range(start + 1, i + 1)])
+            # int16 arithmetic wraps, which exactly undoes the wrapped deltas
+            frame = frame + deltas.sum(axis=0, dtype=np.int16)
+        return frame
+
+    def close(self):
+        for mapped in (self._index_map, self._data_map):
+            if mapped is not None:
+                mapped.close()
+        self._index_map = self._data_map = None
+
+
+class ThermalArchive:
+    """Append-only, delta-encoded, day-segmented thermal frame store"""
+
+    def __init__(self, directory, keyframe_interval=60, retention_days=21, compress_level=6):
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.retention_days = retention_days
+        self.compress_level = compress_level
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._day = None
+        self._data_file = None
+        self._index_file = None
+        self._offset = 0
+        self._previous = None
+        self._since_keyframe = 0
+        self._readers = {}
+
+    def _base_path(self, day):
+        return os.path.join(self.directory, SEGMENT_PREFIX + day)
+
+    def segments(self):
+        """Days that have a segment on disk, oldest first"""
+        days = set()
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith('.idx'):
+                days.add(name[len(SEGMENT_PREFIX):-4])
+        return sorted(days)
+
+    def _open_segment(self, day):
+        self._close_writer()
+        base = self._base_path(day)
+        self._data_file = open(base + '.bin', 'ab')
+        self._index_file = open(base + '.idx', 'ab')
+
+        # Drop a torn index entry, then any data past the last indexed record
+        index_size = self._index_file.tell()
+        if index_size % INDEX_ENTRY.size:
+            self._index_file.truncate(index_size - index_size % INDEX_ENTRY.size)
+            index_size -= index_size % INDEX_ENTRY.size
+        end = 0
+        if index_size:
+            with open(base + '.idx', 'rb') as f:
+                f.seek(index_size - INDEX_ENTRY.size)
+                _, offset, length, _ = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+                end = offset + length
+        if self._data_file.tell() != end:
+            self._data_file.truncate(end)
+        self._offset = end
+        self._day = day
+        self._previous = None  # Every segment (and every restart) begins with a keyframe
+
+    def _close_writer(self):
+        for f in (self._data_file, self._index_file):
+            if f is not None:
+                f.close()
+        self._data_file = self._index_file = None
+
+    def append(self, frame, timestamp=None):
+        """Quantize, encode and append one frame"""
+        if timestamp is None:
+            timestamp = time.time()
+        current = quantize(frame)
+
+        with self._lock:
+            day = _segment_day(timestamp)
+            if day != self._day:
+                self._open_segment(day)
+                self.prune()
+
+            keyframe = self._previous is None or self._since_keyframe >= self.keyframe_interval
+            if keyframe:
+                raw = current
+                self._since_keyframe = 0
+            else:
+                raw = current - self._previous  # Wraps in int16; decode wraps back
+                self._since_keyframe += 1
+            payload = zlib.compress(raw.tobytes(), self.compress_level)
+
+            self._data_file.write(payload)
+            self._data_file.flush()
+            self._index_file.write(INDEX_ENTRY.pack(int(timestamp * 1000), self._offset, len(payload),
+                                                    FLAG_KEYFRAME if keyframe else 0))
+            self._index_file.flush()
+            self._offset += len(payload)
+            self._previous = current
+
+    def _reader(self, day):
+        reader = self._readers.get(day)
+        if reader is None:
+            reader = _SegmentReader(self._base_path(day))
+            self._readers[day] = reader
+        reader.refresh()
+        return reader
+
+    def read_at(self, timestamp):
+        """Return (timestamp, frame) for the last frame at or before `timestamp`"""
+        target_ms = int(timestamp * 1000)
+        with self._lock:
+            days = [day for day in self.segments() if day <= _segment_day(timestamp)]
+            for day in reversed(days):
+                reader = self._reader(day)
+                i = bisect.bisect_right(reader.timestamps, target_ms) - 1
+                if i >= 0:
+                    return reader.timestamps[i] / 1000.0, dequantize(reader.decode(i))
+        return None
+
+    def read_range(self, start, end, step=1):
+        """Yield (timestamp, frame) for every `step`-th frame in [start, end]"""
+        start_ms, end_ms = int(start * 1000), int(end * 1000)
+        for day in self.segments():
+            if day < _segment_day(start) or day > _segment_day(end):
+                continue
+            with self._lock:
+                reader = self._reader(day)
+                first = bisect.bisect_left(reader.timestamps, start_ms)
+                last = bisect.bisect_right(reader.timestamps, end_ms)
+                indices = list(range(first, last, step))
+            for i in indices:
+                with self._lock:
+                    frame = reader.decode(i)
+                yield reader.timestamps[i] / 1000.0, dequantize(frame)
+
+    def prune(self):
+        """Delete segments older than the retention period"""
+        cutoff = _segment_day(time.time() - self.retention_days * 86400)
+        for day in self.segments():
+            if day < cutoff and day != self._day:
+                reader = self._readers.pop(day, None)
+                if reader is not None:
+                    reader.close()
+                for suffix in ('.bin', '.idx'):
+                    try:
+                        os.remove(self._base_path(day) + suffix)
+                    except FileNotFoundError:
+                        pass
+                logging.info("Pruned thermal archive segment %s", day)
+
+    def summary(self):
+        """Frame counts and disk usage per segment"""
+        segments = []
+        total_frames = 0
+        total_bytes = 0
+        for day in self.segments():
+            base = self._base_path(day)
+            frames = os.path.getsize(base + '.idx') // INDEX_ENTRY.size
+            size = os.path.getsize(base + '.bin') + os.path.getsize(base + '.idx')
+            segments.append({'day': day, 'frames': frames, 'bytes': size})
+            total_frames += frames
+            total_bytes += size
+        return {
+            'frames': total_frames,
+            'bytes': total_bytes,
+            'bytes_per_frame': round(total_bytes / total_frames, 1) if total_frames else None,
+            'raw_bytes_per_frame': FRAME_PIXELS * 4,
+            'keyframe_interval': self.keyframe_interval,
+            'retention_days': self.retention_days,
+            'segments': segments,
+        }
+
+    def close(self):
+        with self._lock:
+            self._close_writer()
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
@@ -0,0 +1,127 @@
+"""
+Thermal frame rendering for the dashboard.
+
+Frames are upscaled with vectorized bilinear interpolation, mapped through
+a precomputed 256-entry colormap lookup table and encoded as PNG with
+zlib, all in NumPy. FrameCache keeps the encoded bytes per frame sequence
+number so any number of viewers cost a single render per new frame.
+
+Requires NumPy.
+"""
+
+import struct
+import threading
+import zlib
+
+# Ironbow-style anchors (position 0..1, RGB) as used by most thermal viewers
+COLORMAP_ANCHORS = [
+    (0.00, (0, 0, 10)),
+    (0.15, (40, 0, 110)),
+    (0.35, (150, 0, 150)),
+    (0.55, (225, 60, 40)),
+    (0.75, (250, 150, 0)),
+    (0.90, (255, 220, 60)),
+    (1.00, (255, 255, 240)),
+]
+
+_lut = None
+
+
+def colormap_lut():
+    """256 x 3 uint8 lookup table built once from COLORMAP_ANCHORS"""
+    global _lut
+    if _lut is None:
+        import numpy as np
+        positions = [p for p, _ in COLORMAP_ANCHORS]
+        steps = np.linspace(0.0, 1.0, 256)
+        _lut = np.stack([
+            np.interp(steps, positions, [color[channel] for _, color in COLORMAP_ANCHORS])
+            for channel in range(3)
+        ], axis=1).round().astype(np.uint8)
+    return _lut
+
+
+def upscale(frame, scale):
+    """Bilinear upscale of a 2-D array by an integer factor"""
+    import numpy as np
+    if scale <= 1:
+        return frame
+    rows, cols = frame.shape
+    y = np.clip((np.arange(rows * scale) + 0.5) / scale - 0.5, 0, rows - 1)
+    x = np.clip((np.arange(cols * scale) + 0.5) / scale - 0.5, 0, cols - 1)
+    y0 = np.floor(y).astype(np.intp)
+    x0 = np.floor(x).astype(np.intp)
+    y1 = np.minimum(y0 + 1, rows - 1)
+    x1 = np.minimum(x0 + 1, cols - 1)
+    wy = (y - y0)[:, None]
+    wx = (x - x0)[None, :]
+    top = frame[y0][:, x0] * (1 - wx) + frame[y0][:, x1] * wx
+    bottom = frame[y1][:, x0] * (1 - wx) + frame[y1][:, x1] * wx
+    return top * (1 - wy) + bottom * wy
+
+
+def colorize(frame, vmin=None, vmax=None):
+    """Map a 2-D temperature array to an (H, W, 3) uint8 RGB image"""
+    import numpy as np
+    if vmin is None:
+        vmin = float(frame.min())
+    if vmax is None:
+        vmax = float(frame.max())
+    span = vmax - vmin if vmax > vmin else 1.0
+    indices = np.clip((frame - vmin) * (255.0 / span), 0, 255).astype(np.uint8)
+    return colormap_lut()[indices]
+
+
+def _png_chunk(kind, data):
+    body = kind + data
+    return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xFFFFFFFF)
+
+
+def encode_png(rgb, compress_level=6):
+    """Encode an (H, W, 3) uint8 array as an 8-bit RGB PNG"""
+    import numpy as np
+    height, width, _ = rgb.shape
+    # Each scanline is prefixed with filter type 0 (None)
+    scanlines = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rgb.reshape(height, width * 3)
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n'
+            + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), compress_level))
+            + _png_chunk(b'IEND', b''))
+
+
+def render_png(frame, scale=10, vmin=None, vmax=None):
+    """Render a flat or 2-D thermal frame as a heatmap PNG"""
+    import numpy as np
+    array = np.asarray(frame, dtype=np.float32)
+    if array.ndim == 1:
+        array = array.reshape(24, 32)
+    return encode_png(colorize(upscale(array, scale), vmin, vmax))
+
+
+def encode_frame_bin(frame):
+    """Raw little-endian float32 pixels, row-major 24 x 32"""
+    import numpy as np
+    return np.asarray(frame, dtype='<f4').tobytes()
+
+
+class FrameCache:
+    """Rendered outputs for the most recent frame, keyed by render options"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = None
+        self._entries = {}
+
+    def get(self, seq, key, render):
+        """Return the cached bytes for (seq, key), rendering them on a miss"""
+        with self._lock:
+            if seq != self._seq:
+                self._seq = seq
+                self._entries = {}
+            cached = self._entries.get(key)
+            if cached is None:
+                cached = render()
+                self._entries[key] = cached
+            return cached